@@ -0,0 +1,206 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from extension import db
+from auth import signing_secret
+from models import QueuePlace, WaitingRoom
+
+TOKEN_HEADER = 'X-Queue-Token'
+
+_gated_events = set()
+_gated_loaded_at = 0.0
+_gated_lock = threading.Lock()
+
+
+def _secret():
+    return signing_secret('ADMISSION_SECRET').encode()
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _timestamp(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def admission_window():
+    """Seconds a token stays valid once its admission time arrives."""
+    return int(os.environ.get('ADMISSION_WINDOW_SECONDS', 600))
+
+
+def sign_token(event_id, user_id, sequence, admit_at, expires_at):
+    payload = f"{event_id}:{user_id}:{sequence}:{int(admit_at)}:{int(expires_at)}".encode()
+    signature = hmac.new(_secret(), payload, hashlib.sha256).digest()
+    return f"{_b64encode(payload)}.{_b64encode(signature)}"
+
+
+def verify_token(token, event_id, user_id, now=None):
+    """
+    Check a queue token without touching the database.
+    
+    Returns:
+        tuple: (is_valid: bool, error: str or None, retry_after: int or None)
+    """
+    try:
+        encoded_payload, encoded_signature = token.split('.')
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+    except (ValueError, AttributeError):
+        return False, 'Invalid queue token', None
+    
+    expected = hmac.new(_secret(), payload, hashlib.sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        return False, 'Invalid queue token', None
+    
+    try:
+        token_event_id, token_user_id, _, admit_at, expires_at = payload.decode().split(':')
+        admit_at, expires_at = int(admit_at), int(expires_at)
+    except ValueError:
+        return False, 'Invalid queue token', None
+    
+    if token_event_id != event_id or token_user_id != user_id:
+        return False, 'Queue token is for another event or user', None
+    
+    now = now if now is not None else time.time()
+    if now < admit_at:
+        return False, 'Not admitted yet', max(1, int(admit_at - now))
+    if now >= expires_at:
+        return False, 'Queue token expired. Please rejoin the queue', None
+    return True, None, None
+
+
+def _place_token(place):
+    return sign_token(place.event_id, place.user_id, place.sequence,
+                      _timestamp(place.admit_at), _timestamp(place.expires_at))
+
+
+def issue_token(room, user_id):
+    """
+    Give `user_id` a place in the event's queue and a token admitting them
+    at opens_at + place / admit_rate. The caller commits.
+    
+    A user holds one place per event: while it is still valid, joining
+    again returns the same place and token, so looping on the queue
+    endpoint can neither hold several places nor push later buyers back.
+    Once it has expired the user goes to the back of the queue. New places
+    are taken with one UPDATE ... RETURNING.
+    
+    Returns:
+        tuple: (token, place, admit_at timestamp, whether the place is new)
+    """
+    place = QueuePlace.query.filter_by(event_id=room.event_id, user_id=user_id).populate_existing().first()
+    if place and _timestamp(place.expires_at) > time.time():
+        return _place_token(place), place.sequence, _timestamp(place.admit_at), False
+    
+    sequence = db.session.execute(
+        update(WaitingRoom)
+        .where(WaitingRoom.event_id == room.event_id)
+        .values(issued=WaitingRoom.issued + 1)
+        .returning(WaitingRoom.issued)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+    
+    admit_at = max(_timestamp(room.opens_at) + (sequence - 1) / room.admit_rate, time.time())
+    values = {
+        'sequence': sequence,
+        'admit_at': datetime.fromtimestamp(int(admit_at), timezone.utc),
+        'expires_at': datetime.fromtimestamp(int(admit_at + admission_window()), timezone.utc)
+    }
+    if place:
+        for name, value in values.items():
+            setattr(place, name, value)
+        db.session.flush()
+    else:
+        place = QueuePlace(event_id=room.event_id, user_id=user_id, **values)
+        try:
+            with db.session.begin_nested():
+                db.session.add(place)
+        except IntegrityError:
+            # A concurrent join by the same user got there first; hand back its place
+            place = QueuePlace.query.filter_by(event_id=room.event_id, user_id=user_id).populate_existing().one()
+            return _place_token(place), place.sequence, _timestamp(place.admit_at), False
+    return _place_token(place), place.sequence, _timestamp(place.admit_at), True
+
+
+def queue_stats(room, now=None):
+    """Queue depth and admission progress, derived from the schedule alone."""
+    now = now if now is not None else time.time()
+    elapsed = now - _timestamp(room.opens_at)
+    admitted = min(room.issued, int(elapsed * room.admit_rate) + 1) if elapsed >= 0 else 0
+    return {
+        'event_id': room.event_id,
+        'is_active': room.is_active,
+        'admit_rate': room.admit_rate,
+        'issued': room.issued,
+        'admitted': admitted,
+        'queue_depth': room.issued - admitted,
+        'estimated_wait_seconds': round((room.issued - admitted) / room.admit_rate, 1)
+    }
+
+
+def gated_event_ids():
+    """Events behind an active waiting room, refreshed at most every
+    ADMISSION_REFRESH_SECONDS per process so the gate adds no per-request reads."""
+    global _gated_events, _gated_loaded_at
+    refresh = float(os.environ.get('ADMISSION_REFRESH_SECONDS', 5))
+    if time.monotonic() - _gated_loaded_at < refresh:
+        return _gated_events
+    with _gated_lock:
+        if time.monotonic() - _gated_loaded_at >= refresh:
+            rows = db.session.query(WaitingRoom.event_id).filter(WaitingRoom.is_active.is_(True)).all()
+            _gated_events = {row.event_id for row in rows}
+            _gated_loaded_at = time.monotonic()
+    return _gated_events
+
+
+def invalidate_gated_events():
+    global _gated_loaded_at
+    _gated_loaded_at = 0.0
+
+
+def admission_required(f):
+    """
+    Decorator for purchase routes taking an `event_id`. For events behind an
+    active waiting room it requires a valid queue token in X-Queue-Token
+    whose admission time has arrived; everything else passes straight through.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        event_id = kwargs.get('event_id')
+        if event_id not in gated_event_ids():
+            return f(*args, **kwargs)
+        
+        verify_jwt_in_request()
+        token = request.headers.get(TOKEN_HEADER)
+        if not token:
+            return jsonify({
+                'error': 'This sale uses a waiting room. Join the queue first',
+                'queue': f'/api/events/{event_id}/queue'
+            }), 403
+        
+        is_valid, error, retry_after = verify_token(token, event_id, get_jwt_identity())
+        if not is_valid:
+            response = jsonify({'error': error})
+            if retry_after:
+                response.headers['Retry-After'] = str(retry_after)
+                return response, 429
+            return response, 403
+        
+        return f(*args, **kwargs)
+    return decorated_function
@@ -2,31 +2,67 @@ from flask import Flask, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timedelta, timezone
-from extension import db, jwt, migrate
-from auth import auth_bp
+from datetime import timedelta
+from extension import db, jwt, init_migrate
+from db_pool import engine_options, lift_statement_timeout
+from db_routing import init_replica
+from json_provider import init_json
+from metrics import init_metrics
+from sql_profiler import init_sql_profiler
+from auth import auth_bp, signing_secret
 from events import events_bp
 from payments import payments_bp
 from club_payments import club_bp
 from debug_events import debug_bp
+from health import health_bp
 from models import User, UserRole
-from flask_migrate import upgrade
+import click
 
 
 load_dotenv()
 
+# Arbitrary application-wide key for pg_advisory_lock around migrations
+MIGRATION_LOCK_KEY = 7312849023
+
+
+def run_migrations(app):
+    """
+    Upgrade the database to the latest revision. On PostgreSQL the upgrade
+    runs under a session advisory lock, so concurrent callers wait for the
+    first one instead of racing it and then find nothing left to do.
+    """
+    from flask_migrate import upgrade
+    with app.app_context():
+        if db.engine.dialect.name != 'postgresql':
+            upgrade()
+            return
+        with db.engine.connect() as connection:
+            # Waiting for another instance's migrations is not a runaway query
+            lift_statement_timeout(connection)
+            connection.execute(db.text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+            try:
+                upgrade()
+            finally:
+                connection.execute(db.text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                connection.commit()
+
 
 
 def create_app():
     app = Flask(__name__)
+    init_json(app)
     
     
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
     jwt_secret = os.getenv("JWT_SECRET_KEY")
     if not jwt_secret:
         raise ValueError("JWT_SECRET_KEY environment variable is required")
     app.config["JWT_SECRET_KEY"] = jwt_secret
+    # Fail at startup rather than on the first queue token or ticket code
+    signing_secret("ADMISSION_SECRET")
+    signing_secret("TICKET_CODE_SECRET")
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
     app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=7)
     app.config["JWT_TOKEN_LOCATION"] = ["cookies"]
@@ -39,20 +75,37 @@ def create_app():
     app.config["JWT_SESSION_COOKIE"] = False
     
     
+    init_replica(app)
     db.init_app(app)
     jwt.init_app(app)
-    migrate.init_app(app, db)
-    with app.app_context():
-        upgrade()
+    
+    # Workers skip migrations (the Procfile runs `flask upgrade-db` once
+    # before starting gunicorn); Alembic is only loaded for the CLI or when
+    # MIGRATE_ON_STARTUP asks for the old behaviour
+    migrate_on_startup = os.getenv("MIGRATE_ON_STARTUP", "").lower() in ("1", "true", "yes")
+    if migrate_on_startup or os.getenv("FLASK_RUN_FROM_CLI"):
+        init_migrate(app)
+    if migrate_on_startup:
+        run_migrations(app)
+    
+    @app.cli.command("upgrade-db")
+    def upgrade_db_command():
+        """Apply pending migrations under an advisory lock."""
+        run_migrations(app)
+        click.echo("Database is up to date")
     
     
 
 
+    init_metrics(app)
+    init_sql_profiler(app)
+    
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(events_bp, url_prefix='/api/events')
     app.register_blueprint(payments_bp, url_prefix='/api/payments')
     app.register_blueprint(club_bp, url_prefix='/api')
     app.register_blueprint(debug_bp, url_prefix='/api/debug')
+    app.register_blueprint(health_bp, url_prefix='/api/health')
     
     CORS(app, 
      supports_credentials=True,
@@ -105,15 +158,6 @@ def create_app():
             }
         })
     
-    @app.route("/api/health")
-    def health_check():
-        try:
-            
-            db.session.execute(db.text('SELECT 1'))
-            return jsonify({"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()})
-        except Exception as e:
-            return jsonify({"status": "unhealthy", "error": "Database connection failed"}), 503
-    
     return app
 
 if __name__ == "__main__":
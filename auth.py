@@ -6,12 +6,35 @@ from flask_jwt_extended import (
     unset_jwt_cookies
 )
 from functools import wraps
+import hashlib
+import hmac
+import os
 from datetime import datetime
 from utils import validate_email, validate_password, validate_username, validate_json_input
-import requests
+from club_codes import resolve_club_code, invalidate_club_codes
+from db_routing import read_only
+from extension import db
+from debug_events import NON_PRODUCTION_ENVS
 
 auth_bp = Blueprint('auth', __name__)
 
+INTERNAL_TOKEN_HEADER = 'X-Health-Token'
+
+def signing_secret(name):
+    """
+    Value of the secret environment variable `name`. Outside development and
+    testing it is required: signing with JWT_SECRET_KEY would let anyone who
+    learns one secret forge everything the other signs. Local runs without it
+    get a key derived from, but never equal to, JWT_SECRET_KEY.
+    """
+    secret = os.environ.get(name)
+    if secret:
+        return secret
+    if os.environ.get('FLASK_ENV', '').lower() not in NON_PRODUCTION_ENVS:
+        raise ValueError(f"{name} environment variable is required")
+    jwt_secret = os.environ.get('JWT_SECRET_KEY', '')
+    return hmac.new(jwt_secret.encode(), name.encode(), hashlib.sha256).hexdigest()
+
 def role_required(*allowed_roles):
     def decorator(f):
         @wraps(f)
@@ -30,6 +53,26 @@ def role_required(*allowed_roles):
         return decorated_function
     return decorator
 
+def _internal_token_valid():
+    expected = os.environ.get('HEALTH_DETAILS_TOKEN')
+    supplied = request.headers.get(INTERNAL_TOKEN_HEADER)
+    if not expected or not supplied:
+        return False
+    return hmac.compare_digest(supplied.encode(), expected.encode())
+
+def internal_access_required(f):
+    """Guard for diagnostics (health details, metrics, SQL profile, upstream
+    status): monitoring presents HEALTH_DETAILS_TOKEN in the X-Health-Token
+    header; anyone else needs an admin session."""
+    admin_only = role_required(UserRole.ADMIN)(f)
+    
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if _internal_token_valid():
+            return f(*args, **kwargs)
+        return admin_only(*args, **kwargs)
+    return decorated_function
+
 @auth_bp.post('/signup')
 @validate_json_input(['username', 'email', 'password', 'role'])
 def register_user():
@@ -71,7 +114,7 @@ def register_user():
         new_user.club_name = data.get('club_name')
     
     if role == UserRole.USER and data.get('club_access_code'):
-        leader = User.get_leader_by_club_code(data.get('club_access_code'))
+        leader = resolve_club_code(data.get('club_access_code'))
         if not leader or not leader.is_subscription_active():
             return jsonify({'error': 'Invalid or inactive club access code'}), 400
         new_user.leader_id = leader.id
@@ -156,6 +199,7 @@ def refresh():
     return response, 200
 
 @auth_bp.get('/profile')
+@read_only
 @jwt_required()
 def get_profile():
     current_user_id = get_jwt_identity()
@@ -180,8 +224,10 @@ def subscribe_leader():
     
     try:
         user.activate_subscription()
+        invalidate_club_codes()
         user.save()
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Failed to activate subscription'}), 500
     
     return jsonify({
@@ -259,6 +305,7 @@ def google_auth():
         import base64
         import json
         import time
+        import requests
         
         try:
             parts = id_token.split('.')
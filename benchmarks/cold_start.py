@@ -0,0 +1,121 @@
+"""
+Cold-start benchmark for a web worker.
+
+Each sample is a fresh interpreter that imports the app, calls create_app()
+and serves one request to /api/health, which is what a gunicorn worker does
+after a boot or restart. The script reports that time per mode:
+
+    skip      - the default: no migration work in the worker
+    migrate   - MIGRATE_ON_STARTUP=1, the old per-worker upgrade()
+
+It also reports whether requests and alembic were imported along the way.
+
+    python benchmarks/cold_start.py --runs 10
+    python benchmarks/cold_start.py --database-url postgresql://localhost/eventhub --runs 20
+
+The database must already be migrated (run `flask upgrade-db` first) so the
+migrate mode measures the per-worker check, not a real upgrade.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+WORKER = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/api/health')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'total_ms': (served - start) * 1000,
+    'status': response.status_code,
+    'requests_loaded': 'requests' in sys.modules,
+    'alembic_loaded': 'alembic' in sys.modules
+}))
+"""
+
+
+SETUP = """
+from app import create_app
+from extension import db
+from flask_migrate import stamp
+app = create_app()
+with app.app_context():
+    db.create_all()
+    stamp()
+print('{}')
+"""
+
+
+def run_worker(env, script=WORKER):
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples, key):
+    values = [sample[key] for sample in samples]
+    return {
+        'median': round(statistics.median(values), 1),
+        'min': round(min(values), 1),
+        'max': round(max(values), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Migrated database to boot against (default: a temporary SQLite file)')
+    parser.add_argument('--runs', type=int, default=10, help='Cold starts per mode')
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if not database_url:
+        database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'cold_start.db')}"
+
+    base_env = dict(os.environ)
+    base_env.setdefault('JWT_SECRET_KEY', 'cold-start-benchmark-secret-0123456789')
+    base_env.setdefault('ADMISSION_SECRET', 'cold-start-benchmark-admission')
+    base_env.setdefault('TICKET_CODE_SECRET', 'cold-start-benchmark-ticket-codes')
+    base_env['DATABASE_URL'] = database_url
+    base_env.pop('FLASK_RUN_FROM_CLI', None)
+
+    if not args.database_url:
+        # Build the schema for the throwaway database and mark it as current
+        run_worker(dict(base_env, FLASK_RUN_FROM_CLI='true'), script=SETUP)
+
+    report = {'database_url': database_url.split('@')[-1], 'runs': args.runs, 'modes': {}}
+    for mode, flag in (('skip', ''), ('migrate', '1')):
+        env = dict(base_env, MIGRATE_ON_STARTUP=flag)
+        samples = [run_worker(env) for _ in range(args.runs)]
+        report['modes'][mode] = {
+            'total_ms': summarize(samples, 'total_ms'),
+            'import_ms': summarize(samples, 'import_ms'),
+            'create_app_ms': summarize(samples, 'create_app_ms'),
+            'first_request_ms': summarize(samples, 'first_request_ms'),
+            'requests_loaded': any(sample['requests_loaded'] for sample in samples),
+            'alembic_loaded': any(sample['alembic_loaded'] for sample in samples),
+            'failed_health_checks': sum(1 for sample in samples if sample['status'] != 200)
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Concurrency stress test for ticket seat allocation.
+
+Many threads call purchase_ticket for the same small-capacity event at once
+(and each buyer retries, to exercise the duplicate-ticket guard), then the
+script checks that no more tickets exist than seats and that
+Event.seats_taken matches the tickets actually holding seats. Exits non-zero
+on any oversell.
+
+    python benchmarks/oversell_stress.py --buyers 500 --capacity 50 --threads 64
+    python benchmarks/oversell_stress.py --database-url postgresql://localhost/eventhub_stress
+
+Use a throwaway database: all tables are dropped and recreated.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from flask_jwt_extended import create_access_token
+from werkzeug.security import generate_password_hash
+
+from extension import db, jwt
+from events import events_bp
+from models import User, UserRole, Event, EventStatus, Ticket, PaymentStatus
+
+
+def build_app(database_url):
+    os.environ.setdefault('CLUB_CODE_SECRET', 'oversell-stress-club-codes')
+    os.environ.setdefault('ADMISSION_SECRET', 'oversell-stress-admission')
+    os.environ.setdefault('TICKET_CODE_SECRET', 'oversell-stress-ticket-codes')
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=database_url,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 64, 'max_overflow': 64} if not database_url.startswith('sqlite')
+        else {'connect_args': {'timeout': 60, 'check_same_thread': False}},
+        JWT_SECRET_KEY='oversell-stress-secret-key-0123456789',
+        JWT_TOKEN_LOCATION=['cookies'],
+        JWT_ACCESS_COOKIE_NAME='access_token',
+        JWT_COOKIE_CSRF_PROTECT=False
+    )
+    db.init_app(app)
+    jwt.init_app(app)
+    app.register_blueprint(events_bp, url_prefix='/api/events')
+    return app
+
+
+def seed(app, buyers, capacity):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        password = generate_password_hash('StressTest123')
+        leader = User(username='stress_leader', email='leader@stress.test', password=password,
+                      role=UserRole.LEADER, club_name='Stress Club')
+        leader.activate_subscription()
+        db.session.add(leader)
+        db.session.flush()
+        
+        event = Event(title='Stress event', event_date=datetime.now(timezone.utc) + timedelta(days=30),
+                      ticket_price=100, max_attendees=capacity, leader_id=leader.id,
+                      status=EventStatus.APPROVED)
+        db.session.add(event)
+        
+        users = [User(username=f'stress{i}', email=f'stress{i}@stress.test', password=password,
+                      role=UserRole.USER, leader_id=leader.id) for i in range(buyers)]
+        db.session.add_all(users)
+        db.session.commit()
+        
+        tokens = [create_access_token(identity=user.id) for user in users]
+        return event.id, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prove purchase_ticket never oversells')
+    parser.add_argument('--database-url', default=None, help='Defaults to a temporary SQLite file')
+    parser.add_argument('--buyers', type=int, default=300)
+    parser.add_argument('--capacity', type=int, default=25)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=2, help='Purchase attempts per buyer')
+    args = parser.parse_args()
+    
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'stress.db')}"
+    app = build_app(database_url)
+    event_id, tokens = seed(app, args.buyers, args.capacity)
+    
+    barrier = threading.Barrier(min(args.threads, len(tokens) * args.attempts))
+    
+    def buy(token):
+        client = app.test_client()
+        client.set_cookie('access_token', token)
+        try:
+            barrier.wait(timeout=5)
+        except threading.BrokenBarrierError:
+            pass
+        response = client.post(f'/api/events/{event_id}/purchase-ticket', json={'phone_number': '254700000000'})
+        return response.status_code, (response.get_json() or {}).get('error')
+    
+    outcomes = Counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        for status, error in executor.map(buy, tokens * args.attempts):
+            outcomes[f'{status} {error or "created"}'] += 1
+    
+    with app.app_context():
+        seat_tickets = Ticket.query.filter(
+            Ticket.event_id == event_id,
+            Ticket.payment_status.in_([PaymentStatus.PENDING, PaymentStatus.COMPLETED])
+        ).count()
+        per_user = db.session.query(Ticket.user_id, db.func.count(Ticket.id)).filter(
+            Ticket.event_id == event_id
+        ).group_by(Ticket.user_id).having(db.func.count(Ticket.id) > 1).count()
+        seats_taken = db.session.get(Event, event_id).seats_taken
+    
+    result = {
+        'database': database_url.split('://')[0],
+        'buyers': args.buyers,
+        'attempts': args.buyers * args.attempts,
+        'capacity': args.capacity,
+        'tickets_holding_seats': seat_tickets,
+        'seats_taken_counter': seats_taken,
+        'users_with_duplicate_tickets': per_user,
+        'outcomes': dict(outcomes)
+    }
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    
+    oversold = seat_tickets > args.capacity or seats_taken != seat_tickets or per_user
+    sys.exit(1 if oversold else 0)
+
+
+if __name__ == '__main__':
+    main()
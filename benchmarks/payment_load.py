@@ -0,0 +1,155 @@
+"""
+End-to-end load harness for the ticket payment flow.
+
+Drives purchase -> initiate -> callback against a running API whose
+MPESA_BASE_URL points at mpesa_simulator.py and whose MPESA_CALLBACK_URL
+points back at the API. Each buyer is a fresh club member; the callback
+stage is measured from the initiate response until the ticket status
+leaves PENDING.
+
+    python mpesa_simulator.py --port 8090 --callback-delay-ms 300 &
+    MPESA_BASE_URL=http://localhost:8090 \
+    MPESA_CALLBACK_URL=http://localhost:8000/api/payments/callback python app.py &
+    python benchmarks/payment_load.py --api http://localhost:8000 --buyers 200 --concurrency 20
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import requests
+
+PASSWORD = 'LoadTest123'
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples, elapsed):
+    return {
+        'count': len(samples),
+        'throughput_per_s': round(len(samples) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(samples, 50) * 1000, 2) if samples else None,
+        'p99_ms': round(percentile(samples, 99) * 1000, 2) if samples else None,
+        'mean_ms': round(statistics.mean(samples) * 1000, 2) if samples else None
+    }
+
+
+class Client:
+    """requests session that carries the JWT cookies over plain HTTP.
+    The API marks its cookies Secure, so they are replayed by hand."""
+
+    def __init__(self, api):
+        self.api = api.rstrip('/')
+        self.session = requests.Session()
+
+    def call(self, method, path, **kwargs):
+        response = self.session.request(method, f"{self.api}{path}", timeout=60, **kwargs)
+        cookies = {c.name: c.value for c in response.cookies}
+        if 'access_token' in cookies:
+            self.session.headers['Cookie'] = f"access_token={cookies['access_token']}"
+        return response
+
+    def signup_and_login(self, role, **extra):
+        username = f"lt{uuid4().hex[:12]}"
+        body = {'username': username, 'email': f'{username}@load.test', 'password': PASSWORD, 'role': role}
+        body.update(extra)
+        response = self.call('POST', '/api/auth/signup', json=body)
+        response.raise_for_status()
+        self.call('POST', '/api/auth/login', json={'username': username, 'password': PASSWORD}).raise_for_status()
+        return username
+
+
+def setup_event(api):
+    leader = Client(api)
+    leader.signup_and_login('leader', club_name='Load Test Club')
+    club_code = leader.call('POST', '/api/auth/subscribe').json()['club_access_code']
+    response = leader.call('POST', '/api/events/create', json={
+        'title': 'Load test event',
+        'event_date': '2099-01-01T18:00:00Z',
+        'ticket_price': 10
+    })
+    response.raise_for_status()
+    event_id = response.json()['event']['id']
+    leader.call('POST', f'/api/debug/approve-event/{event_id}').raise_for_status()
+    return club_code, event_id
+
+
+def run_buyer(api, club_code, event_id, phone, poll_interval, callback_timeout):
+    timings = {}
+    client = Client(api)
+    client.signup_and_login('user', club_access_code=club_code)
+    
+    start = time.perf_counter()
+    response = client.call('POST', f'/api/events/{event_id}/purchase-ticket', json={'phone_number': phone})
+    timings['purchase'] = time.perf_counter() - start
+    if response.status_code != 201:
+        return timings, f'purchase:{response.status_code}'
+    ticket_id = response.json()['ticket']['id']
+    
+    start = time.perf_counter()
+    response = client.call('POST', f'/api/payments/initiate/{ticket_id}')
+    timings['initiate'] = time.perf_counter() - start
+    if response.status_code != 200:
+        return timings, f'initiate:{response.status_code}'
+    
+    start = time.perf_counter()
+    while time.perf_counter() - start < callback_timeout:
+        status = client.call('GET', f'/api/payments/status/{ticket_id}').json().get('status')
+        if status != 'pending':
+            timings['callback'] = time.perf_counter() - start
+            return timings, None
+        time.sleep(poll_interval)
+    return timings, 'callback:timeout'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test purchase -> initiate -> callback')
+    parser.add_argument('--api', default='http://localhost:8000')
+    parser.add_argument('--buyers', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--phone', default='254708374149')
+    parser.add_argument('--poll-interval', type=float, default=0.1)
+    parser.add_argument('--callback-timeout', type=float, default=60)
+    args = parser.parse_args()
+    
+    club_code, event_id = setup_event(args.api)
+    
+    stages = {'purchase': [], 'initiate': [], 'callback': []}
+    errors = {}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [
+            executor.submit(run_buyer, args.api, club_code, event_id, args.phone,
+                            args.poll_interval, args.callback_timeout)
+            for _ in range(args.buyers)
+        ]
+        for future in futures:
+            timings, error = future.result()
+            for stage, seconds in timings.items():
+                stages[stage].append(seconds)
+            if error:
+                errors[error] = errors.get(error, 0) + 1
+    elapsed = time.perf_counter() - started
+    
+    json.dump({
+        'buyers': args.buyers,
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'stages': {stage: summarize(samples, elapsed) for stage, samples in stages.items()},
+        'errors': errors
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
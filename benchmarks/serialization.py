@@ -0,0 +1,173 @@
+"""
+CPU cost of building and encoding listing responses.
+
+Renders the same pages four ways and reports the CPU time per response:
+
+    orm_stdlib   - ORM instances, to_dict() and Flask's stdlib json (the old path)
+    orm_orjson   - ORM instances and to_dict(), encoded with orjson
+    rows_stdlib  - column tuples from listings.py, stdlib json
+    rows_orjson  - column tuples from listings.py, orjson (the default now)
+
+for a page of the public event listing and for one event's ticket list.
+The dataset is loaded into a throwaway SQLite file (or --database-url) with
+the synthetic data generator.
+
+    python benchmarks/serialization.py
+    python benchmarks/serialization.py --per-page 50 --tickets-per-event 2000 --iterations 200
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_ROOT)
+
+
+def orm_event_page(per_page):
+    """The listing as built before the row path: ORM pages, preloaded tiers and counts, to_dict()."""
+    from sqlalchemy import func
+    from sqlalchemy.orm import joinedload
+    from extension import db
+    from models import Event, EventStatus, Ticket, TicketTier
+
+    paginated = Event.query.filter_by(status=EventStatus.APPROVED).options(joinedload(Event.leader)).order_by(
+        Event.event_date.desc()
+    ).paginate(page=1, per_page=per_page, error_out=False)
+    event_ids = [event.id for event in paginated.items]
+    tiers_by_event = {event_id: [] for event_id in event_ids}
+    for tier in TicketTier.query.filter(TicketTier.event_id.in_(event_ids)).order_by(
+        TicketTier.event_id, TicketTier.price
+    ):
+        tiers_by_event[tier.event_id].append(tier)
+    tickets_sold = dict.fromkeys(event_ids, 0)
+    tickets_sold.update(db.session.query(Ticket.event_id, func.count(Ticket.id)).filter(
+        Ticket.event_id.in_(event_ids)
+    ).group_by(Ticket.event_id).all())
+
+    events = []
+    for event in paginated.items:
+        event_dict = event.to_dict(tiers=tiers_by_event[event.id], tickets_sold=tickets_sold[event.id])
+        if event.leader and event.leader.club_access_code:
+            event_dict['club_access_code'] = event.leader.club_access_code
+        events.append(event_dict)
+    return {'events': events, 'total': paginated.total, 'page': paginated.page,
+            'per_page': paginated.per_page, 'pages': paginated.pages}
+
+
+def orm_event_tickets(event):
+    from sqlalchemy.orm import selectinload
+    from models import Ticket, PaymentStatus
+
+    tickets = Ticket.query.filter_by(event_id=event.id).options(selectinload(Ticket.user)).all()
+    completed = [ticket for ticket in tickets if ticket.payment_status == PaymentStatus.COMPLETED]
+    return {
+        'event_title': event.title,
+        'tickets': [ticket.to_dict() for ticket in tickets],
+        'total_tickets': len(tickets),
+        'total_revenue': sum(ticket.ticket_price for ticket in completed),
+        'total_commission': sum(ticket.commission for ticket in completed)
+    }
+
+
+def measure(app, provider, build, iterations):
+    """CPU and wall milliseconds per response, building in a fresh session each time."""
+    from extension import db
+
+    cpu = []
+    wall = []
+    size = 0
+    for _ in range(iterations):
+        with app.test_request_context():
+            db.session.remove()
+            started_cpu = time.process_time()
+            started = time.perf_counter()
+            body = provider.response(build()).get_data()
+            wall.append((time.perf_counter() - started) * 1000)
+            cpu.append((time.process_time() - started_cpu) * 1000)
+            size = len(body)
+    return {
+        'cpu_ms_median': round(statistics.median(cpu), 3),
+        'wall_ms_median': round(statistics.median(wall), 3),
+        'wall_ms_p95': round(sorted(wall)[int(0.95 * (len(wall) - 1))], 3),
+        'bytes': size
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Throwaway database (default: a temporary SQLite file)')
+    parser.add_argument('--events-per-leader', default='40')
+    parser.add_argument('--tickets-per-event', default='500')
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ.setdefault('JWT_SECRET_KEY', 'serialization-benchmark-secret-0123456789')
+    os.environ.setdefault('CLUB_CODE_SECRET', 'serialization-benchmark-club-codes')
+    os.environ.setdefault('ADMISSION_SECRET', 'serialization-benchmark-admission')
+    os.environ.setdefault('TICKET_CODE_SECRET', 'serialization-benchmark-ticket-codes')
+    os.environ.pop('SQL_PROFILE', None)
+
+    from sqlalchemy import func, select
+    from app import create_app
+    from extension import db
+    from json_provider import IsoJSONProvider, OrjsonProvider, orjson
+    from listings import event_listing, event_ticket_listing
+    from models import Event, EventStatus, Ticket
+    from synthetic_data import generate
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        counts = generate(leaders=5, users=5000, events_per_leader=args.events_per_leader,
+                          tickets_per_event=args.tickets_per_event, seed=args.seed, prefix='ser_')
+        busiest = db.session.execute(
+            select(Ticket.event_id).group_by(Ticket.event_id).order_by(func.count(Ticket.id).desc()).limit(1)
+        ).scalar()
+
+    providers = {'stdlib': IsoJSONProvider(app)}
+    if orjson is not None:
+        providers['orjson'] = OrjsonProvider(app)
+
+    def event_page_orm():
+        return orm_event_page(args.per_page)
+
+    def event_page_rows():
+        return event_listing([Event.status == EventStatus.APPROVED], 1, args.per_page)
+
+    def tickets_orm():
+        return orm_event_tickets(db.session.get(Event, busiest))
+
+    def tickets_rows():
+        return event_ticket_listing(db.session.get(Event, busiest))
+
+    workloads = {
+        'public_events_page': {'orm': event_page_orm, 'rows': event_page_rows},
+        'event_tickets': {'orm': tickets_orm, 'rows': tickets_rows},
+    }
+
+    report = {'dataset': counts, 'per_page': args.per_page, 'iterations': args.iterations, 'results': {}}
+    with app.app_context():
+        for workload, builders in workloads.items():
+            results = report['results'][workload] = {}
+            for path, build in builders.items():
+                for name, provider in providers.items():
+                    measure(app, provider, build, 5)
+                    results[f'{path}_{name}'] = measure(app, provider, build, args.iterations)
+            baseline = results['orm_stdlib']['cpu_ms_median']
+            for result in results.values():
+                result['cpu_vs_orm_stdlib'] = round(result['cpu_ms_median'] / baseline, 3) if baseline else None
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+"""
+Benchmark suite for the hot endpoints.
+
+Loads a synthetic dataset (leaders, users, approved events, tickets, club
+subscriptions) into a throwaway database with the same generator as
+`flask debug generate-data`, then drives each scenario through
+the Flask test client, first one request at a time and then from
+--concurrency threads. Prints one JSON document with throughput,
+p50/p95/p99 latency and SQL statements per request for every scenario, plus
+the git commit and dataset, so runs can be diffed between commits:
+
+    python benchmarks/suite.py --output before.json
+    git checkout my-branch
+    python benchmarks/suite.py --output after.json
+
+    python benchmarks/suite.py --database-url postgresql://localhost/eventhub_bench --users 50000
+
+Use a throwaway database: all tables are dropped and recreated. Results are
+only comparable for the same dataset flags and --seed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_ROOT)
+
+PASSWORD = 'BenchPass123'
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class QueryCounter:
+    """Counts SQL statements per thread, so a request's count is the delta
+    on the thread that served it."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self._local.count = getattr(self._local, 'count', 0) + 1
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+
+def build_app(database_url):
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('JWT_SECRET_KEY', 'benchmark-suite-secret-key-0123456789')
+    os.environ.setdefault('CLUB_CODE_SECRET', 'benchmark-suite-club-codes')
+    os.environ.setdefault('ADMISSION_SECRET', 'benchmark-suite-admission')
+    os.environ.setdefault('TICKET_CODE_SECRET', 'benchmark-suite-ticket-codes')
+    os.environ['MPESA_CALLBACK_MODE'] = 'sync'
+    os.environ.pop('MIGRATE_ON_STARTUP', None)
+    os.environ.pop('SQL_PROFILE', None)
+
+    from app import create_app
+    app = create_app()
+    # The test client talks plain HTTP
+    app.config['JWT_COOKIE_SECURE'] = False
+    return app
+
+
+def seed(app, args):
+    """Load the dataset with the synthetic data generator and return the ids
+    each scenario needs."""
+    from sqlalchemy import select
+    from extension import db
+    from models import User, UserRole, Event, Ticket, PaymentStatus
+    from synthetic_data import generate
+
+    rng = random.Random(args.seed)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        counts = generate(
+            leaders=args.leaders, users=args.users, events_per_leader=args.events_per_leader,
+            tickets_per_event=args.tickets_per_event, club_size_skew=args.club_size_skew,
+            subscription_rate=args.subscription_rate, seed=args.seed, prefix='bench_', password=PASSWORD
+        )
+
+        leaders = [{'id': row.id} for row in db.session.execute(select(User.id).where(User.role == UserRole.LEADER))]
+        users = [
+            {'id': row.id, 'username': row.username, 'leader_id': row.leader_id}
+            for row in db.session.execute(select(User.id, User.username, User.leader_id)
+                                          .where(User.role == UserRole.USER).order_by(User.username))
+        ]
+        events = [
+            {'id': row.id, 'leader_id': row.leader_id, 'seats_left': row.max_attendees - row.seats_taken}
+            for row in db.session.execute(select(Event.id, Event.leader_id, Event.max_attendees, Event.seats_taken)
+                                          .order_by(Event.id))
+        ]
+        pending = list(db.session.scalars(
+            select(Ticket.checkout_request_id).where(Ticket.payment_status == PaymentStatus.PENDING)
+            .order_by(Ticket.checkout_request_id)
+        ))
+        holders = set(db.session.execute(select(Ticket.event_id, Ticket.user_id)).tuples())
+
+    # Members buying into their club's events for the first time, within the seats left
+    users_by_leader = {}
+    for user in users:
+        users_by_leader.setdefault(user['leader_id'], []).append(user['id'])
+    purchases = []
+    wanted = args.requests * 2
+    for event in rng.sample(events, len(events)):
+        members = users_by_leader.get(event['leader_id'], [])
+        for user_id in rng.sample(members, min(len(members), 20, event['seats_left'])):
+            if (event['id'], user_id) not in holders:
+                purchases.append((event['id'], user_id))
+        if len(purchases) >= wanted:
+            break
+    rng.shuffle(purchases)
+
+    return {
+        'leaders': leaders,
+        'users': users,
+        'events': events,
+        'purchases': purchases,
+        'pending_checkouts': pending,
+        'counts': counts
+    }
+
+
+def build_scenarios(app, data, rng):
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        user_tokens = {}
+
+        def token_for(user_id):
+            if user_id not in user_tokens:
+                user_tokens[user_id] = create_access_token(identity=user_id)
+            return user_tokens[user_id]
+
+        for leader in data['leaders']:
+            token_for(leader['id'])
+        browse_users = [user['id'] for user in rng.sample(data['users'], min(200, len(data['users'])))]
+        for user_id in browse_users:
+            token_for(user_id)
+        for _, user_id in data['purchases']:
+            token_for(user_id)
+
+    pages = max(1, len(data['events']) // 10)
+    purchases = iter(data['purchases'])
+    checkouts = iter(data['pending_checkouts'])
+    lock = threading.Lock()
+
+    def login_as(client, user_id):
+        # The test client's cookie jar replaces any Cookie header passed in
+        client.set_cookie('access_token', user_tokens[user_id])
+
+    def public_events(client):
+        return client.get(f'/api/events/public?page={rng.randint(1, pages)}'), 200
+
+    def all_events(client):
+        login_as(client, rng.choice(browse_users))
+        return client.get(f'/api/events/all?page={rng.randint(1, pages)}'), 200
+
+    def login(client):
+        user = rng.choice(data['users'])
+        return client.post('/api/auth/login', json={'username': user['username'], 'password': PASSWORD}), 200
+
+    def purchase_ticket(client):
+        with lock:
+            event_id, user_id = next(purchases)
+        login_as(client, user_id)
+        return client.post(f'/api/events/{event_id}/purchase-ticket', json={'phone_number': '254700000000'}), 201
+
+    def mpesa_callback(client):
+        with lock:
+            checkout_request_id = next(checkouts)
+        payload = {'Body': {'stkCallback': {
+            'CheckoutRequestID': checkout_request_id, 'ResultCode': 0, 'ResultDesc': 'Success',
+            'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': f'R{checkout_request_id[-10:]}'}]}
+        }}}
+        return client.post('/api/payments/callback', json=payload), 200
+
+    def event_tickets(client):
+        event = rng.choice(data['events'])
+        login_as(client, event['leader_id'])
+        return client.get(f"/api/events/{event['id']}/tickets"), 200
+
+    return {
+        'get_public_events': public_events,
+        'get_all_events': all_events,
+        'login': login,
+        'purchase_ticket': purchase_ticket,
+        'mpesa_callback': mpesa_callback,
+        'get_event_tickets': event_tickets,
+    }
+
+
+def run_scenario(app, scenario, requests, concurrency, counter):
+    local = threading.local()
+
+    def one(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        queries_before = counter.count
+        start = time.perf_counter()
+        try:
+            response, expected = scenario(client)
+        except StopIteration:
+            return None
+        elapsed = time.perf_counter() - start
+        return elapsed, counter.count - queries_before, response.status_code == expected
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        results = [one(i) for i in range(requests)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - started
+
+    results = [result for result in results if result is not None]
+    latencies = [result[0] * 1000 for result in results]
+    queries = [result[1] for result in results]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for result in results if not result[2]),
+        'throughput_per_s': round(len(results) / wall, 1) if wall else None,
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+        'mean_ms': round(statistics.mean(latencies), 2) if latencies else None,
+        'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+        'max_queries': max(queries) if queries else None
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='Throwaway database (default: a temporary SQLite file)')
+    parser.add_argument('--leaders', type=int, default=20)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--club-size-skew', type=float, default=1.0)
+    parser.add_argument('--events-per-leader', default='5-15', help='N or MIN-MAX')
+    parser.add_argument('--tickets-per-event', default='20-80', help='N or MIN-MAX')
+    parser.add_argument('--subscription-rate', type=float, default=0.4)
+    parser.add_argument('--requests', type=int, default=300, help='Requests per scenario and mode')
+    parser.add_argument('--login-requests', type=int, default=30,
+                        help='Requests for the login scenario, which is bound by password hashing')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scenarios', help='Comma-separated subset of scenarios to run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    app = build_app(database_url)
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    counter = QueryCounter()
+    event.listen(Engine, 'before_cursor_execute', counter)
+
+    seed_started = time.perf_counter()
+    data = seed(app, args)
+    seed_seconds = time.perf_counter() - seed_started
+
+    scenarios = build_scenarios(app, data, random.Random(args.seed))
+    selected = args.scenarios.split(',') if args.scenarios else list(scenarios)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'database': database_url.split('://')[0],
+        'dataset': data['counts'],
+        'seed_seconds': round(seed_seconds, 2),
+        'config': {'requests': args.requests, 'login_requests': args.login_requests,
+                   'concurrency': args.concurrency, 'seed': args.seed},
+        'scenarios': {}
+    }
+    for name in selected:
+        requests = args.login_requests if name == 'login' else args.requests
+        report['scenarios'][name] = {
+            'sequential': run_scenario(app, scenarios[name], requests, 1, counter),
+            'concurrent': run_scenario(app, scenarios[name], requests, args.concurrency, counter)
+        }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Load test: concurrent payment initiations per gunicorn worker, by worker class.
+
+Starts mpesa_simulator.py with a fixed Daraja latency and, for each mode, one
+gunicorn worker (gunicorn.conf.py) on a throwaway SQLite database. It then
+fires --payments initiate requests at once from --concurrency client threads,
+one per pending ticket. The report gives throughput and latency, plus the
+most STK pushes the simulator saw in flight at the same time, which is how
+many payments the single worker kept waiting on Daraja concurrently.
+
+    python benchmarks/worker_modes.py
+    python benchmarks/worker_modes.py --modes sync,gevent --payments 300 --latency-ms 1000
+
+Needs gunicorn, and gevent for the gevent mode. Callbacks are delayed past
+the end of the run so only the initiate path is measured.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import requests
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPO_ROOT)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+
+def prepare_database(database_url, payments_per_mode, modes):
+    """Club members with one fresh PENDING ticket each, per mode, and their access tokens."""
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import insert, select
+    from app import create_app
+    from extension import db
+    from models import Event, Ticket, TicketTier, User, UserRole, PaymentStatus
+    from synthetic_data import generate
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        # Readers must not block the writers of other requests while they wait on Daraja
+        db.session.execute(db.text('PRAGMA journal_mode=WAL'))
+        generate(leaders=1, users=payments_per_mode * len(modes), events_per_leader='1', tickets_per_event='0',
+                 subscription_rate=0, vip_rate=0, seed=1, prefix='wm_')
+        event = db.session.execute(select(Event)).scalar_one()
+        event.max_attendees = None
+        tier = db.session.execute(select(TicketTier).where(TicketTier.event_id == event.id)).scalar_one()
+        members = list(db.session.scalars(select(User.id).where(User.role == UserRole.USER).order_by(User.id)))
+
+        batches = {}
+        now = datetime.now(timezone.utc)
+        for index, mode in enumerate(modes):
+            batch = []
+            rows = []
+            for user_id in members[index * payments_per_mode:(index + 1) * payments_per_mode]:
+                ticket_id = str(uuid4())
+                rows.append({
+                    'id': ticket_id, 'event_id': event.id, 'user_id': user_id, 'tier_id': tier.id,
+                    'ticket_price': tier.price, 'commission': Ticket.calculate_commission(tier.price),
+                    'total_amount': Ticket.calculate_total(tier.price), 'payment_status': PaymentStatus.PENDING,
+                    'payment_phone': '254700000000', 'purchased_at': now
+                })
+                batch.append((ticket_id, create_access_token(identity=user_id)))
+            db.session.execute(insert(Ticket), rows)
+            batches[mode] = batch
+        db.session.commit()
+    return batches
+
+
+def run_mode(mode, args, env, batch, simulator_url):
+    api_url = f'http://127.0.0.1:{args.api_port}'
+    worker_env = dict(env, GUNICORN_WORKER_CLASS=mode, PORT=str(args.api_port), WEB_CONCURRENCY='1',
+                      GUNICORN_WORKER_CONNECTIONS=str(args.worker_connections))
+    if mode == 'gthread':
+        # With threads set, gunicorn would run the sync worker as gthread too
+        worker_env['GUNICORN_THREADS'] = str(args.threads)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=REPO_ROOT, env=worker_env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        wait_for(f'{api_url}/api/health')
+        requests.post(f'{simulator_url}/simulator/reset-stats', timeout=5)
+
+        def initiate(item):
+            ticket_id, token = item
+            started = time.perf_counter()
+            try:
+                response = requests.post(f'{api_url}/api/payments/initiate/{ticket_id}',
+                                         headers={'Cookie': f'access_token={token}'}, timeout=300)
+                status = response.status_code
+            except requests.RequestException:
+                status = 'error'
+            return status, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(initiate, batch))
+        wall = time.perf_counter() - started
+        upstream = requests.get(f'{simulator_url}/simulator/stats', timeout=5).json()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = [elapsed * 1000 for status, elapsed in results if status == 200]
+    return {
+        'worker_class': mode,
+        'payments': len(results),
+        'succeeded': len(latencies),
+        'statuses': dict(Counter(str(status) for status, _ in results)),
+        'throughput_per_s': round(len(latencies) / wall, 2),
+        'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 1) if latencies else None,
+        'mean_ms': round(statistics.mean(latencies), 1) if latencies else None,
+        'max_in_flight_per_worker': upstream['max_in_flight']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='sync,gthread,gevent')
+    parser.add_argument('--payments', type=int, default=120, help='Payment initiations per mode')
+    parser.add_argument('--concurrency', type=int, default=120, help='Client threads')
+    parser.add_argument('--latency-ms', type=int, default=300, help='Simulated Daraja latency per call')
+    parser.add_argument('--threads', type=int, default=16, help='Threads per gthread worker')
+    parser.add_argument('--worker-connections', type=int, default=200, help='Greenlets per gevent worker')
+    parser.add_argument('--api-port', type=int, default=8031)
+    parser.add_argument('--simulator-port', type=int, default=8091)
+    args = parser.parse_args()
+    modes = args.modes.split(',')
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'worker_modes.db')}"
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        JWT_SECRET_KEY=os.environ.get('JWT_SECRET_KEY', 'worker-modes-benchmark-secret-0123456789'),
+        CLUB_CODE_SECRET=os.environ.get('CLUB_CODE_SECRET', 'worker-modes-benchmark-club-codes'),
+        ADMISSION_SECRET=os.environ.get('ADMISSION_SECRET', 'worker-modes-benchmark-admission'),
+        TICKET_CODE_SECRET=os.environ.get('TICKET_CODE_SECRET', 'worker-modes-benchmark-ticket-codes'),
+        MPESA_BASE_URL=f'http://127.0.0.1:{args.simulator_port}',
+        MPESA_CALLBACK_URL=f'http://127.0.0.1:{args.api_port}/api/payments/callback',
+        MPESA_CONSUMER_KEY='key', MPESA_CONSUMER_SECRET='secret', MPESA_SHORTCODE='174379', MPESA_PASSKEY='passkey',
+        MPESA_BULKHEAD_TIMEOUT='60'
+    )
+    for name in ('MIGRATE_ON_STARTUP', 'MPESA_MAX_CONCURRENT', 'GUNICORN_THREADS'):
+        env.pop(name, None)
+    os.environ.update(DATABASE_URL=database_url, JWT_SECRET_KEY=env['JWT_SECRET_KEY'],
+                      CLUB_CODE_SECRET=env['CLUB_CODE_SECRET'], ADMISSION_SECRET=env['ADMISSION_SECRET'],
+                      TICKET_CODE_SECRET=env['TICKET_CODE_SECRET'])
+    batches = prepare_database(database_url, args.payments, modes)
+
+    simulator_url = f'http://127.0.0.1:{args.simulator_port}'
+    simulator = subprocess.Popen(
+        [sys.executable, 'mpesa_simulator.py', '--port', str(args.simulator_port),
+         '--latency-ms', str(args.latency_ms), '--callback-delay-ms', '3600000'],
+        cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for(f'{simulator_url}/simulator/stats')
+        report = {
+            'config': {'payments': args.payments, 'concurrency': args.concurrency, 'latency_ms': args.latency_ms,
+                       'threads': args.threads, 'worker_connections': args.worker_connections, 'workers': 1},
+            'modes': [run_mode(mode, args, env, batches[mode], simulator_url) for mode in modes]
+        }
+    finally:
+        simulator.terminate()
+        simulator.wait(timeout=30)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import os
+import string
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import insert, update
+from extension import db
+from models import Ticket, Order, PaymentStatus, MpesaCallbackLog
+from club_models import ClubSubscription
+from reservations import recover_paid_tickets, transition_tickets
+from subscription_renewals import extend_subscriptions, fail_subscription_payments
+
+
+# Account references carry this many leading characters of the row's id
+REFERENCE_ID_LENGTH = 8
+
+# Rows a callback must leave alone: paid, or awaiting or given a refund
+SETTLED_STATUSES = (PaymentStatus.COMPLETED, PaymentStatus.NEEDS_REFUND, PaymentStatus.REFUNDED)
+
+
+def callback_mode():
+    """'sync' applies each callback inside the request; 'write_behind' only
+    logs it and leaves application to the `flask payments apply-callbacks` consumer."""
+    return os.environ.get('MPESA_CALLBACK_MODE', 'sync')
+
+
+def parse_stk_callback(data):
+    """
+    Extract the fields needed to settle a ticket, order or club subscription
+    from an STK callback body.
+    
+    Returns:
+        dict or None: None when the payload is malformed or cannot be matched
+        to anything
+    """
+    body = data.get('Body') if isinstance(data, dict) else None
+    callback_data = body.get('stkCallback') if isinstance(body, dict) else None
+    if not isinstance(callback_data, dict):
+        return None
+    checkout_request_id = callback_data.get('CheckoutRequestID')
+    account_reference = str(callback_data.get('AccountReference') or '')
+    
+    if not checkout_request_id and not account_reference.startswith(('TICKET', 'ORDER', 'SUB')):
+        return None
+    
+    # Without a ResultCode the outcome is unknown; it must not read as a failure
+    try:
+        result_code = int(callback_data['ResultCode'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    
+    receipt = None
+    metadata = callback_data.get('CallbackMetadata')
+    items = metadata.get('Item') if isinstance(metadata, dict) else None
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get('Name') == 'MpesaReceiptNumber':
+            receipt = item.get('Value')
+    
+    return {
+        'checkout_request_id': checkout_request_id,
+        'account_reference': account_reference,
+        'result_code': result_code,
+        'mpesa_receipt': receipt
+    }
+
+
+def enqueue_callback(callback, payload):
+    """Append a verified callback to the durable log with a single INSERT."""
+    try:
+        db.session.execute(insert(MpesaCallbackLog).values(payload=payload, **callback))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+
+def _reference_id(account_reference, prefix):
+    """The id prefix an account reference such as TICKET1a2b3c4d carries, or
+    None unless it is exactly REFERENCE_ID_LENGTH hex digits."""
+    if not account_reference.startswith(prefix):
+        return None
+    partial_id = account_reference[len(prefix):].lower()
+    if len(partial_id) != REFERENCE_ID_LENGTH or partial_id.strip(string.hexdigits):
+        return None
+    return partial_id
+
+
+def _match(model, prefix, callbacks):
+    """Resolve callbacks to (id, payment_status, callback) rows of `model` with
+    one query for CheckoutRequestIDs; only unmatched references carrying
+    `prefix` fall back to an id prefix lookup, which must find a single row."""
+    checkout_ids = [c['checkout_request_id'] for c in callbacks if c['checkout_request_id']]
+    by_checkout = {}
+    if checkout_ids:
+        rows = db.session.query(model.id, model.checkout_request_id, model.payment_status).filter(
+            model.checkout_request_id.in_(checkout_ids)
+        ).all()
+        by_checkout = {row.checkout_request_id: row for row in rows}
+    
+    matches = []
+    unmatched = []
+    for callback in callbacks:
+        row = by_checkout.get(callback['checkout_request_id'])
+        partial_id = _reference_id(callback['account_reference'], prefix)
+        if not row and partial_id:
+            rows = db.session.query(model.id, model.payment_status).filter(
+                model.id.startswith(partial_id, autoescape=True)
+            ).limit(2).all()
+            row = rows[0] if len(rows) == 1 else None
+        if row:
+            matches.append((row.id, row.payment_status, callback))
+        else:
+            unmatched.append(callback)
+    return matches, unmatched
+
+
+def _fold(matches):
+    """Fold duplicate and out-of-order callbacks per row: a success wins over a
+    failure, and a settled row is never downgraded or completed twice."""
+    outcomes = {}
+    for row_id, current_status, callback in matches:
+        if current_status in SETTLED_STATUSES:
+            continue
+        if callback['result_code'] == 0:
+            outcomes[row_id] = {'id': row_id, 'payment_status': PaymentStatus.COMPLETED,
+                                'mpesa_receipt': callback['mpesa_receipt'], 'previous_status': current_status}
+        elif row_id not in outcomes and current_status == PaymentStatus.PENDING:
+            outcomes[row_id] = {'id': row_id, 'payment_status': PaymentStatus.FAILED}
+    completed = [o for o in outcomes.values() if o['payment_status'] == PaymentStatus.COMPLETED]
+    failed = [o['id'] for o in outcomes.values() if o['payment_status'] == PaymentStatus.FAILED]
+    return completed, failed
+
+
+def _warn_needs_refund(kind, ids):
+    if ids:
+        current_app.logger.warning('Late M-Pesa payment for %s %s found the seats sold again; '
+                                   'flagged NEEDS_REFUND', kind, ', '.join(sorted(ids)))
+
+
+def _settle_tickets(completed, failed):
+    if completed:
+        completed_ids = [o['id'] for o in completed]
+        # A lapsed or failed hold that was paid after all takes its seat back if it is still free
+        _, needs_refund = recover_paid_tickets(Ticket.id.in_(completed_ids), [PaymentStatus.EXPIRED, PaymentStatus.FAILED])
+        _warn_needs_refund('ticket', [ticket.id for ticket in needs_refund])
+        transition_tickets(Ticket.id.in_(completed_ids), [PaymentStatus.PENDING], PaymentStatus.COMPLETED)
+        receipts = [{'id': o['id'], 'mpesa_receipt': o['mpesa_receipt']} for o in completed if o['mpesa_receipt']]
+        if receipts:
+            db.session.execute(update(Ticket), receipts)
+    if failed:
+        transition_tickets(Ticket.id.in_(failed), [PaymentStatus.PENDING], PaymentStatus.FAILED)
+
+
+def _settle_orders(completed, failed):
+    needs_refund = set()
+    for outcome in completed:
+        # Every ticket of the order in a single UPDATE
+        if outcome['previous_status'] == PaymentStatus.PENDING:
+            transition_tickets(Ticket.order_id == outcome['id'], [PaymentStatus.PENDING], PaymentStatus.COMPLETED,
+                               mpesa_receipt=outcome['mpesa_receipt'])
+        else:
+            _, unseated = recover_paid_tickets(Ticket.order_id == outcome['id'],
+                                               [PaymentStatus.EXPIRED, PaymentStatus.FAILED],
+                                               mpesa_receipt=outcome['mpesa_receipt'])
+            if unseated:
+                needs_refund.add(outcome['id'])
+    _warn_needs_refund('order', needs_refund)
+    if completed:
+        db.session.execute(update(Order), [
+            {'id': o['id'], 'mpesa_receipt': o['mpesa_receipt'],
+             'payment_status': PaymentStatus.NEEDS_REFUND if o['id'] in needs_refund else PaymentStatus.COMPLETED}
+            for o in completed
+        ])
+    if failed:
+        transition_tickets(Ticket.order_id.in_(failed), [PaymentStatus.PENDING], PaymentStatus.FAILED)
+        db.session.execute(
+            update(Order)
+            .where(Order.id.in_(failed), Order.payment_status == PaymentStatus.PENDING)
+            .values(payment_status=PaymentStatus.FAILED)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _settle_subscriptions(matches):
+    """Club subscriptions keep string statuses; the same folding rules apply."""
+    completed = {}
+    failed = set()
+    for subscription_id, current_status, callback in matches:
+        if current_status == 'completed':
+            continue
+        if callback['result_code'] == 0:
+            completed[subscription_id] = callback['mpesa_receipt']
+        elif current_status == 'pending':
+            failed.add(subscription_id)
+    extend_subscriptions(completed)
+    fail_subscription_payments(list(failed - set(completed)))
+
+
+def apply_callbacks(callbacks):
+    """
+    Settle tickets, group orders and club subscriptions from a batch of
+    parsed callbacks with bulk UPDATEs. The caller owns the transaction.
+    
+    Returns:
+        int: number of callbacks that matched something
+    """
+    ticket_matches, unmatched = _match(Ticket, 'TICKET', callbacks)
+    order_matches = []
+    subscription_matches = []
+    if unmatched:
+        order_matches, unmatched = _match(Order, 'ORDER', unmatched)
+    if unmatched:
+        subscription_matches, _ = _match(ClubSubscription, 'SUB', unmatched)
+    
+    _settle_tickets(*_fold(ticket_matches))
+    if order_matches:
+        _settle_orders(*_fold(order_matches))
+    if subscription_matches:
+        _settle_subscriptions(subscription_matches)
+    
+    return len(ticket_matches) + len(order_matches) + len(subscription_matches)
+
+
+def drain_callback_log(batch_size=100):
+    """
+    Apply one batch of logged callbacks in a single transaction.
+    
+    Rows are claimed with FOR UPDATE SKIP LOCKED where the database supports
+    it, so several consumers can drain the log concurrently.
+    
+    Returns:
+        int: number of log rows processed
+    """
+    try:
+        rows = MpesaCallbackLog.query.filter(
+            MpesaCallbackLog.processed_at.is_(None)
+        ).order_by(MpesaCallbackLog.id).limit(batch_size).with_for_update(skip_locked=True).all()
+        
+        if not rows:
+            db.session.rollback()
+            return 0
+        
+        apply_callbacks([{
+            'checkout_request_id': row.checkout_request_id,
+            'account_reference': row.account_reference or '',
+            'result_code': row.result_code,
+            'mpesa_receipt': row.mpesa_receipt
+        } for row in rows])
+        
+        db.session.execute(
+            update(MpesaCallbackLog)
+            .where(MpesaCallbackLog.id.in_([row.id for row in rows]))
+            .values(processed_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return len(rows)
+    except Exception as e:
+        db.session.rollback()
+        raise e
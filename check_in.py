@@ -0,0 +1,203 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+from datetime import datetime, timezone, timedelta
+from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from extension import db
+from auth import signing_secret
+from models import CheckIn, CheckInManifest, PaymentStatus, Ticket, TicketTier, User
+
+SIGNATURE_BYTES = 10
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def event_key(event_id):
+    """
+    Per-event signing key derived from the server secret. Scanners receive
+    it in the manifest so one event's key never verifies another's tickets.
+    """
+    secret = signing_secret('TICKET_CODE_SECRET')
+    return hmac.new(secret.encode(), f'ticket-code:{event_id}'.encode(), hashlib.sha256).digest()
+
+
+def ticket_code(ticket, key=None):
+    """Compact QR payload: the ticket's UUID bytes followed by a truncated HMAC."""
+    key = key or event_key(ticket.event_id)
+    ticket_bytes = UUID(ticket.id).bytes
+    signature = hmac.new(key, ticket_bytes, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    return _b64encode(ticket_bytes + signature)
+
+
+def verify_code(code, key):
+    """
+    Check a ticket code against an event key without touching the database.
+    
+    Returns:
+        str or None: the ticket id when the signature is valid
+    """
+    try:
+        raw = _b64decode(code)
+    except (ValueError, TypeError):
+        return None
+    if len(raw) != 16 + SIGNATURE_BYTES:
+        return None
+    ticket_bytes, signature = raw[:16], raw[16:]
+    expected = hmac.new(key, ticket_bytes, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+    if not hmac.compare_digest(signature, expected):
+        return None
+    return str(UUID(bytes=ticket_bytes))
+
+
+def manifest_max_age():
+    return timedelta(seconds=int(os.environ.get('CHECK_IN_MANIFEST_MAX_AGE_SECONDS', 60)))
+
+
+def build_manifest(event_id):
+    """Serialize every COMPLETED ticket of the event with its holder, tier and
+    check-in state into a stored manifest. The caller commits."""
+    rows = db.session.execute(
+        select(Ticket.id, User.username, TicketTier.name, CheckIn.scanned_at)
+        .join(User, User.id == Ticket.user_id)
+        .outerjoin(TicketTier, TicketTier.id == Ticket.tier_id)
+        .outerjoin(CheckIn, CheckIn.ticket_id == Ticket.id)
+        .where(Ticket.event_id == event_id, Ticket.payment_status == PaymentStatus.COMPLETED)
+    ).all()
+    
+    generated_at = datetime.now(timezone.utc)
+    payload = json.dumps({
+        'event_id': event_id,
+        'key': _b64encode(event_key(event_id)),
+        'signature_bytes': SIGNATURE_BYTES,
+        'generated_at': generated_at.isoformat(),
+        'tickets': [
+            {
+                'ticket_id': row[0],
+                'username': row[1],
+                'tier': row[2],
+                'checked_in_at': row[3].isoformat() if row[3] else None
+            }
+            for row in rows
+        ]
+    }, separators=(',', ':'))
+    
+    manifest = db.session.get(CheckInManifest, event_id) or CheckInManifest(event_id=event_id)
+    manifest.payload = payload
+    manifest.ticket_count = len(rows)
+    manifest.generated_at = generated_at
+    db.session.add(manifest)
+    return manifest
+
+
+def current_manifest(event_id):
+    """
+    The stored manifest, rebuilt first if it is older than the max age.
+    
+    When two scanners build an event's first manifest at once, the slower
+    insert loses on the primary key and returns the one that was stored.
+    """
+    manifest = db.session.get(CheckInManifest, event_id)
+    if manifest is not None:
+        generated_at = manifest.generated_at
+        if generated_at.tzinfo is None:
+            generated_at = generated_at.replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) - generated_at < manifest_max_age():
+            return manifest
+    manifest = build_manifest(event_id)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        manifest = db.session.get(CheckInManifest, event_id, populate_existing=True)
+        if manifest is None:
+            raise
+    return manifest
+
+
+def _insert_ignoring_duplicates(rows):
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    statement = (
+        insert(CheckIn)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=['ticket_id'])
+        .returning(CheckIn.ticket_id)
+    )
+    return set(db.session.execute(statement).scalars())
+
+
+def record_check_ins(event_id, scans, device_id=None):
+    """
+    Record a scanner's batch of check-ins.
+    
+    Signatures are verified in memory, valid tickets are confirmed with one
+    SELECT, and the batch is written with one multi-row INSERT ... ON CONFLICT
+    DO NOTHING whose RETURNING clause tells new check-ins from duplicates.
+    The caller commits.
+    
+    Returns:
+        dict: ticket ids grouped into recorded, duplicate and rejected
+    """
+    key = event_key(event_id)
+    scanned = {}
+    duplicate = []
+    rejected = []
+    
+    for scan in scans:
+        code = scan.get('code') if isinstance(scan, dict) else None
+        ticket_id = verify_code(code, key) if code else None
+        if ticket_id is None:
+            rejected.append({'code': code, 'reason': 'Invalid signature'})
+            continue
+        if ticket_id in scanned:
+            duplicate.append(ticket_id)
+            continue
+        try:
+            scanned_at = datetime.fromisoformat(scan['scanned_at'].replace('Z', '+00:00'))
+        except (KeyError, AttributeError, ValueError):
+            scanned_at = datetime.now(timezone.utc)
+        scanned[ticket_id] = scanned_at
+    
+    if scanned:
+        valid = set(db.session.execute(
+            select(Ticket.id).where(
+                Ticket.id.in_(list(scanned)),
+                Ticket.event_id == event_id,
+                Ticket.payment_status == PaymentStatus.COMPLETED
+            )
+        ).scalars())
+        for ticket_id in list(scanned):
+            if ticket_id not in valid:
+                rejected.append({'ticket_id': ticket_id, 'reason': 'Ticket is not valid for this event'})
+                del scanned[ticket_id]
+    
+    recorded = set()
+    if scanned:
+        recorded = _insert_ignoring_duplicates([
+            {
+                'ticket_id': ticket_id,
+                'event_id': event_id,
+                'device_id': device_id,
+                'scanned_at': scanned_at,
+                'uploaded_at': datetime.now(timezone.utc)
+            }
+            for ticket_id, scanned_at in scanned.items()
+        ])
+        duplicate.extend(ticket_id for ticket_id in scanned if ticket_id not in recorded)
+    
+    return {
+        'recorded': sorted(recorded),
+        'duplicate': duplicate,
+        'rejected': rejected
+    }
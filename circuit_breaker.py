@@ -0,0 +1,174 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PaymentsUnavailable(Exception):
+    """Raised instead of calling an upstream that is failing or saturated."""
+
+    def __init__(self, message='Payments temporarily unavailable', retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker.
+    
+    CLOSED passes calls through and counts consecutive failures. After
+    `failure_threshold` of them the circuit OPENs and rejects calls outright
+    for `recovery_timeout` seconds. It then goes HALF_OPEN and lets up to
+    `half_open_max_calls` probes through: a successful probe closes the
+    circuit, a failed one opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._half_open_in_flight = 0
+        self._opened_at = None
+        self._state_changed_at = time.time()
+        
+        self._stats = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'rejected': 0,
+            'last_failure_at': None,
+            'last_success_at': None,
+            'last_latency_ms': None,
+            'total_latency_ms': 0.0
+        }
+
+    def _set_state(self, state):
+        self._state = state
+        self._state_changed_at = time.time()
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        if state != self.HALF_OPEN:
+            self._half_open_in_flight = 0
+
+    def _retry_after(self):
+        if self._opened_at is None:
+            return None
+        return max(0, round(self.recovery_timeout - (time.monotonic() - self._opened_at), 1))
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                self._set_state(self.HALF_OPEN)
+            return self._state
+
+    def before_call(self):
+        """Reserve a call slot or raise PaymentsUnavailable."""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    self._stats['rejected'] += 1
+                    raise PaymentsUnavailable(retry_after=self._retry_after())
+                self._set_state(self.HALF_OPEN)
+            
+            if self._state == self.HALF_OPEN:
+                if self._half_open_in_flight >= self.half_open_max_calls:
+                    self._stats['rejected'] += 1
+                    raise PaymentsUnavailable(retry_after=self.recovery_timeout)
+                self._half_open_in_flight += 1
+            
+            self._stats['calls'] += 1
+
+    def release_probe(self):
+        """Hand back the slot taken by before_call() for a call that never
+        reached the upstream, so it counts as neither success nor failure.
+        Without this a HALF_OPEN circuit would wait forever for its probe."""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_in_flight > 0:
+                self._half_open_in_flight -= 1
+
+    def record_success(self, latency):
+        with self._lock:
+            self._record_latency(latency)
+            self._stats['successes'] += 1
+            self._stats['last_success_at'] = time.time()
+            self._consecutive_failures = 0
+            if self._state == self.HALF_OPEN:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self, latency):
+        with self._lock:
+            self._record_latency(latency)
+            self._stats['failures'] += 1
+            self._stats['last_failure_at'] = time.time()
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._set_state(self.OPEN)
+
+    def _record_latency(self, latency):
+        latency_ms = latency * 1000
+        self._stats['last_latency_ms'] = round(latency_ms, 2)
+        self._stats['total_latency_ms'] += latency_ms
+
+    def snapshot(self):
+        state = self.state
+        with self._lock:
+            stats = dict(self._stats)
+            completed = stats['successes'] + stats['failures']
+            stats['avg_latency_ms'] = round(stats.pop('total_latency_ms') / completed, 2) if completed else None
+            stats.update({
+                'name': self.name,
+                'state': state,
+                'consecutive_failures': self._consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'recovery_timeout': self.recovery_timeout,
+                'state_changed_at': self._state_changed_at,
+                'retry_after': self._retry_after() if state == self.OPEN else None
+            })
+            return stats
+
+
+class Bulkhead:
+    """Caps how many threads may be inside upstream calls at once. Callers
+    that cannot get a slot within `acquire_timeout` seconds are rejected."""
+
+    def __init__(self, name, max_concurrent=8, acquire_timeout=0.5):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.acquire_timeout = acquire_timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    @contextmanager
+    def slot(self):
+        if not self._semaphore.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise PaymentsUnavailable()
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._semaphore.release()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self._in_flight,
+                'rejected': self._rejected
+            }
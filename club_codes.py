@@ -0,0 +1,130 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from extension import db
+from models import Counter, User, UserRole
+
+CODE_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+CODE_LENGTH = 8
+HALF_SPACE = len(CODE_ALPHABET) ** (CODE_LENGTH // 2)
+FEISTEL_ROUNDS = 4
+COUNTER_NAME = 'club_access_code'
+# Bumped whenever a leader's code, name or subscription changes
+GENERATION_COUNTER = 'club_leaders'
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class LeaderSummary(namedtuple('LeaderSummary', 'id club_name subscription_active subscription_expires_at')):
+    """The fields of a club leader that signup and club payments need."""
+    
+    def is_subscription_active(self):
+        if not self.subscription_active or not self.subscription_expires_at:
+            return False
+        expires_at = self.subscription_expires_at
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        return expires_at > datetime.now(timezone.utc)
+
+
+def _ttl(name, default):
+    return float(os.environ.get(name, default))
+
+
+def leaders_generation():
+    """Current value of the club leaders generation counter."""
+    return db.session.query(Counter.value).filter_by(name=GENERATION_COUNTER).scalar() or 0
+
+
+def resolve_club_code(club_code):
+    """
+    Read-through cache from access code to LeaderSummary. Unknown codes are
+    cached as None for a shorter time so guessing codes cannot hammer the
+    database either. Subscription expiry is checked on use.
+    
+    The cache is per process, so each hit is checked against the leaders
+    generation in the database (a primary key lookup): a change committed by
+    any worker through invalidate_club_codes is seen by all of them at once.
+    """
+    if not club_code:
+        return None
+    
+    now = time.monotonic()
+    generation = leaders_generation()
+    with _cache_lock:
+        entry = _cache.get(club_code)
+        if entry and entry[0] > now and entry[1] == generation:
+            _cache.move_to_end(club_code)
+            return entry[2]
+    
+    row = db.session.query(
+        User.id, User.club_name, User.subscription_active, User.subscription_expires_at
+    ).filter_by(club_access_code=club_code, role=UserRole.LEADER).first()
+    summary = LeaderSummary(*row) if row else None
+    
+    if summary:
+        expires = now + _ttl('CLUB_CODE_CACHE_TTL', 300)
+    else:
+        expires = now + _ttl('CLUB_CODE_NEGATIVE_TTL', 30)
+    with _cache_lock:
+        _cache[club_code] = (expires, generation, summary)
+        _cache.move_to_end(club_code)
+        while len(_cache) > int(os.environ.get('CLUB_CODE_CACHE_SIZE', 10000)):
+            _cache.popitem(last=False)
+    return summary
+
+
+def invalidate_club_codes():
+    """Make every worker drop its cached codes once the caller commits; call
+    in the same transaction as any change to a leader's code, club name or
+    subscription."""
+    Counter.next_value(GENERATION_COUNTER)
+
+
+def _round_value(key, round_number, half):
+    digest = hmac.new(key, f'{round_number}:{half}'.encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], 'big') % HALF_SPACE
+
+
+def permute(n):
+    """
+    Keyed bijection on [0, 36**8): a balanced Feistel network over two base-36
+    halves. Distinct counter values always give distinct codes, and without
+    the key consecutive values give unrelated codes.
+    
+    CLUB_CODE_SECRET has its own variable so that rotating JWT_SECRET_KEY
+    cannot change it: codes issued under another key collide with new ones.
+    """
+    secret = os.environ.get('CLUB_CODE_SECRET')
+    if not secret:
+        raise ValueError("CLUB_CODE_SECRET environment variable is required to generate club access codes")
+    key = hashlib.sha256(f'club-code:{secret}'.encode()).digest()
+    left, right = divmod(n, HALF_SPACE)
+    for round_number in range(FEISTEL_ROUNDS):
+        left, right = right, (left + _round_value(key, round_number, right)) % HALF_SPACE
+    return left * HALF_SPACE + right
+
+
+def encode_code(n):
+    chars = []
+    for _ in range(CODE_LENGTH):
+        n, digit = divmod(n, len(CODE_ALPHABET))
+        chars.append(CODE_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def generate_club_code():
+    """Next access code from the counters table, with no uniqueness probing.
+    Runs inside the caller's transaction."""
+    return encode_code(permute(Counter.next_value(COUNTER_NAME)))
+
+
+def generate_club_codes(count):
+    """`count` access codes from one counter reservation, for bulk loads."""
+    last = Counter.next_value(COUNTER_NAME, count)
+    return [encode_code(permute(n)) for n in range(last - count + 1, last + 1)]
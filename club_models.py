@@ -1,10 +1,19 @@
 from extension import db
 from uuid import uuid4
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
 class ClubSubscription(db.Model):
     __tablename__ = "club_subscriptions"
+    __table_args__ = (
+        db.Index('ix_club_subscriptions_expires_at_is_active', 'expires_at', 'is_active'),
+        db.Index('ix_club_subscriptions_payment_status_payment_requested_at', 'payment_status', 'payment_requested_at'),
+    )
+    RENEWAL_PERIOD_DAYS = {'weekly': 7, 'monthly': 30, 'quarterly': 90, 'yearly': 365}
+    DEFAULT_RENEWAL_PERIOD = 'monthly'
+    MONTHLY_FEE = 200.0
+    COMMISSION_RATE = 0.1
+    
     id = db.Column(db.String(), primary_key=True, default=lambda: str(uuid4()))
     user_id = db.Column(db.String(), db.ForeignKey('users.id'), nullable=False)
     club_access_code = db.Column(db.String(10), nullable=False)
@@ -15,8 +24,12 @@ class ClubSubscription(db.Model):
     total_amount = db.Column(db.Float, default=220.0)
     
     renewal_period = db.Column(db.String(20), default='monthly')  # weekly, monthly, quarterly, yearly
-    payment_status = db.Column(db.String(20), default='completed')
+    payment_status = db.Column(db.String(20), default='completed')  # pending, completed, failed
     mpesa_receipt = db.Column(db.String(100), nullable=True)
+    payment_phone = db.Column(db.String(20), nullable=True)
+    checkout_request_id = db.Column(db.String(100), nullable=True, index=True)
+    payment_requested_at = db.Column(db.DateTime, nullable=True)  # when the last STK push went out
+    renewal_attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # since the last payment
     
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     expires_at = db.Column(db.DateTime, nullable=True)
@@ -24,6 +37,23 @@ class ClubSubscription(db.Model):
     
     user = db.relationship('User', backref='club_subscriptions', foreign_keys=[user_id])
     
+    @classmethod
+    def period_length(cls, renewal_period):
+        """Rows written before renewal periods were validated may hold other
+        spellings or nothing at all; those renew on the default period."""
+        days = cls.RENEWAL_PERIOD_DAYS.get(str(renewal_period or '').strip().lower())
+        return timedelta(days=days or cls.RENEWAL_PERIOD_DAYS[cls.DEFAULT_RENEWAL_PERIOD])
+    
+    @classmethod
+    def period_amounts(cls, renewal_period):
+        """Fee, platform commission and total charged per renewal period: the
+        monthly fee prorated by the period's days, in whole shillings as
+        M-Pesa expects."""
+        days = cls.period_length(renewal_period).days
+        fee = float(round(cls.MONTHLY_FEE * days / cls.RENEWAL_PERIOD_DAYS['monthly']))
+        commission = float(round(fee * cls.COMMISSION_RATE))
+        return fee, commission, fee + commission
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -36,6 +66,7 @@ class ClubSubscription(db.Model):
             'renewal_period': self.renewal_period,
             'payment_status': self.payment_status,
             'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
             'is_active': self.is_active
         }
     
@@ -49,6 +80,9 @@ class ClubSubscription(db.Model):
 
 class LuckyWinner(db.Model):
     __tablename__ = "lucky_winners"
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'user_id', name='uq_lucky_winners_event_id_user_id'),
+    )
     id = db.Column(db.String(), primary_key=True, default=lambda: str(uuid4()))
     event_id = db.Column(db.String(), db.ForeignKey('events.id'), nullable=False)
     user_id = db.Column(db.String(), db.ForeignKey('users.id'), nullable=False)
@@ -1,51 +1,198 @@
-from flask import Blueprint, request, jsonify
-from models import User, Event
+from flask import Blueprint, request, jsonify, make_response
+from models import User, UserRole, Event
 from club_models import ClubSubscription, LuckyWinner
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from extension import db
-import random
+from payments import mpesa, payments_unavailable_response
+from circuit_breaker import PaymentsUnavailable
+from club_codes import leaders_generation, resolve_club_code
+from reconciliation import reconcile_pending_subscriptions
+from subscription_renewals import bump_subscriptions_version, pending_timeout, renew_subscriptions, subscription_reference
+from sqlalchemy import and_, func, insert, select
+from sqlalchemy.orm import aliased
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timezone
+from uuid import uuid4
+import click
 
 club_bp = Blueprint('club', __name__)
 
+# Written by a payment request before its STK push goes out
+PAYMENT_REQUEST_FIELDS = ('renewal_period', 'subscription_fee', 'platform_commission', 'total_amount',
+                          'payment_phone', 'payment_status', 'payment_requested_at', 'renewal_attempts')
+
 @club_bp.post('/payments/club-subscription')
+@jwt_required()
 def club_subscription_payment():
+    current_user_id = get_jwt_identity()
     data = request.get_json()
     phone_number = data.get('phone_number')
     club_access_code = data.get('club_access_code')
-    amount = data.get('amount', 220)
+    renewal_period = data.get('renewal_period', 'monthly')
     
     if not phone_number or not club_access_code:
         return jsonify({'error': 'Phone number and club access code required'}), 400
     
+    if renewal_period not in ClubSubscription.RENEWAL_PERIOD_DAYS:
+        return jsonify({'error': f"renewal_period must be one of {', '.join(ClubSubscription.RENEWAL_PERIOD_DAYS)}"}), 400
+    
     # Find club leader
-    leader = User.get_leader_by_club_code(club_access_code)
+    leader = resolve_club_code(club_access_code)
     if not leader:
         return jsonify({'error': 'Invalid club access code'}), 404
     
+    subscription = ClubSubscription.query.filter_by(
+        user_id=current_user_id,
+        club_access_code=club_access_code
+    ).first()
+    if subscription and subscription.payment_status == 'pending' and subscription.checkout_request_id:
+        # A push whose callback never came stops blocking the user after the
+        # pending timeout; a late callback still matches on the SUB reference
+        requested_at = subscription.payment_requested_at
+        if requested_at is not None and requested_at.tzinfo is None:
+            requested_at = requested_at.replace(tzinfo=timezone.utc)
+        if requested_at is not None and datetime.now(timezone.utc) - requested_at < pending_timeout():
+            return jsonify({'error': 'A subscription payment is already in progress'}), 409
+    
+    previous = {field: getattr(subscription, field) for field in PAYMENT_REQUEST_FIELDS} if subscription else None
+    if not subscription:
+        subscription = ClubSubscription(
+            user_id=current_user_id,
+            club_access_code=club_access_code,
+            club_name=leader.club_name,
+            is_active=False
+        )
+    subscription.renewal_period = renewal_period
+    (subscription.subscription_fee, subscription.platform_commission,
+     subscription.total_amount) = ClubSubscription.period_amounts(renewal_period)
+    subscription.payment_phone = phone_number
+    subscription.payment_status = 'pending'
+    subscription.payment_requested_at = datetime.now(timezone.utc)
+    subscription.renewal_attempts = 0
+    bump_subscriptions_version([current_user_id])
+    
     try:
-        # Simulate M-Pesa payment (replace with actual M-Pesa integration)
+        subscription.save()
+        mpesa_response = mpesa.stk_push(
+            phone_number=phone_number,
+            amount=subscription.total_amount,
+            account_reference=subscription_reference(subscription.id),
+            transaction_desc=f"{leader.club_name} subscription"
+        )
+        
+        if mpesa_response.get('ResponseCode') != '0':
+            subscription.payment_status = 'failed'
+            bump_subscriptions_version([current_user_id])
+            subscription.save()
+            return jsonify({'error': 'Payment initiation failed'}), 400
+        
+        subscription.checkout_request_id = mpesa_response.get('CheckoutRequestID')
+        subscription.save()
         return jsonify({
             'message': 'Club subscription payment initiated',
-            'checkout_request_id': f'ws_CO_{random.randint(100000, 999999)}',
+            'subscription_id': subscription.id,
+            'checkout_request_id': subscription.checkout_request_id,
             'club_name': leader.club_name
         }), 200
-            
+    
+    except PaymentsUnavailable as e:
+        db.session.rollback()
+        restore_subscription(subscription, previous)
+        return payments_unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def restore_subscription(subscription, previous):
+    """Undo a payment request whose push was never sent: a new subscription
+    is removed, an existing one gets its earlier payment state back."""
+    try:
+        bump_subscriptions_version([subscription.user_id])
+        if previous is None:
+            db.session.delete(subscription)
+        else:
+            for field, value in previous.items():
+                setattr(subscription, field, value)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
 @club_bp.get('/user/subscriptions')
 @jwt_required()
 def get_user_subscriptions():
     current_user_id = get_jwt_identity()
     
-    subscriptions = ClubSubscription.query.filter_by(
-        user_id=current_user_id, 
-        is_active=True
+    version = db.session.query(User.subscriptions_version).filter_by(id=current_user_id).scalar()
+    if version is None:
+        return jsonify({'error': 'User not found'}), 404
+    
+    # Leader names and codes in the body change without touching the
+    # subscriber's version; their writes bump the leaders generation instead
+    etag = f'subs-{current_user_id}-{version}-{leaders_generation()}'
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    
+    leader = aliased(User)
+    rows = db.session.execute(
+        select(ClubSubscription, leader.id, leader.username, leader.club_name)
+        .outerjoin(leader, and_(
+            leader.club_access_code == ClubSubscription.club_access_code,
+            leader.role == UserRole.LEADER
+        ))
+        .where(ClubSubscription.user_id == current_user_id, ClubSubscription.is_active.is_(True))
     ).all()
     
-    return jsonify({
-        'subscriptions': [sub.to_dict() for sub in subscriptions]
-    }), 200
+    subscriptions = []
+    for subscription, leader_id, leader_username, club_name in rows:
+        data = subscription.to_dict()
+        data['club'] = {
+            'leader_id': leader_id,
+            'leader_username': leader_username,
+            'club_name': club_name or subscription.club_name
+        }
+        subscriptions.append(data)
+    
+    response = jsonify({'subscriptions': subscriptions})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response, 200
+
+def select_lucky_winners(event_id, club_access_code, num_winners):
+    """
+    Sample winners at the database from the club's active members, skipping
+    anyone who already won this event, and insert them with one statement.
+    The caller commits.
+    
+    Returns:
+        list: (winner_id, user_id) pairs, shorter than num_winners when the
+        club has too few eligible members
+    """
+    previous_winners = select(LuckyWinner.user_id).where(LuckyWinner.event_id == event_id)
+    user_ids = db.session.execute(
+        select(ClubSubscription.user_id)
+        .where(
+            ClubSubscription.club_access_code == club_access_code,
+            ClubSubscription.is_active.is_(True),
+            ClubSubscription.user_id.not_in(previous_winners)
+        )
+        .group_by(ClubSubscription.user_id)
+        .order_by(func.random())
+        .limit(num_winners)
+    ).scalars().all()
+    
+    if len(user_ids) < num_winners:
+        return [(None, user_id) for user_id in user_ids]
+    
+    selected_at = datetime.now(timezone.utc)
+    rows = [
+        {'id': str(uuid4()), 'event_id': event_id, 'user_id': user_id,
+         'ticket_sent': True, 'selected_at': selected_at}
+        for user_id in user_ids
+    ]
+    db.session.execute(insert(LuckyWinner), rows)
+    return [(row['id'], row['user_id']) for row in rows]
 
 @club_bp.post('/events/<event_id>/pick-winners')
 @jwt_required()
@@ -54,6 +201,9 @@ def pick_lucky_winners(event_id):
     data = request.get_json()
     num_winners = data.get('num_winners', 1)
     
+    if not isinstance(num_winners, int) or num_winners < 1:
+        return jsonify({'error': 'num_winners must be a positive integer'}), 400
+    
     # Verify event ownership
     event = Event.query.get(event_id)
     if not event or event.leader_id != current_user_id:
@@ -64,38 +214,55 @@ def pick_lucky_winners(event_id):
     if not leader or not leader.club_access_code:
         return jsonify({'error': 'Club access code not found'}), 400
     
-    club_members = ClubSubscription.query.filter_by(
-        club_access_code=leader.club_access_code,
-        is_active=True
-    ).all()
-    
-    if len(club_members) < num_winners:
-        return jsonify({'error': f'Not enough club members. Only {len(club_members)} available'}), 400
-    
-    # Randomly select winners
-    selected_members = random.sample(club_members, min(num_winners, len(club_members)))
-    winners = []
-    
     try:
-        for member in selected_members:
-            # Create lucky winner record
-            winner = LuckyWinner(
-                event_id=event_id,
-                user_id=member.user_id,
-                ticket_sent=True
-            )
-            winner.save()
-            
-            winners.append({
-                'id': winner.id,
-                'username': member.user.username if member.user else 'Unknown',
-                'user_id': member.user_id
-            })
-        
-        return jsonify({
-            'message': f'{len(winners)} lucky winners selected',
-            'winners': winners
-        }), 200
-        
+        selected = select_lucky_winners(event_id, leader.club_access_code, num_winners)
+        if len(selected) < num_winners:
+            db.session.rollback()
+            return jsonify({'error': f'Not enough eligible club members. Only {len(selected)} available'}), 400
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Winners were picked concurrently for this event. Please retry'}), 409
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    usernames = dict(db.session.execute(
+        select(User.id, User.username).where(User.id.in_([user_id for _, user_id in selected]))
+    ).all())
+    winners = [
+        {'id': winner_id, 'username': usernames.get(user_id, 'Unknown'), 'user_id': user_id}
+        for winner_id, user_id in selected
+    ]
+    
+    return jsonify({
+        'message': f'{len(winners)} lucky winners selected',
+        'winners': winners
+    }), 200
+
+@club_bp.cli.command('renew-subscriptions')
+@click.option('--lead-hours', default=24, type=int, help='Request renewals for subscriptions expiring within this many hours')
+@click.option('--batch-size', default=500, type=int, help='Subscriptions fetched and updated per batch')
+@click.option('--concurrency', default=8, type=int, help='Maximum in-flight STK push requests, at most MPESA_MAX_CONCURRENT')
+def renew_subscriptions_command(lead_hours, batch_size, concurrency):
+    """Settle renewals whose callback never came, expire lapsed club
+    subscriptions and request renewals for those due."""
+    # More threads than bulkhead slots would only have pushes shed as PaymentsUnavailable
+    concurrency = min(concurrency, mpesa.bulkhead.max_concurrent)
+    summary = reconcile_pending_subscriptions(mpesa, batch_size=batch_size, concurrency=concurrency)
+    click.echo(
+        f"Checked {summary['checked']} pending subscription payments: "
+        f"{summary['completed']} completed, {summary['failed']} failed, {summary['unresolved']} still pending"
+    )
+    summary = renew_subscriptions(
+        mpesa,
+        lead_hours=lead_hours,
+        batch_size=batch_size,
+        concurrency=concurrency
+    )
+    click.echo(
+        f"Expired {summary['expired']} subscriptions, "
+        f"requested {summary['requested']} renewals ({summary['failed']} failed to send)"
+    )
+    if summary['skipped']:
+        click.echo(f"Stopped early: M-Pesa unavailable, {summary['skipped']} renewals left for the next run")
@@ -0,0 +1,128 @@
+import os
+import threading
+import time
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection and
+    how often they time out, on top of QueuePool's own size counters."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._slow_checkouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self._checkouts += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+                if waited >= 0.1:
+                    self._slow_checkouts += 1
+
+    def recreate(self):
+        # Invalidation after a failover rebuilds the pool; keep the counters
+        pool = super().recreate()
+        pool._checkouts = self._checkouts
+        pool._timeouts = self._timeouts
+        pool._wait_total = self._wait_total
+        pool._wait_max = self._wait_max
+        pool._slow_checkouts = self._slow_checkouts
+        return pool
+
+    def snapshot(self):
+        with self._stats_lock:
+            checkouts = self._checkouts
+            return {
+                'pool_size': self.size(),
+                'checked_out': self.checkedout(),
+                'checked_in': self.checkedin(),
+                'overflow': max(0, self.overflow()),
+                'max_overflow': self._max_overflow,
+                'checkouts': checkouts,
+                'timeouts': self._timeouts,
+                'slow_checkouts': self._slow_checkouts,
+                'avg_wait_ms': round(self._wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                'max_wait_ms': round(self._wait_max * 1000, 3)
+            }
+
+
+def engine_options(database_url):
+    """
+    SQLAlchemy engine options from the environment.
+
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and DB_POOL_RECYCLE size the
+    per-worker pool; DB_POOL_PRE_PING (on by default) tests connections on
+    checkout so a failover does not surface as errors. DB_STATEMENT_TIMEOUT_MS
+    is sent as a startup option on PostgreSQL. With DB_PGBOUNCER set the app
+    keeps no pool of its own (NullPool) and sends no startup options, since
+    PgBouncer in transaction mode rejects them; set statement_timeout on the
+    database role instead.
+    """
+    database_url = database_url or ''
+    if database_url in ('sqlite://', 'sqlite:///:memory:'):
+        return {}
+
+    options = {'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True)}
+
+    if _env_bool('DB_PGBOUNCER', False):
+        options['poolclass'] = NullPool
+        return options
+
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'pool_use_lifo': True
+    })
+
+    statement_timeout = os.environ.get('DB_STATEMENT_TIMEOUT_MS')
+    if statement_timeout and database_url.startswith('postgres'):
+        options['connect_args'] = {'options': f'-c statement_timeout={int(statement_timeout)}'}
+    return options
+
+
+def lift_statement_timeout(connection):
+    """
+    Disable statement_timeout for the connection's current transaction only.
+    Migrations and the wait for the migration lock can legitimately outlast
+    DB_STATEMENT_TIMEOUT_MS (or a timeout set on the role); SET LOCAL ends
+    with the transaction, so the connection goes back to the pool with the
+    timeout in force.
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL statement_timeout = 0')
+
+
+def pool_snapshot(engine):
+    pool = engine.pool
+    snapshot = {'pid': os.getpid(), 'pool_class': type(pool).__name__}
+    if isinstance(pool, InstrumentedQueuePool):
+        snapshot.update(pool.snapshot())
+    else:
+        snapshot['status'] = pool.status()
+    return snapshot
@@ -0,0 +1,89 @@
+import os
+import time
+from functools import wraps
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND_KEY = 'replica'
+STICKY_COOKIE_NAME = 'db_primary_until'
+
+
+def sticky_seconds():
+    """How long a client reads from the primary after it writes, covering replication lag."""
+    return float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+
+def read_only(f):
+    """
+    Route decorator allowing the request's queries to be served by the read
+    replica. Place it directly under the route decorator so it also covers
+    queries made by auth decorators. The route must not write.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.db_read_only = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _use_replica():
+    if not has_request_context() or not g.get('db_read_only'):
+        return False
+    try:
+        primary_until = float(request.cookies.get(STICKY_COOKIE_NAME, 0))
+    except ValueError:
+        primary_until = 0
+    return primary_until < time.time()
+
+
+class RoutingSession(Session):
+    """
+    Sends reads of routes marked @read_only to the replica bind when one is
+    configured, and everything else to the primary. Any flush or DML
+    statement is noted so the response can pin the client to the primary
+    for a few seconds (read-your-writes).
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is not None:
+            return bind
+
+        if self._flushing or isinstance(clause, UpdateBase):
+            if has_request_context():
+                g.db_wrote = True
+        elif _use_replica():
+            replica = self._db.engines.get(REPLICA_BIND_KEY)
+            if replica is not None:
+                return replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_replica(app):
+    """
+    Register DATABASE_REPLICA_URL as the replica bind, if set, and the
+    after-request hook that sets the stickiness cookie. Call before
+    db.init_app so the bind is picked up.
+    """
+    replica_url = os.getenv('DATABASE_REPLICA_URL')
+    if not replica_url:
+        return
+
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[REPLICA_BIND_KEY] = replica_url
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+    @app.after_request
+    def pin_writers_to_primary(response):
+        if g.get('db_wrote') and response.status_code < 400:
+            window = sticky_seconds()
+            response.set_cookie(
+                STICKY_COOKIE_NAME,
+                str(round(time.time() + window, 3)),
+                max_age=int(window) + 1,
+                httponly=True,
+                secure=app.config.get('JWT_COOKIE_SECURE', True),
+                samesite=app.config.get('JWT_COOKIE_SAMESITE', 'None')
+            )
+        return response
@@ -1,8 +1,22 @@
-from flask import Blueprint, jsonify
+import os
+import click
+from flask import Blueprint, current_app, jsonify
 from models import Event, EventStatus
+from extension import db
+from db_pool import pool_snapshot
+from synthetic_data import DEFAULT_PAYMENT_MIX, DEFAULT_PASSWORD, generate
 
 debug_bp = Blueprint('debug', __name__)
 
+NON_PRODUCTION_ENVS = ('development', 'testing')
+
+
+def is_non_production():
+    """FLASK_ENV names a development or test environment, or the app runs in
+    debug or testing mode."""
+    flask_env = os.environ.get('FLASK_ENV', '').lower()
+    return flask_env in NON_PRODUCTION_ENVS or current_app.debug or current_app.testing
+
 @debug_bp.get('/test-events')
 def test_events():
     events = Event.query.filter_by(status=EventStatus.PENDING).all()
@@ -11,6 +25,10 @@ def test_events():
         'events': [{'id': e.id, 'title': e.title, 'status': e.status.value} for e in events]
     })
 
+@debug_bp.get('/pool')
+def pool_status():
+    return jsonify(pool_snapshot(db.engine)), 200
+
 @debug_bp.post('/approve-event/<event_id>')
 def approve_event_simple(event_id):
     event = Event.query.get(event_id)
@@ -52,4 +70,42 @@ def admin_panel():
     </script>
     '''
     
-    return html
\ No newline at end of file
+    return html
+
+@debug_bp.cli.command('generate-data')
+@click.option('--leaders', default=100, type=int, help='Club leaders (one club each)')
+@click.option('--users', default=100000, type=int, help='Club members spread over the clubs')
+@click.option('--club-size-skew', default=1.0, type=float, help='0 for equal clubs; higher gives a few large clubs and a long tail')
+@click.option('--events-per-leader', default='1-10', help='Events per leader, as N or MIN-MAX')
+@click.option('--tickets-per-event', default='10-500', help='Tickets per event, as N or MIN-MAX (capped at club size)')
+@click.option('--payment-mix', default=DEFAULT_PAYMENT_MIX, help='Ticket payment status weights, e.g. completed=0.9,pending=0.1')
+@click.option('--subscription-rate', default=0.3, type=float, help='Share of members with a club subscription')
+@click.option('--vip-rate', default=0.3, type=float, help='Share of events with a VIP tier')
+@click.option('--batch-size', default=20000, type=int, help='Rows per table buffered before each COPY/INSERT and commit')
+@click.option('--seed', default=None, type=int, help='Random seed; fixes ids and distributions')
+@click.option('--prefix', default=None, help='Username and email prefix (default derived from the seed)')
+@click.option('--password', default=DEFAULT_PASSWORD, help='Password shared by every generated user')
+@click.option('--yes-this-is-not-production', 'not_production', is_flag=True,
+              help='Confirm the target database is not production when FLASK_ENV does not say so')
+def generate_data(leaders, users, club_size_skew, events_per_leader, tickets_per_event, payment_mix,
+                  subscription_rate, vip_rate, batch_size, seed, prefix, password, not_production):
+    """Bulk-load synthetic users, clubs, events, tickets and subscriptions for benchmarks."""
+    if not (not_production or is_non_production()):
+        database = db.engine.url.render_as_string(hide_password=True)
+        raise click.ClickException(
+            f"Refusing to load synthetic data into {database}: FLASK_ENV is not "
+            f"{' or '.join(NON_PRODUCTION_ENVS)}. Pass --yes-this-is-not-production if it really is not production."
+        )
+    
+    def progress(counts, elapsed):
+        rows = sum(counts.values())
+        click.echo(f"{rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s) "
+                   f"users={counts['users']} events={counts['events']} tickets={counts['tickets']}")
+
+    counts = generate(
+        leaders=leaders, users=users, events_per_leader=events_per_leader, tickets_per_event=tickets_per_event,
+        club_size_skew=club_size_skew, payment_mix=payment_mix, subscription_rate=subscription_rate,
+        vip_rate=vip_rate, batch_size=batch_size, seed=seed, prefix=prefix, password=password, progress=progress
+    )
+    click.echo(f"Generated {', '.join(f'{count} {table}' for table, count in counts.items())}")
+
@@ -1,13 +1,109 @@
-from flask import Blueprint, jsonify, request
-from models import Event, EventStatus, User, UserRole, Ticket, PaymentStatus
+from flask import Blueprint, current_app, jsonify, request
+from models import Event, EventStatus, User, UserRole, Ticket, TicketTier, Order, PaymentStatus, WaitlistEntry, WaitlistStatus, WaitingRoom
 from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from functools import wraps
 from datetime import datetime, timezone
 from utils import validate_json_input
 from auth import role_required
+from admission import admission_required, issue_token, queue_stats, invalidate_gated_events
+from db_routing import read_only
+from sql_profiler import query_budget
+from check_in import current_manifest, record_check_ins, ticket_code
+from listings import event_listing, event_ticket_listing
+from reservations import (
+    allocate_seats, hold_expires_at, expire_stale_holds, resync_seats_taken, join_waitlist, waitlist_position
+)
+from extension import db
+from sqlalchemy import insert, or_, update
+from sqlalchemy.exc import IntegrityError
+import click
+import os
+from uuid import uuid4
 
 events_bp = Blueprint('events', __name__)
 
+def parse_tiers(raw_tiers):
+    """Validate a `tiers` payload into TicketTier objects; returns (tiers, error)."""
+    if not isinstance(raw_tiers, list) or not raw_tiers:
+        return None, 'Tiers must be a non-empty list'
+    
+    tiers = []
+    seen = set()
+    for raw in raw_tiers:
+        name = str(raw.get('name', '')).strip().lower() if isinstance(raw, dict) else ''
+        if not name or len(name) > 50:
+            return None, 'Each tier needs a name of at most 50 characters'
+        if name in seen:
+            return None, f'Duplicate tier name: {name}'
+        seen.add(name)
+        try:
+            price = max(0, float(raw.get('price', 0)))
+            capacity = int(raw['capacity']) if raw.get('capacity') is not None else None
+        except (TypeError, ValueError):
+            return None, f'Invalid price or capacity for tier {name}'
+        if capacity is not None and capacity < 1:
+            return None, f'Capacity for tier {name} must be at least 1, or omitted for no tier limit'
+        tiers.append(TicketTier(name=name, price=price, capacity=capacity))
+    return tiers, None
+
+def sync_price_tier(event, name, price):
+    """Keep the tier a legacy flat price field (vip_price, vvip_price) maps to
+    in step with it; returns an error message or None."""
+    tier = next((tier for tier in event.tiers if tier.name == name), None)
+    if price:
+        if tier:
+            tier.price = price
+        else:
+            event.tiers.append(TicketTier(name=name, price=price))
+    elif tier:
+        if Ticket.query.filter_by(tier_id=tier.id).first():
+            return f'{name} tickets have been sold; the {name} price cannot be removed'
+        event.tiers.remove(tier)
+        db.session.delete(tier)
+    return None
+
+def check_purchasable(event, user):
+    """Error response if `user` may not buy tickets for `event`, else None."""
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    
+    if event.status != EventStatus.APPROVED:
+        return jsonify({'error': 'Event is not available for ticket purchase'}), 400
+    
+    if user.leader_id != event.leader_id:
+        return jsonify({'error': 'You can only purchase tickets for events in your club'}), 403
+    
+    leader = User.query.get(event.leader_id)
+    if not leader or not leader.is_subscription_active():
+        return jsonify({'error': 'Event organizer subscription is inactive'}), 403
+    
+    return None
+
+def resolve_tier(event, requested_tier):
+    """The requested tier (name or id), or the cheapest one; returns (tier, error)."""
+    tier_query = TicketTier.query.filter_by(event_id=event.id)
+    if requested_tier:
+        tier = tier_query.filter(or_(
+            TicketTier.id == str(requested_tier),
+            TicketTier.name == str(requested_tier).strip().lower()
+        )).first()
+        if not tier:
+            return None, (jsonify({'error': 'Invalid ticket tier'}), 400)
+        return tier, None
+    # Events created before tiers existed have none and sell at ticket_price
+    return tier_query.order_by(TicketTier.price).first(), None
+
+def sold_out_response(event, tier):
+    error = f'{tier.name} tickets are sold out' if tier and tier.capacity is not None else 'Event is sold out'
+    return jsonify({
+        'error': error,
+        'waitlist': {
+            'endpoint': f'/api/events/{event.id}/waitlist',
+            'method': 'POST',
+            'description': 'Join the waitlist to be given the next released seat'
+        }
+    }), 400
+
 @events_bp.post('/create')
 @role_required(UserRole.LEADER)
 def create_event():
@@ -47,6 +143,14 @@ def create_event():
         status=EventStatus.PENDING
     )
     
+    if data.get('tiers') is not None:
+        tiers, error = parse_tiers(data['tiers'])
+        if error:
+            return jsonify({'error': error}), 400
+    else:
+        tiers = TicketTier.from_event_prices(new_event.ticket_price, new_event.vip_price, new_event.vvip_price)
+    new_event.tiers = tiers
+    
     try:
         new_event.save()
         return jsonify({
@@ -58,34 +162,18 @@ def create_event():
         return jsonify({'error': 'Failed to create event'}), 500
 
 @events_bp.get('/public')
+@query_budget(3)
+@read_only
 def get_public_events():
     """Public endpoint for approved events - no authentication required"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
-    query = Event.query.filter_by(status=EventStatus.APPROVED)
-    
-    paginated = query.order_by(Event.event_date.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    events_data = []
-    for event in paginated.items:
-        event_dict = event.to_dict()
-        # Add club access code for join functionality
-        if event.leader and event.leader.club_access_code:
-            event_dict['club_access_code'] = event.leader.club_access_code
-        events_data.append(event_dict)
-    
-    return jsonify({
-        'events': events_data,
-        'total': paginated.total,
-        'page': paginated.page,
-        'per_page': paginated.per_page,
-        'pages': paginated.pages
-    }), 200
+    return jsonify(event_listing([Event.status == EventStatus.APPROVED], page, per_page)), 200
 
 @events_bp.get('/all')
+@query_budget(4)
+@read_only
 @jwt_required()
 def get_all_events():
     current_user_id = get_jwt_identity()
@@ -98,39 +186,21 @@ def get_all_events():
     per_page = request.args.get('per_page', 10, type=int)
     status = request.args.get('status', None)
     
-    query = Event.query
+    criteria = []
     
     if user.role == UserRole.USER:
         # Show all approved events for users
-        query = query.filter_by(status=EventStatus.APPROVED)
+        criteria.append(Event.status == EventStatus.APPROVED)
     elif user.role == UserRole.LEADER:
-        query = query.filter_by(leader_id=user.id)
+        criteria.append(Event.leader_id == user.id)
     
     if status and user.role != UserRole.USER:
         try:
-            query = query.filter_by(status=EventStatus(status))
+            criteria.append(Event.status == EventStatus(status))
         except ValueError:
             return jsonify({'error': 'Invalid status'}), 400
     
-    paginated = query.order_by(Event.event_date.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    events_data = []
-    for event in paginated.items:
-        event_dict = event.to_dict()
-        # Add club access code for join functionality
-        if event.leader and event.leader.club_access_code:
-            event_dict['club_access_code'] = event.leader.club_access_code
-        events_data.append(event_dict)
-    
-    return jsonify({
-        'events': events_data,
-        'total': paginated.total,
-        'page': paginated.page,
-        'per_page': paginated.per_page,
-        'pages': paginated.pages
-    }), 200
+    return jsonify(event_listing(criteria, page, per_page)), 200
 
 @events_bp.get('/<event_id>')
 @jwt_required()
@@ -172,10 +242,41 @@ def update_event(event_id):
         event.location = data['location']
     if 'ticket_price' in data:
         event.ticket_price = float(data['ticket_price'])
-    if 'max_attendees' in data:
-        event.max_attendees = data['max_attendees']
+        for tier in event.tiers:
+            if tier.name == TicketTier.DEFAULT_NAME:
+                tier.price = event.ticket_price
+    for field, tier_name in (('vip_price', 'vip'), ('vvip_price', 'vvip')):
+        if field in data:
+            try:
+                price = max(0, float(data[field])) if data[field] else None
+            except (TypeError, ValueError):
+                return jsonify({'error': f'Invalid {field}'}), 400
+            setattr(event, field, price)
+            error = sync_price_tier(event, tier_name, price)
+            if error:
+                db.session.rollback()
+                return jsonify({'error': error}), 400
     if 'banner_url' in data:
         event.banner_url = data['banner_url']
+    if 'max_attendees' in data:
+        max_attendees = data['max_attendees']
+        if max_attendees is not None and not str(max_attendees).isdigit():
+            return jsonify({'error': 'max_attendees must be a non-negative integer'}), 400
+        max_attendees = int(max_attendees) if max_attendees is not None else None
+        # Checked and set in one conditional UPDATE so a concurrent sale cannot
+        # slip in between; 0 or null leaves the event unbounded
+        statement = update(Event).where(Event.id == event.id)
+        if max_attendees:
+            statement = statement.where(Event.seats_taken <= max_attendees)
+        changed = db.session.execute(
+            statement.values(max_attendees=max_attendees).execution_options(synchronize_session=False)
+        ).rowcount
+        if not changed:
+            seats_taken = db.session.query(Event.seats_taken).filter_by(id=event.id).scalar()
+            db.session.rollback()
+            return jsonify({
+                'error': f'max_attendees cannot be below the {seats_taken} seats already taken'
+            }), 400
     
     try:
         event.save()
@@ -243,33 +344,97 @@ def reject_event(event_id):
         return jsonify({'error': 'Failed to reject event'}), 500
 
 @events_bp.post('/<event_id>/purchase-ticket')
+@admission_required
 @role_required(UserRole.USER)
 def purchase_ticket(event_id):
     current_user_id = get_jwt_identity()
     user = User.query.get(current_user_id)
     event = Event.query.get(event_id)
     
-    if not event:
-        return jsonify({'error': 'Event not found'}), 404
+    error = check_purchasable(event, user)
+    if error:
+        return error
     
-    if event.status != EventStatus.APPROVED:
-        return jsonify({'error': 'Event is not available for ticket purchase'}), 400
+    existing_ticket = Ticket.query.filter_by(event_id=event_id, user_id=current_user_id, order_id=None).first()
+    if existing_ticket and existing_ticket.payment_status not in (PaymentStatus.FAILED, PaymentStatus.EXPIRED):
+        return jsonify({'error': 'You already have a ticket for this event'}), 400
     
-    if user.leader_id != event.leader_id:
-        return jsonify({'error': 'You can only purchase tickets for events in your club'}), 403
+    data = request.get_json()
+    phone_number = data.get('phone_number')
     
-    leader = User.query.get(event.leader_id)
-    if not leader or not leader.is_subscription_active():
-        return jsonify({'error': 'Event organizer subscription is inactive'}), 403
+    if not phone_number:
+        return jsonify({'error': 'Phone number is required for M-Pesa payment'}), 400
     
-    existing_ticket = Ticket.query.filter_by(event_id=event_id, user_id=current_user_id).first()
-    if existing_ticket:
+    tier, error = resolve_tier(event, data.get('tier'))
+    if error:
+        return error
+    
+    price = tier.price if tier else event.ticket_price
+    commission = Ticket.calculate_commission(price)
+    total_amount = Ticket.calculate_total(price)
+    ticket_values = dict(
+        tier_id=tier.id if tier else None,
+        ticket_price=price,
+        commission=commission,
+        total_amount=total_amount,
+        payment_status=PaymentStatus.PENDING,
+        payment_phone=phone_number
+    )
+    
+    try:
+        if not allocate_seats(event, tier=tier):
+            db.session.rollback()
+            return sold_out_response(event, tier)
+        
+        if existing_ticket:
+            # Reuse the failed/expired row; the (event_id, user_id) constraint allows only one
+            reopened = db.session.execute(
+                update(Ticket)
+                .where(Ticket.id == existing_ticket.id,
+                       Ticket.payment_status.in_([PaymentStatus.FAILED, PaymentStatus.EXPIRED]))
+                .values(purchased_at=datetime.now(timezone.utc), checkout_request_id=None,
+                        mpesa_receipt=None, **ticket_values)
+                .execution_options(synchronize_session=False)
+            )
+            if reopened.rowcount != 1:
+                db.session.rollback()
+                return jsonify({'error': 'You already have a ticket for this event'}), 400
+            new_ticket = existing_ticket
+        else:
+            new_ticket = Ticket(event_id=event.id, user_id=current_user_id, **ticket_values)
+            db.session.add(new_ticket)
+        
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
         return jsonify({'error': 'You already have a ticket for this event'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create ticket'}), 500
     
-    if event.max_attendees:
-        current_tickets = event.tickets.count()
-        if current_tickets >= event.max_attendees:
-            return jsonify({'error': 'Event is sold out'}), 400
+    db.session.refresh(new_ticket)
+    return jsonify({
+        'message': 'Ticket created successfully. Use the payment endpoint to complete purchase',
+        'ticket': new_ticket.to_dict(),
+        'hold_expires_at': hold_expires_at(new_ticket).isoformat(),
+        'next_step': {
+            'endpoint': f'/api/payments/initiate/{new_ticket.id}',
+            'method': 'POST',
+            'description': 'Call this endpoint to initiate M-Pesa payment'
+        }
+    }), 201
+
+@events_bp.post('/<event_id>/orders')
+@admission_required
+@role_required(UserRole.USER)
+def create_order(event_id):
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    event = Event.query.get(event_id)
+    
+    error = check_purchasable(event, user)
+    if error:
+        return error
     
     data = request.get_json()
     phone_number = data.get('phone_number')
@@ -277,35 +442,224 @@ def purchase_ticket(event_id):
     if not phone_number:
         return jsonify({'error': 'Phone number is required for M-Pesa payment'}), 400
     
-    commission = Ticket.calculate_commission(event.ticket_price)
-    total_amount = Ticket.calculate_total(event.ticket_price)
-    
-    new_ticket = Ticket(
+    max_quantity = int(os.environ.get('MAX_TICKETS_PER_ORDER', 20))
+    try:
+        quantity = int(data.get('quantity', 0))
+    except (TypeError, ValueError):
+        quantity = 0
+    if quantity < 1 or quantity > max_quantity:
+        return jsonify({'error': f'Quantity must be between 1 and {max_quantity}'}), 400
+    
+    tier, error = resolve_tier(event, data.get('tier'))
+    if error:
+        return error
+    
+    price = tier.price if tier else event.ticket_price
+    commission = Ticket.calculate_commission(price)
+    ticket_total = Ticket.calculate_total(price)
+    purchased_at = datetime.now(timezone.utc)
+    
+    order = Order(
+        id=str(uuid4()),
         event_id=event.id,
         user_id=current_user_id,
-        ticket_price=event.ticket_price,
-        commission=commission,
-        total_amount=total_amount,
+        tier_id=tier.id if tier else None,
+        quantity=quantity,
+        ticket_price=price,
+        commission=round(commission * quantity, 2),
+        total_amount=round(ticket_total * quantity, 2),
         payment_status=PaymentStatus.PENDING,
-        payment_phone=phone_number
+        payment_phone=phone_number,
+        purchased_at=purchased_at
     )
     
     try:
-        new_ticket.save()
+        if not allocate_seats(event, quantity=quantity, tier=tier):
+            db.session.rollback()
+            return sold_out_response(event, tier)
         
-        return jsonify({
-            'message': 'Ticket created successfully. Use the payment endpoint to complete purchase',
-            'ticket': new_ticket.to_dict(),
-            'next_step': {
-                'endpoint': f'/api/payments/initiate/{new_ticket.id}',
-                'method': 'POST',
-                'description': 'Call this endpoint to initiate M-Pesa payment'
-            }
-        }), 201
+        db.session.add(order)
+        db.session.flush()
+        db.session.execute(insert(Ticket), [{
+            'id': str(uuid4()),
+            'event_id': event.id,
+            'user_id': current_user_id,
+            'tier_id': order.tier_id,
+            'order_id': order.id,
+            'ticket_price': price,
+            'commission': commission,
+            'total_amount': ticket_total,
+            'payment_status': PaymentStatus.PENDING,
+            'payment_phone': phone_number,
+            'purchased_at': purchased_at
+        } for _ in range(quantity)])
+        db.session.commit()
     except Exception as e:
-        return jsonify({'error': 'Failed to create ticket'}), 500
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create order'}), 500
+    
+    return jsonify({
+        'message': f'Order for {quantity} tickets created. Use the payment endpoint to complete purchase',
+        'order': order.to_dict(),
+        'hold_expires_at': hold_expires_at(order).isoformat(),
+        'next_step': {
+            'endpoint': f'/api/payments/initiate-order/{order.id}',
+            'method': 'POST',
+            'description': 'Call this endpoint to initiate a single M-Pesa payment for the whole order'
+        }
+    }), 201
+
+@events_bp.post('/<event_id>/waitlist')
+@role_required(UserRole.USER)
+def join_event_waitlist(event_id):
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    event = Event.query.get(event_id)
+    
+    error = check_purchasable(event, user)
+    if error:
+        return error
+    
+    data = request.get_json()
+    phone_number = data.get('phone_number')
+    
+    if not phone_number:
+        return jsonify({'error': 'Phone number is required for M-Pesa payment'}), 400
+    
+    tier, error = resolve_tier(event, data.get('tier'))
+    if error:
+        return error
+    
+    existing_ticket = Ticket.query.filter(
+        Ticket.event_id == event_id,
+        Ticket.user_id == current_user_id,
+        Ticket.order_id.is_(None),
+        Ticket.payment_status.in_([PaymentStatus.PENDING, PaymentStatus.COMPLETED])
+    ).first()
+    if existing_ticket:
+        return jsonify({'error': 'You already have a ticket for this event'}), 400
+    
+    event_full = bool(event.max_attendees) and event.seats_taken >= event.max_attendees
+    tier_full = tier is not None and tier.capacity is not None and tier.seats_taken >= tier.capacity
+    if not event_full and not tier_full:
+        return jsonify({'error': 'Tickets are still available. Purchase one instead'}), 400
+    
+    try:
+        entry = join_waitlist(event, current_user_id, phone_number, tier=tier)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'You are already on the waitlist for this event'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to join waitlist'}), 500
+    
+    return jsonify({
+        'message': 'Added to the waitlist. A ticket is reserved for you when a seat is released',
+        'waitlist_entry': entry.to_dict(),
+        'place_in_line': waitlist_position(entry)
+    }), 201
+
+@events_bp.get('/<event_id>/waitlist/position')
+@role_required(UserRole.USER)
+def get_waitlist_position(event_id):
+    current_user_id = get_jwt_identity()
+    entry = WaitlistEntry.query.filter_by(event_id=event_id, user_id=current_user_id).order_by(
+        WaitlistEntry.position.desc()
+    ).first()
+    
+    if not entry:
+        return jsonify({'error': 'You are not on the waitlist for this event'}), 404
+    
+    response = {'waitlist_entry': entry.to_dict()}
+    if entry.status == WaitlistStatus.WAITING:
+        response['place_in_line'] = waitlist_position(entry)
+    elif entry.status == WaitlistStatus.PROMOTED:
+        response['next_step'] = {
+            'endpoint': f'/api/payments/initiate/{entry.ticket_id}',
+            'method': 'POST',
+            'description': 'A seat was released for you. Pay before the hold expires'
+        }
+    return jsonify(response), 200
+
+@events_bp.put('/<event_id>/waiting-room')
+@role_required(UserRole.LEADER)
+def configure_waiting_room(event_id):
+    current_user_id = get_jwt_identity()
+    event = Event.query.get(event_id)
+    
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    
+    if event.leader_id != current_user_id:
+        return jsonify({'error': 'You can only configure your own events'}), 403
+    
+    data = request.get_json() or {}
+    room = WaitingRoom.query.get(event_id) or WaitingRoom(event_id=event_id)
+    
+    if 'admit_rate' in data:
+        try:
+            room.admit_rate = float(data['admit_rate'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'admit_rate must be a number'}), 400
+        if room.admit_rate <= 0:
+            return jsonify({'error': 'admit_rate must be greater than zero'}), 400
+    if 'opens_at' in data:
+        try:
+            room.opens_at = datetime.fromisoformat(data['opens_at'].replace('Z', '+00:00'))
+        except (AttributeError, ValueError):
+            return jsonify({'error': 'Invalid date format'}), 400
+    if 'is_active' in data:
+        room.is_active = bool(data['is_active'])
+    
+    try:
+        db.session.add(room)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to configure waiting room'}), 500
+    
+    invalidate_gated_events()
+    return jsonify({
+        'message': 'Waiting room updated successfully',
+        'waiting_room': room.to_dict()
+    }), 200
+
+@events_bp.post('/<event_id>/queue')
+@role_required(UserRole.USER)
+def join_queue(event_id):
+    current_user_id = get_jwt_identity()
+    room = WaitingRoom.query.get(event_id)
+    
+    if not room or not room.is_active:
+        return jsonify({'error': 'This event has no active waiting room'}), 404
+    
+    try:
+        token, place, admit_at, is_new = issue_token(room, current_user_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to join queue'}), 500
+    
+    return jsonify({
+        'queue_token': token,
+        'place_in_queue': place,
+        'admit_at': datetime.fromtimestamp(admit_at, timezone.utc).isoformat(),
+        'header': 'X-Queue-Token'
+    }), 201 if is_new else 200
+
+@events_bp.get('/<event_id>/queue/stats')
+@jwt_required()
+def get_queue_stats(event_id):
+    room = WaitingRoom.query.get(event_id)
+    
+    if not room:
+        return jsonify({'error': 'This event has no waiting room'}), 404
+    
+    return jsonify(queue_stats(room)), 200
 
 @events_bp.get('/my-tickets')
+@read_only
 @role_required(UserRole.USER)
 def get_my_tickets():
     current_user_id = get_jwt_identity()
@@ -317,8 +671,15 @@ def get_my_tickets():
         Ticket.purchased_at.desc()
     ).paginate(page=page, per_page=per_page, error_out=False)
     
+    tickets = []
+    for ticket in paginated.items:
+        ticket_data = ticket.to_dict()
+        if ticket.payment_status == PaymentStatus.COMPLETED:
+            ticket_data['ticket_code'] = ticket_code(ticket)
+        tickets.append(ticket_data)
+    
     return jsonify({
-        'tickets': [ticket.to_dict() for ticket in paginated.items],
+        'tickets': tickets,
         'total': paginated.total,
         'page': paginated.page,
         'per_page': paginated.per_page,
@@ -326,6 +687,7 @@ def get_my_tickets():
     }), 200
 
 @events_bp.get('/<event_id>/tickets')
+@query_budget(3)
 @role_required(UserRole.LEADER)
 def get_event_tickets(event_id):
     current_user_id = get_jwt_identity()
@@ -337,13 +699,68 @@ def get_event_tickets(event_id):
     if event.leader_id != current_user_id:
         return jsonify({'error': 'You can only view tickets for your own events'}), 403
     
-    tickets = Ticket.query.filter_by(event_id=event_id).all()
+    return jsonify(event_ticket_listing(event)), 200
+
+
+@events_bp.post('/<event_id>/check-ins')
+@role_required(UserRole.LEADER)
+def upload_check_ins(event_id):
+    current_user_id = get_jwt_identity()
+    event = Event.query.get(event_id)
     
-    return jsonify({
-        'event_title': event.title,
-        'tickets': [ticket.to_dict() for ticket in tickets],
-        'total_tickets': len(tickets),
-        'total_revenue': sum(ticket.ticket_price for ticket in tickets if ticket.payment_status == PaymentStatus.COMPLETED),
-        'total_commission': sum(ticket.commission for ticket in tickets if ticket.payment_status == PaymentStatus.COMPLETED)
-    }), 200
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    
+    if event.leader_id != current_user_id:
+        return jsonify({'error': 'You can only check in attendees for your own events'}), 403
+    
+    data = request.get_json() or {}
+    scans = data.get('check_ins')
+    max_batch = int(os.environ.get('CHECK_IN_MAX_BATCH', 1000))
+    
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'error': 'check_ins must be a non-empty list'}), 400
+    if len(scans) > max_batch:
+        return jsonify({'error': f'At most {max_batch} check-ins per upload'}), 400
+    
+    try:
+        result = record_check_ins(event_id, scans, device_id=data.get('device_id'))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to record check-ins'}), 500
+    
+    return jsonify(result), 200
+
+@events_bp.get('/<event_id>/check-in-manifest')
+@role_required(UserRole.LEADER)
+def get_check_in_manifest(event_id):
+    current_user_id = get_jwt_identity()
+    event = Event.query.get(event_id)
+    
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    
+    if event.leader_id != current_user_id:
+        return jsonify({'error': 'You can only download manifests for your own events'}), 403
+    
+    try:
+        manifest = current_manifest(event_id)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to build manifest'}), 500
+    
+    return current_app.response_class(manifest.payload, mimetype='application/json'), 200
+
+@events_bp.cli.command('expire-holds')
+@click.option('--batch-size', default=500, type=int, help='Tickets expired per transaction')
+def expire_holds_command(batch_size):
+    """Release seats held by PENDING tickets whose reservation has lapsed."""
+    expired = expire_stale_holds(batch_size=batch_size)
+    click.echo(f"Expired {expired} abandoned ticket holds")
 
+@events_bp.cli.command('resync-seats')
+def resync_seats_command():
+    """Recompute every event's seats_taken counter from its tickets."""
+    updated = resync_seats_taken()
+    click.echo(f"Recomputed seats_taken for {updated} events")
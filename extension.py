@@ -1,7 +1,14 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
-migrate = Migrate()
\ No newline at end of file
+
+
+def init_migrate(app):
+    """Register Flask-Migrate (and the `flask db` commands). Imported here
+    rather than at module level because it pulls in Alembic, which serving
+    workers never need."""
+    from flask_migrate import Migrate
+    Migrate(app, db)
\ No newline at end of file
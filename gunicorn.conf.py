@@ -0,0 +1,64 @@
+"""
+Gunicorn settings, from the environment.
+
+GUNICORN_WORKER_CLASS picks the worker model:
+
+    sync     - one request per worker process (the default)
+    gthread  - GUNICORN_THREADS requests per worker, one OS thread each
+    gevent   - up to GUNICORN_WORKER_CONNECTIONS requests per worker as
+               greenlets; a request waiting on Daraja or the database
+               costs a greenlet instead of a process
+
+Payment requests mostly wait on Daraja, so gthread and gevent keep many in
+flight per worker. In those modes MPESA_MAX_CONCURRENT (the bulkhead around
+Daraja calls) defaults to the worker's request capacity instead of 8, and
+the database pool should be sized for the requests that need a connection
+at the same time (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+
+gevent needs the gevent and psycogreen packages. psycopg2 is a C extension
+that would block the whole worker on every query, so psycogreen's wait
+callback is installed in each worker after gevent has patched the standard
+library. preload_app stays off so the app, its locks and its connection
+pools are created after that patching.
+"""
+
+import glob
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 16 if worker_class == 'gthread' else 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+preload_app = False
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+
+# gevent ignores threads; gunicorn runs a sync worker with more than one
+# thread as gthread
+if worker_class == 'gevent':
+    os.environ.setdefault('MPESA_MAX_CONCURRENT', str(max(8, worker_connections // 2)))
+elif worker_class == 'gthread' or threads > 1:
+    os.environ.setdefault('MPESA_MAX_CONCURRENT', str(threads))
+
+
+def on_starting(server):
+    # Snapshots left by a previous deployment's workers would be merged into
+    # this one's /metrics totals
+    directory = os.environ.get('METRICS_MULTIPROC_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            os.remove(path)
+
+
+def post_worker_init(worker):
+    if worker_class != 'gevent':
+        return
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        worker.log.warning('psycogreen is not installed; PostgreSQL queries will block the gevent worker')
+        return
+    patch_psycopg()
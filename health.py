@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from flask import Blueprint, current_app, jsonify
+from extension import db
+from auth import internal_access_required
+from db_pool import pool_snapshot
+from db_routing import REPLICA_BIND_KEY
+from payments import mpesa
+
+health_bp = Blueprint('health', __name__)
+
+_ready_lock = threading.Lock()
+_ready = {'ok': None, 'error': None, 'checked_at': 0.0, 'expires_at': 0.0}
+_script_heads = None
+
+
+def ready_cache_seconds():
+    """How long a readiness result is reused before the database is asked again."""
+    return float(os.environ.get('HEALTH_READY_CACHE_SECONDS', 5))
+
+
+def _timestamp():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _ping_database():
+    with db.engine.connect() as connection:
+        connection.execute(db.text('SELECT 1'))
+
+
+def database_ready():
+    """
+    Cached database check for readiness probes. Within the cache window every
+    probe reuses the last result; when it expires one probe runs SELECT 1
+    while the others keep answering from the previous result instead of
+    queueing for a connection behind it.
+    """
+    if time.monotonic() < _ready['expires_at']:
+        return dict(_ready)
+    if not _ready_lock.acquire(blocking=_ready['ok'] is None):
+        return dict(_ready)
+    try:
+        if time.monotonic() < _ready['expires_at']:
+            return dict(_ready)
+        try:
+            _ping_database()
+            ok, error = True, None
+        except Exception as e:
+            ok, error = False, type(e).__name__
+        checked_at = time.monotonic()
+        _ready.update(ok=ok, error=error, checked_at=checked_at, expires_at=checked_at + ready_cache_seconds())
+        return dict(_ready)
+    finally:
+        _ready_lock.release()
+
+
+def _timed(check):
+    """Run one diagnostic check, recording how long it took and turning any
+    exception into a failed result. Only the exception class is returned;
+    the message, which can carry hostnames or SQL, goes to the log."""
+    start = time.perf_counter()
+    try:
+        result = check()
+    except Exception as e:
+        current_app.logger.warning('Health check %s failed', check.__name__, exc_info=True)
+        result = {'status': 'fail', 'error': type(e).__name__}
+    result['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+    return result
+
+
+def check_database():
+    _ping_database()
+    return {'status': 'ok'}
+
+
+def check_pool():
+    pools = {'primary': pool_snapshot(db.engine)}
+    replica = db.engines.get(REPLICA_BIND_KEY)
+    if replica is not None:
+        pools['replica'] = pool_snapshot(replica)
+    # Checkouts that gave up waiting mean requests are already failing for want of a connection
+    saturated = any(snapshot.get('timeouts') for snapshot in pools.values())
+    return {'status': 'warn' if saturated else 'ok', 'pools': pools}
+
+
+def _migration_heads():
+    """Heads of the migration scripts shipped with this build. Alembic is
+    only loaded here, on the first diagnostics request."""
+    global _script_heads
+    if _script_heads is None:
+        from alembic.script import ScriptDirectory
+        scripts = ScriptDirectory(os.path.join(current_app.root_path, 'migrations'))
+        _script_heads = sorted(scripts.get_heads())
+    return _script_heads
+
+
+def check_migrations():
+    from alembic.runtime.migration import MigrationContext
+    expected = _migration_heads()
+    with db.engine.connect() as connection:
+        current = sorted(MigrationContext.configure(connection).get_current_heads())
+    if not current:
+        status = 'unversioned'
+    elif current == expected:
+        status = 'ok'
+    else:
+        status = 'warn'
+    return {'status': status, 'current': current, 'expected': expected}
+
+
+def check_mpesa():
+    breaker = mpesa.breaker.snapshot()
+    bulkhead = mpesa.bulkhead.snapshot()
+    if breaker['state'] == mpesa.breaker.OPEN:
+        status = 'fail'
+    elif breaker['state'] == mpesa.breaker.HALF_OPEN or bulkhead['in_flight'] >= bulkhead['max_concurrent']:
+        status = 'warn'
+    else:
+        status = 'ok'
+    return {'status': status, 'circuit_breaker': breaker, 'bulkhead': bulkhead}
+
+
+@health_bp.get('/live')
+def liveness():
+    """The process is up and serving requests; no I/O."""
+    return jsonify({'status': 'alive', 'pid': os.getpid(), 'timestamp': _timestamp()}), 200
+
+
+@health_bp.get('')
+@health_bp.get('/ready')
+def readiness():
+    result = database_ready()
+    body = {
+        'status': 'healthy' if result['ok'] else 'unhealthy',
+        'timestamp': _timestamp(),
+        'checked_seconds_ago': round(time.monotonic() - result['checked_at'], 3)
+    }
+    if not result['ok']:
+        body['error'] = 'Database connection failed'
+        return jsonify(body), 503
+    return jsonify(body), 200
+
+
+@health_bp.get('/details')
+@internal_access_required
+def details():
+    """
+    Uncached diagnostics for operators: database round trip, connection pool
+    usage, applied vs shipped migration heads and the M-Pesa circuit breaker
+    and bulkhead, each with its own timing. Only a failed database check
+    makes the instance unhealthy; M-Pesa trouble or a pending migration
+    reports as degraded. Admins or holders of the internal token only.
+    """
+    start = time.perf_counter()
+    checks = {
+        'database': _timed(check_database),
+        'pool': _timed(check_pool),
+        'migrations': _timed(check_migrations),
+        'mpesa': _timed(check_mpesa)
+    }
+    if checks['database']['status'] == 'fail':
+        status = 'unhealthy'
+    elif any(check['status'] != 'ok' for check in checks.values()):
+        status = 'degraded'
+    else:
+        status = 'healthy'
+    return jsonify({
+        'status': status,
+        'timestamp': _timestamp(),
+        'pid': os.getpid(),
+        'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+        'checks': checks
+    }), 503 if status == 'unhealthy' else 200
@@ -0,0 +1,63 @@
+import os
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+class IsoJSONProvider(DefaultJSONProvider):
+    """
+    Flask's stdlib provider, except that datetimes are written in ISO 8601
+    like everything the models already return, and like orjson does. Listing
+    routes pass raw datetimes straight from database rows.
+    """
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (datetime, date)):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+
+class OrjsonProvider(IsoJSONProvider):
+    """
+    Encodes responses with orjson, which writes bytes directly and handles
+    datetimes, enums and uuids natively. Output matches IsoJSONProvider:
+    keys sorted when `sort_keys` is set, indented in debug mode, and other
+    types passed to Flask's default handler.
+    """
+
+    def _option(self, indent=None):
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self._option(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = orjson.dumps(obj, default=self.default, option=self._option(indent))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def init_json(app):
+    """
+    Select the JSON provider: JSON_PROVIDER=orjson (the default when orjson
+    is installed) or stdlib.
+    """
+    choice = os.environ.get('JSON_PROVIDER', 'orjson').lower()
+    if choice == 'orjson' and orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = IsoJSONProvider(app)
@@ -0,0 +1,152 @@
+from math import ceil
+from sqlalchemy import func, select
+from extension import db
+from models import Event, Ticket, TicketTier, User, UserRole, PaymentStatus
+
+# Listing routes select plain column tuples and build the response dicts
+# directly: no ORM instances, identity map or relationship loading, and
+# datetimes are left for the JSON provider to encode. The dicts match the
+# models' to_dict() output.
+
+EVENT_COLUMNS = (
+    Event.id, Event.title, Event.description, Event.event_date, Event.location, Event.ticket_price,
+    Event.vip_price, Event.vvip_price, Event.max_attendees, Event.banner_url, Event.renewal_period,
+    Event.status, Event.leader_id, Event.seats_taken, Event.created_at, Event.updated_at,
+    User.username.label('leader_name'), User.club_name.label('leader_club_name'),
+    User.role.label('leader_role'), User.club_access_code.label('leader_club_access_code')
+)
+
+TIER_COLUMNS = (
+    TicketTier.event_id, TicketTier.id, TicketTier.name, TicketTier.price, TicketTier.capacity,
+    TicketTier.seats_taken
+)
+
+TICKET_COLUMNS = (
+    Ticket.id, Ticket.event_id, Ticket.user_id, User.username, Ticket.tier_id, Ticket.order_id,
+    Ticket.ticket_price, Ticket.commission, Ticket.total_amount, Ticket.payment_status,
+    Ticket.mpesa_receipt, Ticket.purchased_at
+)
+
+
+def _page_args(page, per_page):
+    # Same fallbacks as Flask-SQLAlchemy's paginate(error_out=False)
+    return (page if page and page > 0 else 1), (per_page if per_page and per_page > 0 else 20)
+
+
+def tier_rows(event_ids):
+    """Tier dicts for a page of events in one query, grouped by event id."""
+    tiers_by_event = {event_id: [] for event_id in event_ids}
+    if not event_ids:
+        return tiers_by_event
+    rows = db.session.execute(
+        select(*TIER_COLUMNS).where(TicketTier.event_id.in_(event_ids))
+        .order_by(TicketTier.event_id, TicketTier.price)
+    )
+    for event_id, tier_id, name, price, capacity, seats_taken in rows:
+        tiers_by_event[event_id].append({
+            'id': tier_id,
+            'name': name,
+            'price': price,
+            'capacity': capacity,
+            'seats_taken': seats_taken,
+            'seats_available': None if capacity is None else max(0, capacity - seats_taken)
+        })
+    return tiers_by_event
+
+
+def event_listing(criteria, page, per_page):
+    """
+    One page of events matching `criteria`, newest event date first, as the
+    listing response body. Three queries: the count, the page joined to its
+    leader with tickets sold as a correlated subquery, and the tiers.
+    """
+    page, per_page = _page_args(page, per_page)
+    total = db.session.execute(select(func.count(Event.id)).where(*criteria)).scalar()
+
+    # Pick the page's ids first so the ticket count only runs for those rows,
+    # not for every matching event before the sort
+    page_ids = (
+        select(Event.id).where(*criteria).order_by(Event.event_date.desc())
+        .limit(per_page).offset((page - 1) * per_page).subquery()
+    )
+    tickets_sold = select(func.count()).where(Ticket.event_id == Event.id).correlate(Event).scalar_subquery()
+    rows = db.session.execute(
+        select(*EVENT_COLUMNS, tickets_sold.label('tickets_sold'))
+        .join(page_ids, page_ids.c.id == Event.id)
+        .outerjoin(User, User.id == Event.leader_id)
+        .order_by(Event.event_date.desc())
+    ).all()
+    tiers_by_event = tier_rows([row.id for row in rows])
+
+    events = []
+    for row in rows:
+        event = {
+            'id': row.id,
+            'title': row.title,
+            'description': row.description,
+            'event_date': row.event_date,
+            'location': row.location,
+            'ticket_price': row.ticket_price,
+            'vip_price': row.vip_price,
+            'vvip_price': row.vvip_price,
+            'max_attendees': row.max_attendees,
+            'banner_url': row.banner_url,
+            'renewal_period': row.renewal_period,
+            'status': row.status.value,
+            'leader_id': row.leader_id,
+            'leader_name': row.leader_name,
+            'club_name': row.leader_club_name if row.leader_role == UserRole.LEADER else None,
+            'tickets_sold': row.tickets_sold,
+            'seats_taken': row.seats_taken,
+            'tiers': tiers_by_event[row.id],
+            'created_at': row.created_at,
+            'updated_at': row.updated_at
+        }
+        # Club access code for join functionality
+        if row.leader_club_access_code:
+            event['club_access_code'] = row.leader_club_access_code
+        events.append(event)
+
+    return {
+        'events': events,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': ceil(total / per_page) if total else 0
+    }
+
+
+def event_ticket_listing(event):
+    """Every ticket of `event` with its buyer's username, and the revenue totals."""
+    rows = db.session.execute(
+        select(*TICKET_COLUMNS).outerjoin(User, User.id == Ticket.user_id).where(Ticket.event_id == event.id)
+    )
+    tickets = []
+    revenue = 0
+    commission = 0
+    for row in rows:
+        if row.payment_status == PaymentStatus.COMPLETED:
+            revenue += row.ticket_price
+            commission += row.commission
+        tickets.append({
+            'id': row.id,
+            'event_id': row.event_id,
+            'event_title': event.title,
+            'user_id': row.user_id,
+            'username': row.username,
+            'tier_id': row.tier_id,
+            'order_id': row.order_id,
+            'ticket_price': row.ticket_price,
+            'commission': row.commission,
+            'total_amount': row.total_amount,
+            'payment_status': row.payment_status.value,
+            'mpesa_receipt': row.mpesa_receipt,
+            'purchased_at': row.purchased_at
+        })
+    return {
+        'event_title': event.title,
+        'tickets': tickets,
+        'total_tickets': len(tickets),
+        'total_revenue': revenue,
+        'total_commission': commission
+    }
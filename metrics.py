@@ -0,0 +1,273 @@
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from auth import internal_access_required
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by route and status code', None),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by route', LATENCY_BUCKETS),
+    'db_queries_per_request': ('histogram', 'SQL statements executed per HTTP request', QUERY_COUNT_BUCKETS),
+    'db_queries_total': ('counter', 'SQL statements executed by route', None),
+    'mpesa_requests_total': ('counter', 'Daraja API calls by operation and outcome', None),
+    'mpesa_request_duration_seconds': ('histogram', 'Daraja API call latency by operation', UPSTREAM_BUCKETS),
+}
+
+
+class _Shard:
+    """One thread's metric values. Only its own thread writes to it, so
+    recording needs no lock; collection sums every shard."""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+_local = threading.local()
+_green_shard = None
+_shards = []
+_shards_lock = threading.Lock()
+_writer_pid = None
+
+
+def _green():
+    """True in a gevent worker, where threading.local is per greenlet."""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def _new_shard():
+    shard = _Shard()
+    with _shards_lock:
+        _shards.append(shard)
+    return shard
+
+
+def _shard():
+    global _green_shard
+    if _green():
+        # Greenlets share one OS thread and only switch on I/O, never inside
+        # inc() or observe(), so they share one shard instead of leaving one
+        # behind per request
+        if _green_shard is None:
+            _green_shard = _new_shard()
+        return _green_shard
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = _new_shard()
+    return shard
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    counters = _shard().counters
+    key = (name, _labels(labels))
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    histograms = _shard().histograms
+    key = (name, _labels(labels))
+    buckets = METRICS[name][2]
+    values = histograms.get(key)
+    if values is None:
+        # One slot per bucket, one for +Inf, then the running sum
+        values = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+    values[bisect_left(buckets, value)] += 1
+    values[-1] += value
+
+
+def _copy(mapping):
+    # Another thread may insert a new key mid-copy; retry until it is stable
+    while True:
+        try:
+            return list(mapping.items())
+        except RuntimeError:
+            continue
+
+
+def collect():
+    """Sum every thread's shard into one snapshot for this process."""
+    counters = {}
+    histograms = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for key, value in _copy(shard.counters):
+            counters[key] = counters.get(key, 0) + value
+        for key, values in _copy(shard.histograms):
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = list(values)
+            else:
+                histograms[key] = [a + b for a, b in zip(merged, values)]
+    return {'counters': counters, 'histograms': histograms}
+
+
+def _multiproc_dir():
+    return os.environ.get('METRICS_MULTIPROC_DIR')
+
+
+def _dump(snapshot):
+    return {
+        kind: [[name, [list(pair) for pair in labels], value] for (name, labels), value in values.items()]
+        for kind, values in snapshot.items()
+    }
+
+
+def _load(data):
+    return {
+        kind: {(name, tuple(tuple(pair) for pair in labels)): value for name, labels, value in data.get(kind, [])}
+        for kind in ('counters', 'histograms')
+    }
+
+
+def write_snapshot():
+    """Write this worker's totals to METRICS_MULTIPROC_DIR/metrics-<pid>.json
+    atomically, so any worker serving /metrics can merge all of them."""
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as handle:
+        json.dump(_dump(collect()), handle)
+    os.replace(tmp_path, path)
+
+
+def _start_writer():
+    """Start the periodic snapshot writer once per worker process (after any
+    fork, which is why it is started from the first request)."""
+    global _writer_pid
+    if _writer_pid == os.getpid() or not _multiproc_dir():
+        return
+    _writer_pid = os.getpid()
+    interval = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot()
+            except OSError:
+                pass
+
+    threading.Thread(target=run, name='metrics-writer', daemon=True).start()
+
+
+def aggregate():
+    """Totals across all workers when METRICS_MULTIPROC_DIR is set; this
+    process's own values otherwise. Files of exited workers are kept so
+    counters never go backwards."""
+    directory = _multiproc_dir()
+    if not directory:
+        return collect()
+    write_snapshot()
+    merged = {'counters': {}, 'histograms': {}}
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+        try:
+            with open(path) as handle:
+                snapshot = _load(json.load(handle))
+        except (OSError, ValueError):
+            continue
+        for key, value in snapshot['counters'].items():
+            merged['counters'][key] = merged['counters'].get(key, 0) + value
+        for key, values in snapshot['histograms'].items():
+            existing = merged['histograms'].get(key)
+            merged['histograms'][key] = values if existing is None else [a + b for a, b in zip(existing, values)]
+    return merged
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+def render(snapshot):
+    """Prometheus text exposition format 0.0.4."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        source = snapshot['counters'] if kind == 'counter' else snapshot['histograms']
+        series = sorted((labels, value) for (metric, labels), value in source.items() if metric == name)
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind == 'counter':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets, value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", _format_bound(bound))])} {cumulative}')
+            cumulative += value[len(buckets)]
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value[-1]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.metrics_db_queries = g.get('metrics_db_queries', 0) + 1
+
+
+def record_upstream_call(operation, outcome, duration):
+    inc('mpesa_requests_total', operation=operation, outcome=outcome)
+    observe('mpesa_request_duration_seconds', duration, operation=operation)
+
+
+def init_metrics(app):
+    """Time every request and serve the totals at /metrics."""
+
+    @app.before_request
+    def start_request_timer():
+        _start_writer()
+        g.metrics_started_at = time.perf_counter()
+        g.metrics_db_queries = 0
+
+    @app.after_request
+    def record_request(response):
+        started_at = g.get('metrics_started_at')
+        if started_at is None:
+            return response
+        # The URL rule template keeps label cardinality bounded
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        blueprint = request.blueprint or ''
+        queries = g.get('metrics_db_queries', 0)
+        inc('http_requests_total', blueprint=blueprint, route=route, method=request.method,
+            status=str(response.status_code))
+        observe('http_request_duration_seconds', time.perf_counter() - started_at,
+                blueprint=blueprint, route=route, method=request.method)
+        observe('db_queries_per_request', queries, blueprint=blueprint, route=route)
+        if queries:
+            inc('db_queries_total', queries, blueprint=blueprint, route=route)
+        return response
+
+    @app.get('/metrics')
+    @internal_access_required
+    def metrics_endpoint():
+        return Response(render(aggregate()), mimetype='text/plain; version=0.0.4')
@@ -5,6 +5,8 @@ from flask import current_app
 
 from alembic import context
 
+from db_pool import lift_statement_timeout
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -104,6 +106,8 @@ def run_migrations_online():
         )
 
         with context.begin_transaction():
+            # Long data migrations must not be cut off by DB_STATEMENT_TIMEOUT_MS
+            lift_statement_timeout(connection)
             context.run_migrations()
 
 
@@ -0,0 +1,31 @@
+"""one waiting waitlist entry per user instead of one entry ever
+
+Revision ID: 8d4b2f6e1a73
+Revises: 6f3b9d2a8c47
+Create Date: 2025-11-18 10:21:44.120385
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4b2f6e1a73'
+down_revision = '6f3b9d2a8c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('waitlist_entries', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_waitlist_entries_event_id_user_id', type_='unique')
+        batch_op.create_index('uq_waitlist_entries_event_id_user_id_waiting', ['event_id', 'user_id'], unique=True,
+                              postgresql_where=sa.text("status = 'WAITING'"),
+                              sqlite_where=sa.text("status = 'WAITING'"))
+
+
+def downgrade():
+    # Fails if a user has rejoined an event's waitlist since the upgrade
+    with op.batch_alter_table('waitlist_entries', schema=None) as batch_op:
+        batch_op.drop_index('uq_waitlist_entries_event_id_user_id_waiting')
+        batch_op.create_unique_constraint('uq_waitlist_entries_event_id_user_id', ['event_id', 'user_id'])
@@ -0,0 +1,31 @@
+"""ticket hold expiry
+
+Revision ID: a4f2c8d91e37
+Revises: 7c1e9a2b4d10
+Create Date: 2025-11-04 16:47:09.114952
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f2c8d91e37'
+down_revision = '7c1e9a2b4d10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE paymentstatus ADD VALUE IF NOT EXISTS 'EXPIRED'")
+
+    with op.batch_alter_table('tickets', schema=None) as batch_op:
+        batch_op.create_index('ix_tickets_event_id_payment_status_purchased_at', ['event_id', 'payment_status', 'purchased_at'], unique=False)
+
+
+def downgrade():
+    # PostgreSQL cannot drop a value from an enum type; EXPIRED is left in place
+    with op.batch_alter_table('tickets', schema=None) as batch_op:
+        batch_op.drop_index('ix_tickets_event_id_payment_status_purchased_at')
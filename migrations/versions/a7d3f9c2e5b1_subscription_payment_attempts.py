@@ -0,0 +1,38 @@
+"""club subscription payment request time and renewal attempts
+
+Revision ID: a7d3f9c2e5b1
+Revises: 9e5c3a7b2d84
+Create Date: 2025-11-18 15:26:41.093218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d3f9c2e5b1'
+down_revision = '9e5c3a7b2d84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('club_subscriptions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('payment_requested_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('renewal_attempts', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_club_subscriptions_payment_status_payment_requested_at',
+                              ['payment_status', 'payment_requested_at'], unique=False)
+
+    # Payments already pending have no request time; count from creation so
+    # reconciliation picks them up
+    op.execute(
+        "UPDATE club_subscriptions SET payment_requested_at = created_at "
+        "WHERE payment_status = 'pending'"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('club_subscriptions', schema=None) as batch_op:
+        batch_op.drop_index('ix_club_subscriptions_payment_status_payment_requested_at')
+        batch_op.drop_column('renewal_attempts')
+        batch_op.drop_column('payment_requested_at')
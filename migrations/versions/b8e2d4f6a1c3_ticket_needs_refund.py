@@ -0,0 +1,27 @@
+"""needs_refund payment status
+
+Revision ID: b8e2d4f6a1c3
+Revises: a7d3f9c2e5b1
+Create Date: 2025-11-21 10:12:37.560418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2d4f6a1c3'
+down_revision = 'a7d3f9c2e5b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE paymentstatus ADD VALUE IF NOT EXISTS 'NEEDS_REFUND'")
+
+
+def downgrade():
+    # PostgreSQL cannot drop a value from an enum type; NEEDS_REFUND is left in place
+    pass
@@ -0,0 +1,73 @@
+"""event seats_taken counter and one ticket per user per event
+
+Revision ID: d5a7b3e2c914
+Revises: c83d5e0f6a21
+Create Date: 2025-11-08 14:05:52.903117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5a7b3e2c914'
+down_revision = 'c83d5e0f6a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('seats_taken', sa.Integer(), server_default='0', nullable=False))
+
+    # The check-then-insert race in purchase_ticket left some users with
+    # several tickets for one event. Keep one per user and event before the
+    # unique constraint goes on: a paid ticket over a held one over the rest,
+    # then the earliest. Only unpaid duplicates are deleted; a second paid
+    # ticket carries an M-Pesa receipt, so the migration stops and lists
+    # those for a manual refund instead of destroying the payment record
+    ranked = (
+        "SELECT id, event_id, user_id, payment_status, mpesa_receipt, ROW_NUMBER() OVER ("
+        "PARTITION BY event_id, user_id "
+        "ORDER BY CASE payment_status WHEN 'COMPLETED' THEN 0 WHEN 'PENDING' THEN 1 ELSE 2 END, "
+        "purchased_at, id"
+        ") AS duplicate_rank FROM tickets"
+    )
+    paid_duplicates = op.get_bind().execute(sa.text(
+        f"SELECT id, event_id, user_id, payment_status, mpesa_receipt FROM ({ranked}) ranked "
+        "WHERE duplicate_rank > 1 "
+        "AND (payment_status IN ('COMPLETED', 'REFUNDED') OR mpesa_receipt IS NOT NULL) "
+        "ORDER BY event_id, user_id"
+    )).all()
+    if paid_duplicates:
+        listing = '\n'.join(
+            f"  ticket {row.id} (event {row.event_id}, user {row.user_id}, "
+            f"{row.payment_status}, receipt {row.mpesa_receipt})"
+            for row in paid_duplicates
+        )
+        raise RuntimeError(
+            f"{len(paid_duplicates)} duplicate tickets were paid and cannot be removed automatically. "
+            f"Refund them, record their receipts and remove the extra tickets, then run this "
+            f"migration again:\n{listing}"
+        )
+
+    op.execute(
+        f"DELETE FROM tickets WHERE id IN (SELECT id FROM ({ranked}) ranked WHERE duplicate_rank > 1)"
+    )
+
+    op.execute(
+        "UPDATE events SET seats_taken = ("
+        "SELECT count(*) FROM tickets WHERE tickets.event_id = events.id "
+        "AND tickets.payment_status IN ('PENDING', 'COMPLETED'))"
+    )
+
+    with op.batch_alter_table('tickets', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_tickets_event_id_user_id', ['event_id', 'user_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('tickets', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_tickets_event_id_user_id', type_='unique')
+
+    with op.batch_alter_table('events', schema=None) as batch_op:
+        batch_op.drop_column('seats_taken')
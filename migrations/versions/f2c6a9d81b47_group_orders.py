@@ -0,0 +1,69 @@
+"""group orders
+
+Revision ID: f2c6a9d81b47
+Revises: e19b4c6d2f58
+Create Date: 2025-11-12 17:22:04.418390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c6a9d81b47'
+down_revision = 'e19b4c6d2f58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    paymentstatus = sa.Enum('PENDING', 'COMPLETED', 'FAILED', 'REFUNDED', 'EXPIRED', name='paymentstatus', create_type=False)
+    op.create_table('orders',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('event_id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('tier_id', sa.String(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('ticket_price', sa.Float(), nullable=False),
+    sa.Column('commission', sa.Float(), nullable=False),
+    sa.Column('total_amount', sa.Float(), nullable=False),
+    sa.Column('payment_status', paymentstatus, nullable=False),
+    sa.Column('mpesa_receipt', sa.String(length=100), nullable=True),
+    sa.Column('payment_phone', sa.String(length=20), nullable=True),
+    sa.Column('checkout_request_id', sa.String(length=100), nullable=True),
+    sa.Column('purchased_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['event_id'], ['events.id'], ),
+    sa.ForeignKeyConstraint(['tier_id'], ['ticket_tiers.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_orders_checkout_request_id'), ['checkout_request_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_orders_event_id'), ['event_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_orders_user_id'), ['user_id'], unique=False)
+
+    with op.batch_alter_table('tickets', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('order_id', sa.String(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_tickets_order_id'), ['order_id'], unique=False)
+        batch_op.create_foreign_key('fk_tickets_order_id_orders', 'orders', ['order_id'], ['id'])
+        # Group-order tickets share a user; the one-per-user rule now covers single tickets only
+        batch_op.drop_constraint('uq_tickets_event_id_user_id', type_='unique')
+        batch_op.create_index('uq_tickets_event_id_user_id', ['event_id', 'user_id'], unique=True,
+                              postgresql_where=sa.text('order_id IS NULL'),
+                              sqlite_where=sa.text('order_id IS NULL'))
+
+
+def downgrade():
+    with op.batch_alter_table('tickets', schema=None) as batch_op:
+        batch_op.drop_index('uq_tickets_event_id_user_id')
+        batch_op.create_unique_constraint('uq_tickets_event_id_user_id', ['event_id', 'user_id'])
+        batch_op.drop_constraint('fk_tickets_order_id_orders', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_tickets_order_id'))
+        batch_op.drop_column('order_id')
+
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_orders_user_id'))
+        batch_op.drop_index(batch_op.f('ix_orders_event_id'))
+        batch_op.drop_index(batch_op.f('ix_orders_checkout_request_id'))
+
+    op.drop_table('orders')
@@ -25,6 +25,9 @@ class User(db.Model):
     subscription_expires_at = db.Column(db.DateTime, nullable=True)
     club_access_code = db.Column(db.String(10), unique=True, nullable=True)
     
+    # Bumped on every write to the user's club subscriptions; backs the ETag of /api/user/subscriptions
+    subscriptions_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    
     # Relationships  
     leader_id = db.Column(db.String(), db.ForeignKey('users.id'), nullable=True)
     club_members = db.relationship('User', backref='leader', remote_side=[id], foreign_keys='User.leader_id', lazy='select')
@@ -56,9 +59,8 @@ class User(db.Model):
     
     @staticmethod
     def generate_club_code():
-        import random
-        import string
-        return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+        from club_codes import generate_club_code
+        return generate_club_code()
     
     def to_dict(self):
         data = {
@@ -169,6 +171,10 @@ class Event(db.Model):
     vip_price = db.Column(db.Float, nullable=True)
     vvip_price = db.Column(db.Float, nullable=True)
     max_attendees = db.Column(db.Integer, nullable=True)
+    # PENDING + COMPLETED tickets; only ever changed with conditional UPDATEs
+    seats_taken = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # Last waitlist position handed out; positions are contiguous per event
+    waitlist_tail = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     banner_url = db.Column(db.Text, nullable=True)
     renewal_period = db.Column(db.String(20), default='monthly')
     status = db.Column(db.Enum(EventStatus), default=EventStatus.PENDING, nullable=False)
@@ -179,8 +185,15 @@ class Event(db.Model):
     
     leader = db.relationship('User', backref='events', foreign_keys=[leader_id])
     tickets = db.relationship('Ticket', backref='event', lazy='dynamic', cascade='all, delete-orphan')
+    tiers = db.relationship('TicketTier', backref='event', lazy='select', cascade='all, delete-orphan',
+                            order_by='TicketTier.price')
     
-    def to_dict(self):
+    def to_dict(self, tiers=None, tickets_sold=None):
+        """Pass `tiers` and `tickets_sold` when they were preloaded for a whole page of events."""
+        if tiers is None:
+            tiers = self.tiers
+        if tickets_sold is None:
+            tickets_sold = self.tickets.count()
         return {
             'id': self.id,
             'title': self.title,
@@ -197,7 +210,9 @@ class Event(db.Model):
             'leader_id': self.leader_id,
             'leader_name': self.leader.username if self.leader else None,
             'club_name': self.leader.club_name if self.leader and self.leader.role == UserRole.LEADER else None,
-            'tickets_sold': self.tickets.count(),
+            'tickets_sold': tickets_sold,
+            'seats_taken': self.seats_taken,
+            'tiers': [tier.to_dict() for tier in tiers],
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -211,24 +226,123 @@ class Event(db.Model):
             raise e
     
     def delete(self):
+        """Delete the event with everything that refers to it. The foreign
+        keys to events have no ON DELETE CASCADE, so dependent rows go first
+        in bulk DELETEs, children before parents; the ORM cascade then
+        removes the tiers."""
+        from club_models import LuckyWinner
         try:
+            for model in (CheckIn, CheckInManifest, QueuePlace, WaitingRoom, WaitlistEntry, LuckyWinner, Ticket, Order):
+                db.session.execute(
+                    db.delete(model).where(model.event_id == self.id)
+                    .execution_options(synchronize_session=False)
+                )
             db.session.delete(self)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             raise e
 
+class TicketTier(db.Model):
+    __tablename__ = "ticket_tiers"
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'name', name='uq_ticket_tiers_event_id_name'),
+    )
+    id = db.Column(db.String(), primary_key=True, default=lambda: str(uuid4()))
+    event_id = db.Column(db.String(), db.ForeignKey('events.id'), nullable=False, index=True)
+    name = db.Column(db.String(50), nullable=False)
+    price = db.Column(db.Float, nullable=False, default=0.0)
+    # None means the tier is only bounded by the event's max_attendees
+    capacity = db.Column(db.Integer, nullable=True)
+    seats_taken = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    
+    DEFAULT_NAME = 'regular'
+    
+    @classmethod
+    def from_event_prices(cls, ticket_price, vip_price=None, vvip_price=None):
+        """Tiers for events created with the legacy flat price fields."""
+        tiers = [cls(name=cls.DEFAULT_NAME, price=ticket_price or 0.0)]
+        if vip_price:
+            tiers.append(cls(name='vip', price=vip_price))
+        if vvip_price:
+            tiers.append(cls(name='vvip', price=vvip_price))
+        return tiers
+    
+    def seats_available(self):
+        if self.capacity is None:
+            return None
+        return max(0, self.capacity - self.seats_taken)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'price': self.price,
+            'capacity': self.capacity,
+            'seats_taken': self.seats_taken,
+            'seats_available': self.seats_available()
+        }
+
 class PaymentStatus(Enum):
     PENDING = "pending"
     COMPLETED = "completed"
     FAILED = "failed"
     REFUNDED = "refunded"
+    EXPIRED = "expired"
+    # Paid after the hold lapsed, but the seat had been sold again
+    NEEDS_REFUND = "needs_refund"
+
+class Order(db.Model):
+    """A group purchase: `quantity` tickets paid with a single STK push."""
+    __tablename__ = "orders"
+    id = db.Column(db.String(), primary_key=True, default=lambda: str(uuid4()))
+    event_id = db.Column(db.String(), db.ForeignKey('events.id'), nullable=False, index=True)
+    user_id = db.Column(db.String(), db.ForeignKey('users.id'), nullable=False, index=True)
+    tier_id = db.Column(db.String(), db.ForeignKey('ticket_tiers.id'), nullable=True)
+    
+    quantity = db.Column(db.Integer, nullable=False)
+    ticket_price = db.Column(db.Float, nullable=False)
+    commission = db.Column(db.Float, nullable=False)
+    total_amount = db.Column(db.Float, nullable=False)
+    
+    payment_status = db.Column(db.Enum(PaymentStatus), default=PaymentStatus.PENDING, nullable=False)
+    mpesa_receipt = db.Column(db.String(100), nullable=True)
+    payment_phone = db.Column(db.String(20), nullable=True)
+    checkout_request_id = db.Column(db.String(100), nullable=True, index=True)
+    
+    purchased_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    tickets = db.relationship('Ticket', backref='order', lazy='dynamic')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_id': self.event_id,
+            'user_id': self.user_id,
+            'tier_id': self.tier_id,
+            'quantity': self.quantity,
+            'ticket_price': self.ticket_price,
+            'commission': self.commission,
+            'total_amount': self.total_amount,
+            'payment_status': self.payment_status.value,
+            'mpesa_receipt': self.mpesa_receipt,
+            'purchased_at': self.purchased_at.isoformat() if self.purchased_at else None
+        }
 
 class Ticket(db.Model):
     __tablename__ = "tickets"
+    __table_args__ = (
+        db.Index('ix_tickets_payment_status_purchased_at', 'payment_status', 'purchased_at'),
+        db.Index('ix_tickets_event_id_payment_status_purchased_at', 'event_id', 'payment_status', 'purchased_at'),
+        # One ticket per user per event, except tickets bought as part of a group order
+        db.Index('uq_tickets_event_id_user_id', 'event_id', 'user_id', unique=True,
+                 postgresql_where=db.text('order_id IS NULL'), sqlite_where=db.text('order_id IS NULL')),
+    )
     id = db.Column(db.String(), primary_key=True, default=lambda: str(uuid4()))
     event_id = db.Column(db.String(), db.ForeignKey('events.id'), nullable=False)
     user_id = db.Column(db.String(), db.ForeignKey('users.id'), nullable=False)
+    tier_id = db.Column(db.String(), db.ForeignKey('ticket_tiers.id'), nullable=True)
+    order_id = db.Column(db.String(), db.ForeignKey('orders.id'), nullable=True, index=True)
     
     ticket_price = db.Column(db.Float, nullable=False)
     commission = db.Column(db.Float, nullable=False)
@@ -237,6 +351,7 @@ class Ticket(db.Model):
     payment_status = db.Column(db.Enum(PaymentStatus), default=PaymentStatus.PENDING, nullable=False)
     mpesa_receipt = db.Column(db.String(100), nullable=True)
     payment_phone = db.Column(db.String(20), nullable=True)
+    checkout_request_id = db.Column(db.String(100), nullable=True, index=True)
     
     purchased_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     
@@ -258,6 +373,8 @@ class Ticket(db.Model):
             'event_title': self.event.title if self.event else None,
             'user_id': self.user_id,
             'username': self.user.username if self.user else None,
+            'tier_id': self.tier_id,
+            'order_id': self.order_id,
             'ticket_price': self.ticket_price,
             'commission': self.commission,
             'total_amount': self.total_amount,
@@ -280,4 +397,148 @@ class Ticket(db.Model):
             db.session.commit()
         except Exception as e:
             db.session.rollback()
-            raise e
\ No newline at end of file
+            raise e
+
+class WaitlistStatus(Enum):
+    WAITING = "waiting"
+    PROMOTED = "promoted"
+    SKIPPED = "skipped"
+
+class WaitlistEntry(db.Model):
+    __tablename__ = "waitlist_entries"
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'position', name='uq_waitlist_entries_event_id_position'),
+        # One place in line per user; promoted and skipped entries are kept as history, so a user
+        # whose promoted hold lapsed (or who was skipped) can join again
+        db.Index('uq_waitlist_entries_event_id_user_id_waiting', 'event_id', 'user_id', unique=True,
+                 postgresql_where=db.text("status = 'WAITING'"), sqlite_where=db.text("status = 'WAITING'")),
+        db.Index('ix_waitlist_entries_event_id_status_position', 'event_id', 'status', 'position'),
+    )
+    id = db.Column(db.String(), primary_key=True, default=lambda: str(uuid4()))
+    event_id = db.Column(db.String(), db.ForeignKey('events.id'), nullable=False)
+    user_id = db.Column(db.String(), db.ForeignKey('users.id'), nullable=False)
+    tier_id = db.Column(db.String(), db.ForeignKey('ticket_tiers.id'), nullable=True)
+    position = db.Column(db.Integer, nullable=False)
+    payment_phone = db.Column(db.String(20), nullable=False)
+    
+    status = db.Column(db.Enum(WaitlistStatus), default=WaitlistStatus.WAITING, nullable=False)
+    ticket_id = db.Column(db.String(), db.ForeignKey('tickets.id'), nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    promoted_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_id': self.event_id,
+            'tier_id': self.tier_id,
+            'position': self.position,
+            'status': self.status.value,
+            'ticket_id': self.ticket_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'promoted_at': self.promoted_at.isoformat() if self.promoted_at else None
+        }
+
+class Counter(db.Model):
+    """Named monotonic counters handed out with UPDATE ... RETURNING."""
+    __tablename__ = "counters"
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, default=0, server_default='0', nullable=False)
+    
+    @classmethod
+    def next_value(cls, name, amount=1):
+        """Increment and return the counter, creating it on first use. With
+        `amount` > 1 the values up to and including the returned one are
+        reserved as a block. The caller commits.
+        
+        A single INSERT ... ON CONFLICT DO UPDATE ... RETURNING, so two first
+        callers cannot both try to create the row."""
+        if db.session.get_bind().dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(cls).values(name=name, value=amount)
+        return db.session.execute(
+            statement
+            .on_conflict_do_update(index_elements=[cls.name], set_={'value': cls.value + amount})
+            .returning(cls.value)
+            .execution_options(synchronize_session=False)
+        ).scalar_one()
+
+class WaitingRoom(db.Model):
+    """Admission control for an event's on-sale: buyers queue for signed
+    tokens that admit them at `admit_rate` per second from `opens_at`."""
+    __tablename__ = "waiting_rooms"
+    event_id = db.Column(db.String(), db.ForeignKey('events.id'), primary_key=True)
+    admit_rate = db.Column(db.Float, nullable=False, default=10.0)
+    opens_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    issued = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    event = db.relationship('Event', backref=db.backref('waiting_room', uselist=False))
+    
+    def to_dict(self):
+        return {
+            'event_id': self.event_id,
+            'admit_rate': self.admit_rate,
+            'opens_at': self.opens_at.isoformat() if self.opens_at else None,
+            'issued': self.issued,
+            'is_active': self.is_active
+        }
+
+class QueuePlace(db.Model):
+    """A user's place in an event's waiting room queue. Joining again while
+    the place is still valid hands back the same place and token."""
+    __tablename__ = "queue_places"
+    event_id = db.Column(db.String(), db.ForeignKey('events.id'), primary_key=True)
+    user_id = db.Column(db.String(), db.ForeignKey('users.id'), primary_key=True)
+    sequence = db.Column(db.Integer, nullable=False)
+    admit_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class CheckIn(db.Model):
+    """A ticket scanned at the door. At most one per ticket; repeat scans
+    are reported as duplicates rather than stored."""
+    __tablename__ = "check_ins"
+    ticket_id = db.Column(db.String(), db.ForeignKey('tickets.id'), primary_key=True)
+    event_id = db.Column(db.String(), db.ForeignKey('events.id'), nullable=False, index=True)
+    device_id = db.Column(db.String(100), nullable=True)
+    scanned_at = db.Column(db.DateTime, nullable=False)
+    uploaded_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    def to_dict(self):
+        return {
+            'ticket_id': self.ticket_id,
+            'event_id': self.event_id,
+            'device_id': self.device_id,
+            'scanned_at': self.scanned_at.isoformat() if self.scanned_at else None,
+            'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None
+        }
+
+class CheckInManifest(db.Model):
+    """Precomputed scanner manifest for an event, rebuilt when it goes stale
+    so that a room full of scanners syncing at once costs one build."""
+    __tablename__ = "check_in_manifests"
+    event_id = db.Column(db.String(), db.ForeignKey('events.id'), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    ticket_count = db.Column(db.Integer, nullable=False)
+    generated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+class MpesaCallbackLog(db.Model):
+    """Durable queue of STK callbacks accepted in write-behind mode and not
+    yet applied to tickets."""
+    __tablename__ = "mpesa_callback_log"
+    __table_args__ = (
+        db.Index('ix_mpesa_callback_log_processed_at_id', 'processed_at', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    checkout_request_id = db.Column(db.String(100), nullable=True)
+    account_reference = db.Column(db.String(100), nullable=True)
+    result_code = db.Column(db.Integer, nullable=True)
+    mpesa_receipt = db.Column(db.String(100), nullable=True)
+    payload = db.Column(db.JSON, nullable=False)
+    
+    received_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    processed_at = db.Column(db.DateTime, nullable=True)
@@ -0,0 +1,248 @@
+"""
+Local stand-in for the Safaricom Daraja API.
+
+Serves the OAuth, STK push and STK query endpoints used by MpesaService and
+delivers STK callbacks to the CallBackURL of each push, so the payment flow
+can be exercised and load-tested without the sandbox. Point the API at it
+with MPESA_BASE_URL=http://localhost:8090.
+
+Run it with:
+    python mpesa_simulator.py --port 8090 --latency-ms 150 --failure-rate 0.02
+"""
+
+import argparse
+import heapq
+import itertools
+import random
+import threading
+import time
+from uuid import uuid4
+
+import requests
+from flask import Flask, jsonify, request
+
+
+class CallbackDispatcher:
+    """Background thread that POSTs queued callbacks once they are due."""
+
+    def __init__(self):
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._session = requests.Session()
+        self.delivered = 0
+        self.delivery_errors = 0
+        thread = threading.Thread(target=self._run, daemon=True)
+        thread.start()
+
+    def schedule(self, deliver_at, url, payload):
+        with self._cond:
+            heapq.heappush(self._queue, (deliver_at, next(self._counter), url, payload))
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+                    self._cond.wait(timeout)
+                _, _, url, payload = heapq.heappop(self._queue)
+            try:
+                self._session.post(url, json=payload, timeout=10)
+                self.delivered += 1
+            except requests.RequestException:
+                self.delivery_errors += 1
+
+
+def create_simulator(latency_ms=0, latency_jitter_ms=0, failure_rate=0.0, success_rate=1.0,
+                     callback_delay_ms=500, duplicate_rate=0.0, reorder_rate=0.0):
+    """
+    Build the simulator app.
+    
+    Args:
+        latency_ms (int): Base latency added to every Daraja request
+        latency_jitter_ms (int): Extra random latency, uniform in [0, jitter]
+        failure_rate (float): Share of requests answered with a Daraja error
+        success_rate (float): Share of STK pushes the "customer" pays
+        callback_delay_ms (int): Delay between a push and its callback
+        duplicate_rate (float): Share of callbacks delivered twice
+        reorder_rate (float): Share of callbacks held back so later pushes
+            are called back first
+    """
+    app = Flask(__name__)
+    dispatcher = CallbackDispatcher()
+    transactions = {}
+    stats = {'oauth': 0, 'stk_push': 0, 'stk_query': 0, 'injected_failures': 0,
+             'in_flight': 0, 'max_in_flight': 0}
+    lock = threading.Lock()
+
+    def count(name):
+        with lock:
+            stats[name] += 1
+
+    @app.before_request
+    def simulate_latency():
+        if request.path.startswith('/simulator'):
+            return None
+        with lock:
+            stats['in_flight'] += 1
+            stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+        request.environ['simulator.counted'] = True
+        delay = latency_ms + random.uniform(0, latency_jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        if random.random() < failure_rate:
+            count('injected_failures')
+            return jsonify({
+                'requestId': str(uuid4()),
+                'errorCode': '500.003.02',
+                'errorMessage': 'System is busy. Please try again in few minutes.'
+            }), 503
+        return None
+
+    @app.teardown_request
+    def finish_request(exc):
+        if request.environ.get('simulator.counted'):
+            with lock:
+                stats['in_flight'] -= 1
+
+    @app.post('/simulator/reset-stats')
+    def reset_stats():
+        with lock:
+            stats['max_in_flight'] = stats['in_flight']
+        return jsonify({'max_in_flight': stats['max_in_flight']})
+
+    @app.get('/oauth/v1/generate')
+    def generate_token():
+        count('oauth')
+        if not request.authorization:
+            return jsonify({'errorCode': '400.008.01', 'errorMessage': 'Invalid Authentication passed'}), 400
+        return jsonify({'access_token': uuid4().hex, 'expires_in': '3599'})
+
+    @app.post('/mpesa/stkpush/v1/processrequest')
+    def stk_push():
+        count('stk_push')
+        data = request.get_json() or {}
+        
+        if not data.get('PhoneNumber') or not data.get('Amount') or not data.get('CallBackURL'):
+            return jsonify({
+                'requestId': str(uuid4()),
+                'errorCode': '400.002.02',
+                'errorMessage': 'Bad Request - Invalid request payload'
+            }), 400
+        
+        checkout_request_id = f"ws_CO_{uuid4().hex[:20]}"
+        merchant_request_id = f"{random.randint(10000, 99999)}-{random.randint(1000000, 9999999)}-1"
+        paid = random.random() < success_rate
+        
+        callback = {
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': 0 if paid else 1032,
+            'ResultDesc': 'The service request is processed successfully.' if paid else 'Request cancelled by user',
+            # Real Daraja callbacks omit this; the API falls back to it when
+            # CheckoutRequestID is unknown, so it is kept for that path
+            'AccountReference': data.get('AccountReference', '')
+        }
+        if paid:
+            callback['CallbackMetadata'] = {'Item': [
+                {'Name': 'Amount', 'Value': data['Amount']},
+                {'Name': 'MpesaReceiptNumber', 'Value': uuid4().hex[:10].upper()},
+                {'Name': 'TransactionDate', 'Value': int(time.strftime('%Y%m%d%H%M%S'))},
+                {'Name': 'PhoneNumber', 'Value': data['PhoneNumber']}
+            ]}
+        
+        due = time.monotonic() + callback_delay_ms / 1000
+        with lock:
+            transactions[checkout_request_id] = {'result': callback, 'due': due}
+        
+        payload = {'Body': {'stkCallback': callback}}
+        deliver_at = due
+        if random.random() < reorder_rate:
+            deliver_at += random.uniform(1, 3) * max(callback_delay_ms, 100) / 1000
+        dispatcher.schedule(deliver_at, data['CallBackURL'], payload)
+        if random.random() < duplicate_rate:
+            dispatcher.schedule(deliver_at + random.uniform(0, 1), data['CallBackURL'], payload)
+        
+        return jsonify({
+            'MerchantRequestID': merchant_request_id,
+            'CheckoutRequestID': checkout_request_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing'
+        })
+
+    @app.post('/mpesa/stkpushquery/v1/query')
+    def stk_query():
+        count('stk_query')
+        data = request.get_json() or {}
+        checkout_request_id = data.get('CheckoutRequestID')
+        
+        with lock:
+            transaction = transactions.get(checkout_request_id)
+        
+        if not transaction:
+            return jsonify({
+                'requestId': str(uuid4()),
+                'errorCode': '400.002.02',
+                'errorMessage': 'Bad Request - Invalid CheckoutRequestID'
+            }), 400
+        
+        if time.monotonic() < transaction['due']:
+            return jsonify({
+                'requestId': str(uuid4()),
+                'errorCode': '500.001.1001',
+                'errorMessage': 'The transaction is being processed'
+            }), 500
+        
+        result = transaction['result']
+        return jsonify({
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successfully',
+            'MerchantRequestID': result['MerchantRequestID'],
+            'CheckoutRequestID': checkout_request_id,
+            'ResultCode': str(result['ResultCode']),
+            'ResultDesc': result['ResultDesc']
+        })
+
+    @app.get('/simulator/stats')
+    def simulator_stats():
+        with lock:
+            snapshot = dict(stats, transactions=len(transactions))
+        snapshot.update({
+            'callbacks_delivered': dispatcher.delivered,
+            'callback_errors': dispatcher.delivery_errors,
+            'callbacks_pending': dispatcher.pending()
+        })
+        return jsonify(snapshot)
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Daraja (M-Pesa) simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=int, default=0)
+    parser.add_argument('--latency-jitter-ms', type=int, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--success-rate', type=float, default=1.0)
+    parser.add_argument('--callback-delay-ms', type=int, default=500)
+    parser.add_argument('--duplicate-rate', type=float, default=0.0)
+    parser.add_argument('--reorder-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    
+    simulator = create_simulator(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        failure_rate=args.failure_rate,
+        success_rate=args.success_rate,
+        callback_delay_ms=args.callback_delay_ms,
+        duplicate_rate=args.duplicate_rate,
+        reorder_rate=args.reorder_rate
+    )
+    simulator.run(host=args.host, port=args.port, threaded=True)
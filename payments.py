@@ -1,10 +1,18 @@
-from flask import Blueprint, request, jsonify
-from models import Ticket, Event, PaymentStatus, User
+from flask import Blueprint, current_app, request, jsonify
+from models import Ticket, Event, Order, PaymentStatus, User, UserRole
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from auth import role_required
+from auth import internal_access_required, role_required
 from extension import db
-import requests
+from reconciliation import reconcile_pending_orders, reconcile_pending_payments, reconcile_pending_subscriptions
+from reservations import is_hold_expired, transition_tickets
+from callback_ingestion import callback_mode, parse_stk_callback, enqueue_callback, apply_callbacks, drain_callback_log
+from circuit_breaker import CircuitBreaker, Bulkhead, PaymentsUnavailable
+from metrics import inc, record_upstream_call
+from sqlalchemy import update
 import base64
+import click
+import threading
+import time
 from datetime import datetime
 import os
 
@@ -17,13 +25,116 @@ class MpesaService:
         self.business_short_code = os.environ.get('MPESA_SHORTCODE')
         self.passkey = os.environ.get('MPESA_PASSKEY')
         self.callback_url = os.environ.get('MPESA_CALLBACK_URL')
-        self.base_url = 'https://sandbox.safaricom.co.ke'
+        self.base_url = os.environ.get('MPESA_BASE_URL', 'https://sandbox.safaricom.co.ke').rstrip('/')
+        self.timeout = float(os.environ.get('MPESA_TIMEOUT', 30))
+        
+        max_concurrent = int(os.environ.get('MPESA_MAX_CONCURRENT', 8))
+        # Enough pooled connections for every call the bulkhead admits
+        self.pool_size = int(os.environ.get('MPESA_POOL_SIZE', max(10, max_concurrent)))
+        self._session = None
+        
+        self._access_token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+        
+        self.breaker = CircuitBreaker(
+            'mpesa',
+            failure_threshold=int(os.environ.get('MPESA_BREAKER_FAILURES', 5)),
+            recovery_timeout=float(os.environ.get('MPESA_BREAKER_RESET_SECONDS', 30))
+        )
+        self.bulkhead = Bulkhead(
+            'mpesa',
+            max_concurrent=max_concurrent,
+            acquire_timeout=float(os.environ.get('MPESA_BULKHEAD_TIMEOUT', 0.5))
+        )
+
+    @property
+    def session(self):
+        """One pooled session per process so STK pushes and status queries
+        reuse TLS connections instead of opening one per call. Built on first
+        use so importing this module does not load requests."""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self._session = session
+        return self._session
+
+    @staticmethod
+    def _is_upstream_failure(response):
+        if response.status_code < 500:
+            return False
+        try:
+            # STK query answers "still processing" with a 500; that is not an outage
+            return response.json().get('errorCode') != '500.001.1001'
+        except ValueError:
+            return True
+
+    @staticmethod
+    def _operation(url):
+        if '/oauth/' in url:
+            return 'oauth'
+        if 'stkpushquery' in url:
+            return 'stk_query'
+        return 'stk_push'
+
+    def _send(self, method, url, **kwargs):
+        """Every Daraja call goes through the circuit breaker and bulkhead, so a
+        degraded upstream fails fast instead of tying up workers."""
+        from requests import RequestException
+        operation = self._operation(url)
+        try:
+            # The bulkhead comes first: a rejection there must not leave a
+            # HALF_OPEN probe slot taken with no outcome ever recorded
+            with self.bulkhead.slot():
+                self.breaker.before_call()
+                start = time.perf_counter()
+                try:
+                    response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                except RequestException:
+                    elapsed = time.perf_counter() - start
+                    self.breaker.record_failure(elapsed)
+                    record_upstream_call(operation, 'network_error', elapsed)
+                    raise
+                except BaseException:
+                    # Not an upstream outcome (a bug, a worker timeout): give the probe slot back
+                    self.breaker.release_probe()
+                    raise
+                
+                elapsed = time.perf_counter() - start
+                if self._is_upstream_failure(response):
+                    self.breaker.record_failure(elapsed)
+                    record_upstream_call(operation, 'upstream_error', elapsed)
+                else:
+                    self.breaker.record_success(elapsed)
+                    record_upstream_call(operation, 'success', elapsed)
+                return response
+        except PaymentsUnavailable:
+            # Shed by the open breaker or a full bulkhead; nothing was sent
+            inc('mpesa_requests_total', operation=operation, outcome='rejected')
+            raise
 
     def get_access_token(self):
-        url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
+        if self._access_token and time.monotonic() < self._token_expires_at:
+            return self._access_token
         
-        response = requests.get(url, auth=(self.consumer_key, self.consumer_secret))
-        return response.json().get('access_token')
+        # One refresh at a time: with threaded or gevent workers, every payment
+        # in flight would otherwise fetch its own token when it expires
+        with self._token_lock:
+            if self._access_token and time.monotonic() < self._token_expires_at:
+                return self._access_token
+            
+            url = f"{self.base_url}/oauth/v1/generate?grant_type=client_credentials"
+            
+            response = self._send('GET', url, auth=(self.consumer_key, self.consumer_secret))
+            data = response.json()
+            self._access_token = data.get('access_token')
+            # Refresh a minute early so a token never expires mid-request
+            self._token_expires_at = time.monotonic() + int(data.get('expires_in', 3599)) - 60
+            return self._access_token
 
     def generate_password(self):
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
@@ -55,11 +166,65 @@ class MpesaService:
             "TransactionDesc": transaction_desc
         }
         
-        response = requests.post(url, json=payload, headers=headers)
+        response = self._send('POST', url, json=payload, headers=headers)
+        return response.json()
+
+    def stk_query(self, checkout_request_id):
+        access_token = self.get_access_token()
+        password, timestamp = self.generate_password()
+        
+        url = f"{self.base_url}/mpesa/stkpushquery/v1/query"
+        
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Content-Type': 'application/json'
+        }
+        
+        payload = {
+            "BusinessShortCode": self.business_short_code,
+            "Password": password,
+            "Timestamp": timestamp,
+            "CheckoutRequestID": checkout_request_id
+        }
+        
+        response = self._send('POST', url, json=payload, headers=headers)
         return response.json()
 
 mpesa = MpesaService()
 
+def release_connection():
+    """End the request's read transaction and return its connection to the
+    pool before a Daraja call. With gthread or gevent workers many payments
+    wait on Daraja at once, and holding a connection each would exhaust the
+    pool long before the workers."""
+    db.session.close()
+
+def record_checkout_request(model, row_id, checkout_request_id):
+    try:
+        db.session.execute(
+            update(model).where(model.id == row_id).values(checkout_request_id=checkout_request_id)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+def payments_unavailable_response(error):
+    response = jsonify({'error': 'Payments temporarily unavailable', 'retry_after': error.retry_after})
+    response.status_code = 503
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(int(error.retry_after) or 1)
+    return response
+
+@payments_bp.get('/upstream-status')
+@internal_access_required
+def upstream_status():
+    return jsonify({
+        'circuit_breaker': mpesa.breaker.snapshot(),
+        'bulkhead': mpesa.bulkhead.snapshot()
+    }), 200
+
 @payments_bp.post('/test-mpesa')
 def test_mpesa_payment():
     data = request.get_json()
@@ -86,6 +251,8 @@ def test_mpesa_payment():
         else:
             return jsonify({'error': 'Payment initiation failed', 'response': mpesa_response}), 400
             
+    except PaymentsUnavailable as e:
+        return payments_unavailable_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -101,6 +268,16 @@ def initiate_payment(ticket_id):
     if ticket.user_id != current_user_id:
         return jsonify({'error': 'Unauthorized'}), 403
     
+    if ticket.order_id:
+        # Order tickets are settled with their order; paying one alone would leave the rest to expire
+        return jsonify({
+            'error': 'This ticket is part of a group order. Pay for the order instead',
+            'endpoint': f'/api/payments/initiate-order/{ticket.order_id}'
+        }), 400
+    
+    if ticket.payment_status == PaymentStatus.EXPIRED or is_hold_expired(ticket):
+        return jsonify({'error': 'Ticket reservation expired. Please purchase again'}), 410
+    
     if ticket.payment_status != PaymentStatus.PENDING:
         return jsonify({'error': 'Payment already processed'}), 400
     
@@ -108,24 +285,32 @@ def initiate_payment(ticket_id):
     if not event:
         return jsonify({'error': 'Event not found'}), 404
     
+    ticket_id = ticket.id
+    phone_number, amount, event_title = ticket.payment_phone, ticket.total_amount, event.title
+    release_connection()
+    
     try:
         mpesa_response = mpesa.stk_push(
-            phone_number=ticket.payment_phone,
-            amount=ticket.total_amount,
-            account_reference=f"TICKET{ticket.id[:8]}",
-            transaction_desc=f"Ticket for {event.title}"
+            phone_number=phone_number,
+            amount=amount,
+            account_reference=f"TICKET{ticket_id[:8]}",
+            transaction_desc=f"Ticket for {event_title}"
         )
         
         if mpesa_response.get('ResponseCode') == '0':
+            record_checkout_request(Ticket, ticket_id, mpesa_response.get('CheckoutRequestID'))
             return jsonify({
-                'ticket_id': ticket.id,
+                'ticket_id': ticket_id,
                 'checkout_request_id': mpesa_response.get('CheckoutRequestID'),
                 'message': 'Payment initiated successfully'
             }), 200
         else:
             return jsonify({'error': 'Payment initiation failed'}), 400
             
+    except PaymentsUnavailable as e:
+        return payments_unavailable_response(e)
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @payments_bp.get('/status/<ticket_id>')
@@ -147,40 +332,185 @@ def payment_status(ticket_id):
         'mpesa_receipt': ticket.mpesa_receipt
     })
 
+@payments_bp.post('/initiate-order/<order_id>')
+@jwt_required()
+def initiate_order_payment(order_id):
+    current_user_id = get_jwt_identity()
+    order = Order.query.get(order_id)
+    
+    if not order:
+        return jsonify({'error': 'Order not found'}), 404
+    
+    if order.user_id != current_user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if order.payment_status == PaymentStatus.EXPIRED or is_hold_expired(order):
+        return jsonify({'error': 'Order reservation expired. Please order again'}), 410
+    
+    if order.payment_status != PaymentStatus.PENDING:
+        return jsonify({'error': 'Payment already processed'}), 400
+    
+    event = Event.query.get(order.event_id)
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    
+    order_id = order.id
+    phone_number, amount, quantity, event_title = order.payment_phone, order.total_amount, order.quantity, event.title
+    release_connection()
+    
+    try:
+        mpesa_response = mpesa.stk_push(
+            phone_number=phone_number,
+            amount=amount,
+            account_reference=f"ORDER{order_id[:8]}",
+            transaction_desc=f"{quantity} tickets for {event_title}"
+        )
+        
+        if mpesa_response.get('ResponseCode') == '0':
+            record_checkout_request(Order, order_id, mpesa_response.get('CheckoutRequestID'))
+            return jsonify({
+                'order_id': order_id,
+                'checkout_request_id': mpesa_response.get('CheckoutRequestID'),
+                'message': 'Payment initiated successfully'
+            }), 200
+        else:
+            return jsonify({'error': 'Payment initiation failed'}), 400
+            
+    except PaymentsUnavailable as e:
+        return payments_unavailable_response(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@payments_bp.get('/order-status/<order_id>')
+@jwt_required()
+def order_payment_status(order_id):
+    current_user_id = get_jwt_identity()
+    order = Order.query.get(order_id)
+    
+    if not order:
+        return jsonify({'error': 'Order not found'}), 404
+    
+    if order.user_id != current_user_id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({
+        'order_id': order.id,
+        'status': order.payment_status.value,
+        'quantity': order.quantity,
+        'amount': order.total_amount,
+        'mpesa_receipt': order.mpesa_receipt
+    })
+
+@payments_bp.patch('/refund/<ticket_id>')
+@role_required(UserRole.ADMIN)
+def refund_ticket(ticket_id):
+    """Record a refund issued through M-Pesa and release the ticket's seat,
+    or close out a late payment flagged NEEDS_REFUND, which holds none."""
+    try:
+        refunded = (
+            transition_tickets(Ticket.id == ticket_id, [PaymentStatus.COMPLETED], PaymentStatus.REFUNDED)
+            or transition_tickets(Ticket.id == ticket_id, [PaymentStatus.NEEDS_REFUND], PaymentStatus.REFUNDED)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to refund ticket'}), 500
+    
+    if not refunded:
+        return jsonify({'error': 'Only completed or needs_refund tickets can be refunded'}), 400
+    
+    return jsonify({'message': 'Ticket refunded', 'ticket': Ticket.query.get(ticket_id).to_dict()}), 200
+
 @payments_bp.post('/callback')
 def mpesa_callback():
     data = request.get_json()
     
     try:
-        callback_data = data.get('Body', {}).get('stkCallback', {})
-        result_code = callback_data.get('ResultCode')
-        
-        # Extract ticket ID from account reference
-        account_ref = callback_data.get('AccountReference', '')
-        if account_ref.startswith('TICKET'):
-            ticket_partial_id = account_ref[6:]  # Remove 'TICKET' prefix
-            ticket = Ticket.query.filter(Ticket.id.like(f'{ticket_partial_id}%')).first()
-            
-            if not ticket:
-                return jsonify({'error': 'Ticket not found'}), 404
-            
-            if result_code == 0:
-                # Payment successful
-                ticket.payment_status = PaymentStatus.COMPLETED
-                callback_metadata = callback_data.get('CallbackMetadata', {}).get('Item', [])
-                
-                for item in callback_metadata:
-                    if item.get('Name') == 'MpesaReceiptNumber':
-                        ticket.mpesa_receipt = item.get('Value')
-                
-            else:
-                # Payment failed
-                ticket.payment_status = PaymentStatus.FAILED
-            
-            ticket.save()
-            return jsonify({'message': 'Callback processed'}), 200
+        callback = parse_stk_callback(data)
+        if not callback:
+            current_app.logger.warning('Rejected malformed or unmatchable M-Pesa callback: %.1000r', data)
+            return jsonify({'error': 'Invalid callback payload'}), 400
         
-        return jsonify({'error': 'Invalid account reference'}), 400
+        if callback_mode() == 'write_behind':
+            enqueue_callback(callback, data)
+            return jsonify({'ResultCode': 0, 'ResultDesc': 'Accepted'}), 200
+        
+        try:
+            matched = apply_callbacks([callback])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise e
+        
+        if not matched:
+            return jsonify({'error': 'Ticket not found'}), 404
+        
+        return jsonify({'message': 'Callback processed'}), 200
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@payments_bp.cli.command('reconcile')
+@click.option('--older-than', default=15, type=int, help='Only reconcile tickets pending for at least this many minutes')
+@click.option('--batch-size', default=200, type=int, help='Tickets fetched and updated per batch')
+@click.option('--concurrency', default=8, type=int, help='Maximum in-flight STK status queries')
+@click.option('--expired-within', default=24, type=int,
+              help='Also check expired holds pushed in the last this many hours (0 to skip)')
+def reconcile_command(older_than, batch_size, concurrency, expired_within):
+    """Settle stale PENDING tickets, group orders and club subscription
+    payments, and expired holds that may have been paid, by querying the STK
+    push status API."""
+    summary = reconcile_pending_payments(
+        mpesa,
+        older_than_minutes=older_than,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        expired_within_hours=expired_within
+    )
+    click.echo(
+        f"Checked {summary['checked']} tickets: "
+        f"{summary['completed']} completed ({summary['recovered']} after their hold expired), "
+        f"{summary['failed']} failed, {summary['unresolved']} still pending, "
+        f"{summary['needs_refund']} paid too late and need a refund"
+    )
+    summary = reconcile_pending_orders(
+        mpesa,
+        older_than_minutes=older_than,
+        batch_size=batch_size,
+        concurrency=concurrency,
+        expired_within_hours=expired_within
+    )
+    click.echo(
+        f"Checked {summary['checked']} orders: "
+        f"{summary['completed']} completed ({summary['recovered']} after their hold expired), "
+        f"{summary['failed']} failed, {summary['unresolved']} still pending, "
+        f"{summary['needs_refund']} paid too late and need a refund"
+    )
+    summary = reconcile_pending_subscriptions(
+        mpesa,
+        older_than_minutes=older_than,
+        batch_size=batch_size,
+        concurrency=concurrency
+    )
+    click.echo(
+        f"Checked {summary['checked']} club subscriptions: "
+        f"{summary['completed']} completed, {summary['failed']} failed, {summary['unresolved']} still pending"
+    )
+
+@payments_bp.cli.command('apply-callbacks')
+@click.option('--batch-size', default=100, type=int, help='Logged callbacks applied per transaction')
+@click.option('--once', is_flag=True, help='Drain the current backlog and exit')
+@click.option('--idle-sleep', default=0.5, type=float, help='Seconds to wait when the log is empty')
+def apply_callbacks_command(batch_size, once, idle_sleep):
+    """Apply callbacks accepted in write-behind mode to their tickets."""
+    total = 0
+    while True:
+        processed = drain_callback_log(batch_size=batch_size)
+        total += processed
+        if processed:
+            continue
+        if once:
+            break
+        time.sleep(idle_sleep)
+    click.echo(f"Applied {total} callbacks")
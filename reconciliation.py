@@ -0,0 +1,238 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_, select, update
+from extension import db
+from club_models import ClubSubscription
+from models import Order, Ticket, PaymentStatus
+from reservations import SEAT_HOLDING_STATUSES, recover_paid_tickets, transition_tickets
+from subscription_renewals import extend_subscriptions, fail_subscription_payments, pending_timeout
+
+
+def _pending_batch(cutoff, batch_size, after=None, status=PaymentStatus.PENDING, since=None, model=Ticket):
+    """Next page of stale tickets (or orders, or club subscriptions) in
+    `status`, keyset-paginated on (purchased_at, id) so every ticket page is
+    served by ix_tickets_payment_status_purchased_at. Subscriptions page on
+    the time of their last STK push instead."""
+    requested_at = model.payment_requested_at if model is ClubSubscription else model.purchased_at
+    query = db.session.query(model.id, model.checkout_request_id, requested_at.label('requested_at')).filter(
+        model.payment_status == status,
+        requested_at < cutoff,
+        model.checkout_request_id.isnot(None)
+    )
+    if since is not None:
+        query = query.filter(requested_at >= since)
+    
+    if after:
+        last_requested_at, last_id = after
+        query = query.filter(or_(
+            requested_at > last_requested_at,
+            and_(requested_at == last_requested_at, model.id > last_id)
+        ))
+    
+    return query.order_by(requested_at, model.id).limit(batch_size).all()
+
+
+def _query_status(client, checkout_request_id):
+    try:
+        return client.stk_query(checkout_request_id)
+    except Exception:
+        return {}
+
+
+def classify_stk_result(response):
+    """Map an STK push query response to a PaymentStatus, or None while the
+    transaction is still being processed (or the query itself failed)."""
+    result_code = response.get('ResultCode')
+    if result_code is None:
+        return None
+    if str(result_code) == '0':
+        return PaymentStatus.COMPLETED
+    return PaymentStatus.FAILED
+
+
+def apply_payment_results(ticket_ids_by_status, from_status=PaymentStatus.PENDING):
+    """Bulk-apply resolved statuses, one UPDATE per status, releasing seats of
+    failed tickets. Expired holds that were paid take their seats back if
+    still free and are flagged NEEDS_REFUND otherwise. Tickets settled by a
+    callback in the meantime are left alone."""
+    updated = {PaymentStatus.NEEDS_REFUND: 0}
+    for status, ticket_ids in ticket_ids_by_status.items():
+        if not ticket_ids:
+            updated[status] = 0
+        elif status == PaymentStatus.COMPLETED and from_status not in SEAT_HOLDING_STATUSES:
+            completed, needs_refund = recover_paid_tickets(Ticket.id.in_(ticket_ids), [from_status])
+            updated[status] = len(completed)
+            updated[PaymentStatus.NEEDS_REFUND] = len(needs_refund)
+        else:
+            updated[status] = transition_tickets(Ticket.id.in_(ticket_ids), [from_status], status)
+    return updated
+
+
+def apply_order_results(order_ids_by_status, from_status=PaymentStatus.PENDING):
+    """Bulk-apply resolved statuses to orders and, in the same transaction,
+    to all their tickets, recovering expired orders that were paid as for
+    tickets. Orders settled by a callback in the meantime are left alone."""
+    updated = {PaymentStatus.NEEDS_REFUND: 0}
+    for status, order_ids in order_ids_by_status.items():
+        if not order_ids:
+            updated[status] = 0
+            continue
+        moved = db.session.execute(
+            update(Order)
+            .where(Order.id.in_(order_ids), Order.payment_status == from_status)
+            .values(payment_status=status)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        updated[status] = len(moved)
+        if not moved:
+            continue
+        if status == PaymentStatus.COMPLETED and from_status not in SEAT_HOLDING_STATUSES:
+            _, needs_refund = recover_paid_tickets(Ticket.order_id.in_(moved), [from_status])
+            unseated = {ticket.order_id for ticket in needs_refund}
+            if unseated:
+                db.session.execute(
+                    update(Order)
+                    .where(Order.id.in_(unseated))
+                    .values(payment_status=PaymentStatus.NEEDS_REFUND)
+                    .execution_options(synchronize_session=False)
+                )
+            updated[status] -= len(unseated)
+            updated[PaymentStatus.NEEDS_REFUND] = len(unseated)
+        else:
+            transition_tickets(Ticket.order_id.in_(moved), [from_status], status)
+    return updated
+
+
+def apply_subscription_results(subscription_ids_by_status, from_status='pending'):
+    """Extend paid subscriptions and mark declined ones failed. Subscriptions
+    a callback settled in the meantime are left alone."""
+    updated = {PaymentStatus.COMPLETED: 0, PaymentStatus.FAILED: 0}
+    paid = subscription_ids_by_status.get(PaymentStatus.COMPLETED)
+    if paid:
+        still_pending = db.session.scalars(
+            select(ClubSubscription.id)
+            .where(ClubSubscription.id.in_(paid), ClubSubscription.payment_status == from_status)
+            .with_for_update()
+        ).all()
+        updated[PaymentStatus.COMPLETED] = extend_subscriptions(dict.fromkeys(still_pending))
+    updated[PaymentStatus.FAILED] = fail_subscription_payments(subscription_ids_by_status.get(PaymentStatus.FAILED))
+    return updated
+
+
+def reconcile_pending_payments(client, older_than_minutes=15, batch_size=200, concurrency=8,
+                               expired_within_hours=24):
+    """
+    Settle tickets whose M-Pesa callback never arrived.
+    
+    Walks PENDING tickets older than the threshold in indexed batches, queries
+    the STK status API for each with at most `concurrency` requests in flight
+    through the client's pooled session, and commits each batch's results
+    with bulk updates.
+    
+    A second pass does the same for tickets pushed in the last
+    `expired_within_hours` whose hold was expired before any callback came:
+    a paid one is completed and retakes its seat if it is still free (and is
+    flagged NEEDS_REFUND if it was sold again), a declined one is marked
+    FAILED so later runs skip it.
+    
+    Returns:
+        dict: counts of checked, completed, failed and unresolved tickets,
+        and of expired holds recovered as paid or flagged for a refund
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(minutes=older_than_minutes)
+    summary = {'checked': 0, 'completed': 0, 'failed': 0, 'unresolved': 0, 'recovered': 0, 'needs_refund': 0}
+    passes = [(PaymentStatus.PENDING, None)]
+    if expired_within_hours:
+        passes.append((PaymentStatus.EXPIRED, now - timedelta(hours=expired_within_hours)))
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for from_status, since in passes:
+            _reconcile_pass(client, executor, summary, cutoff, batch_size, from_status, since,
+                            Ticket, apply_payment_results)
+    
+    return summary
+
+
+def reconcile_pending_orders(client, older_than_minutes=15, batch_size=200, concurrency=8,
+                             expired_within_hours=24):
+    """
+    Settle group orders whose M-Pesa callback never arrived. Order tickets
+    carry no CheckoutRequestID of their own, so the order's is queried and
+    the result applied to the order and every ticket in it, with the same
+    passes over PENDING and recently EXPIRED orders as for tickets.
+    
+    Returns:
+        dict: counts of checked, completed, failed and unresolved orders,
+        and of expired orders recovered as paid or flagged for a refund
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(minutes=older_than_minutes)
+    summary = {'checked': 0, 'completed': 0, 'failed': 0, 'unresolved': 0, 'recovered': 0, 'needs_refund': 0}
+    passes = [(PaymentStatus.PENDING, None)]
+    if expired_within_hours:
+        passes.append((PaymentStatus.EXPIRED, now - timedelta(hours=expired_within_hours)))
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for from_status, since in passes:
+            _reconcile_pass(client, executor, summary, cutoff, batch_size, from_status, since,
+                            Order, apply_order_results)
+    
+    return summary
+
+
+def reconcile_pending_subscriptions(client, older_than_minutes=None, batch_size=200, concurrency=8):
+    """
+    Settle club subscription payments whose M-Pesa callback never arrived,
+    pending for longer than `older_than_minutes` (the subscription pending
+    timeout by default). A paid one is extended, a declined one is marked
+    failed, and one the STK query cannot resolve stays pending.
+    
+    Returns:
+        dict: counts of checked, completed, failed and unresolved subscriptions
+    """
+    older_than = timedelta(minutes=older_than_minutes) if older_than_minutes is not None else pending_timeout()
+    cutoff = datetime.now(timezone.utc) - older_than
+    summary = {'checked': 0, 'completed': 0, 'failed': 0, 'unresolved': 0}
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        _reconcile_pass(client, executor, summary, cutoff, batch_size, 'pending', None,
+                        ClubSubscription, apply_subscription_results)
+    
+    return summary
+
+
+def _reconcile_pass(client, executor, summary, cutoff, batch_size, from_status, since, model, apply):
+    after = None
+    while True:
+        batch = _pending_batch(cutoff, batch_size, after, status=from_status, since=since, model=model)
+        if not batch:
+            break
+        after = (batch[-1].requested_at, batch[-1].id)
+        
+        responses = executor.map(
+            lambda row: _query_status(client, row.checkout_request_id), batch
+        )
+        
+        resolved = {PaymentStatus.COMPLETED: [], PaymentStatus.FAILED: []}
+        for row, response in zip(batch, responses):
+            status = classify_stk_result(response)
+            if status is None:
+                summary['unresolved'] += 1
+            else:
+                resolved[status].append(row.id)
+        
+        try:
+            updated = apply(resolved, from_status)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise e
+        
+        summary['checked'] += len(batch)
+        summary['completed'] += updated[PaymentStatus.COMPLETED]
+        summary['failed'] += updated[PaymentStatus.FAILED]
+        if from_status == PaymentStatus.EXPIRED:
+            summary['recovered'] += updated[PaymentStatus.COMPLETED]
+            summary['needs_refund'] += updated[PaymentStatus.NEEDS_REFUND]
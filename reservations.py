@@ -0,0 +1,374 @@
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import case, func, or_, select, update
+from extension import db
+from models import Event, Order, Ticket, TicketTier, PaymentStatus, WaitlistEntry, WaitlistStatus
+
+# Statuses whose tickets occupy a seat and are counted in Event.seats_taken
+SEAT_HOLDING_STATUSES = (PaymentStatus.PENDING, PaymentStatus.COMPLETED)
+
+# Waiters beyond the freed seat count considered when some want a full tier
+WAITLIST_LOOKAHEAD = 5
+
+
+def hold_ttl():
+    """How long a PENDING ticket keeps its seat before the hold lapses."""
+    return timedelta(minutes=int(os.environ.get('TICKET_HOLD_MINUTES', 15)))
+
+
+def hold_cutoff():
+    return datetime.now(timezone.utc) - hold_ttl()
+
+
+def hold_expires_at(ticket):
+    purchased_at = ticket.purchased_at
+    if purchased_at.tzinfo is None:
+        purchased_at = purchased_at.replace(tzinfo=timezone.utc)
+    return purchased_at + hold_ttl()
+
+
+def is_hold_expired(ticket):
+    return ticket.payment_status == PaymentStatus.PENDING and hold_expires_at(ticket) <= datetime.now(timezone.utc)
+
+
+def _increment(model, row_id, quantity, capacity_column=None):
+    statement = update(model).where(model.id == row_id)
+    if capacity_column is not None:
+        unbounded = [capacity_column.is_(None)]
+        if capacity_column is Event.max_attendees:
+            # Like the original max_attendees check, a zero event capacity means unbounded;
+            # a tier capacity is at least 1, so 0 there would mean sold out
+            unbounded.append(capacity_column == 0)
+        statement = statement.where(or_(
+            *unbounded,
+            model.seats_taken + quantity <= capacity_column
+        ))
+    result = db.session.execute(
+        statement.values(seats_taken=model.seats_taken + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def allocate_seats(event, quantity=1, tier=None):
+    """
+    Atomically take `quantity` seats on an event, and on `tier` when given,
+    inside the caller's transaction.
+    
+    Each counter is checked and incremented by a single conditional UPDATE,
+    so concurrent buyers cannot pass the capacity check together; only the
+    event's own rows are locked, always event before tier. When the event
+    or tier looks full, lapsed holds on the event are expired first and the
+    allocation is retried once. On False the caller must roll back.
+    
+    Returns:
+        bool: True if the seats were taken
+    """
+    return _allocate(event.id, quantity, tier.id if tier else None)
+
+
+def _allocate(event_id, quantity, tier_id=None):
+    for attempt in range(2):
+        if _increment(Event, event_id, quantity, Event.max_attendees):
+            if tier_id is None or _increment(TicketTier, tier_id, quantity, TicketTier.capacity):
+                return True
+            # Undo the event seat taken for a tier that turned out to be full
+            _increment(Event, event_id, -quantity)
+        if attempt == 0 and not _expire_holds(event_id=event_id):
+            return False
+    return False
+
+
+def _apply_seat_delta(counts, sign):
+    """`counts` maps (event_id, tier_id) -> seats; one UPDATE per event and per tier."""
+    by_event = Counter()
+    for (event_id, tier_id), count in counts.items():
+        by_event[event_id] += count
+        if tier_id and count:
+            _adjust(TicketTier, tier_id, sign * count)
+    for event_id, count in by_event.items():
+        if count:
+            _adjust(Event, event_id, sign * count)
+
+
+def _adjust(model, row_id, delta):
+    if delta >= 0:
+        seats = model.seats_taken + delta
+    else:
+        seats = case((model.seats_taken > -delta, model.seats_taken + delta), else_=0)
+    db.session.execute(
+        update(model).where(model.id == row_id).values(seats_taken=seats)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def release_seats(counts):
+    """Give seats back to their events and tiers, then hand them to the
+    event's waitlist in the same transaction."""
+    _apply_seat_delta(counts, -1)
+    
+    by_event = Counter()
+    for (event_id, _), count in counts.items():
+        by_event[event_id] += count
+    for event_id, count in by_event.items():
+        if count:
+            promote_waitlist(event_id, count)
+
+
+def promote_waitlist(event_id, seats):
+    """
+    Turn up to `seats` waiting entries into PENDING tickets, in position
+    order, inside the caller's transaction. A waiter whose tier is still
+    full is passed over (at most WAITLIST_LOOKAHEAD of them) and keeps their
+    place.
+    
+    Returns:
+        int: number of waiters promoted
+    """
+    waiters = WaitlistEntry.query.filter_by(
+        event_id=event_id, status=WaitlistStatus.WAITING
+    ).order_by(WaitlistEntry.position).limit(seats + WAITLIST_LOOKAHEAD).with_for_update(skip_locked=True).populate_existing().all()
+    if not waiters:
+        return 0
+    
+    event = db.session.get(Event, event_id)
+    tier_ids = {waiter.tier_id for waiter in waiters if waiter.tier_id}
+    tiers = {tier.id: tier for tier in TicketTier.query.filter(TicketTier.id.in_(tier_ids))} if tier_ids else {}
+    existing_tickets = {ticket.user_id: ticket for ticket in Ticket.query.filter(
+        Ticket.event_id == event_id,
+        Ticket.order_id.is_(None),
+        Ticket.user_id.in_([waiter.user_id for waiter in waiters])
+    ).populate_existing()}
+    
+    promoted = 0
+    now = datetime.now(timezone.utc)
+    for waiter in waiters:
+        if promoted >= seats:
+            break
+        
+        existing = existing_tickets.get(waiter.user_id)
+        if existing and existing.payment_status in SEAT_HOLDING_STATUSES:
+            # Got a ticket some other way while waiting
+            waiter.status = WaitlistStatus.SKIPPED
+            continue
+        
+        if not _increment(Event, event_id, 1, Event.max_attendees):
+            break
+        tier = tiers.get(waiter.tier_id)
+        if tier and not _increment(TicketTier, tier.id, 1, TicketTier.capacity):
+            _increment(Event, event_id, -1)
+            continue
+        
+        price = tier.price if tier else event.ticket_price
+        ticket = existing or Ticket(event_id=event_id, user_id=waiter.user_id)
+        ticket.tier_id = tier.id if tier else None
+        ticket.ticket_price = price
+        ticket.commission = Ticket.calculate_commission(price)
+        ticket.total_amount = Ticket.calculate_total(price)
+        ticket.payment_status = PaymentStatus.PENDING
+        ticket.payment_phone = waiter.payment_phone
+        ticket.checkout_request_id = None
+        ticket.mpesa_receipt = None
+        ticket.purchased_at = now
+        db.session.add(ticket)
+        db.session.flush()
+        
+        waiter.status = WaitlistStatus.PROMOTED
+        waiter.ticket_id = ticket.id
+        waiter.promoted_at = now
+        promoted += 1
+    
+    db.session.flush()
+    return promoted
+
+
+def waitlist_position(entry):
+    """
+    1-based place in line for a waiting entry. Positions are handed out
+    contiguously and promoted in order, so this is the entry's position minus
+    the head of the queue: two index seeks regardless of queue length. It is
+    an upper bound when waiters ahead were passed over for a full tier.
+    """
+    head = db.session.query(func.min(WaitlistEntry.position)).filter(
+        WaitlistEntry.event_id == entry.event_id,
+        WaitlistEntry.status == WaitlistStatus.WAITING
+    ).scalar()
+    return entry.position - (head if head is not None else entry.position) + 1
+
+
+def join_waitlist(event, user_id, phone_number, tier=None):
+    """Append `user_id` to the event's waitlist; the caller commits."""
+    position = db.session.execute(
+        update(Event)
+        .where(Event.id == event.id)
+        .values(waitlist_tail=Event.waitlist_tail + 1)
+        .returning(Event.waitlist_tail)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+    entry = WaitlistEntry(
+        event_id=event.id,
+        user_id=user_id,
+        tier_id=tier.id if tier else None,
+        position=position,
+        payment_phone=phone_number
+    )
+    db.session.add(entry)
+    db.session.flush()
+    return entry
+
+
+def transition_tickets(criteria, from_statuses, to_status, **values):
+    """
+    Bulk-move tickets matching `criteria` between statuses, releasing their
+    seats in the same transaction when they leave a seat-holding status.
+    Tickets cannot be moved back into one here: seats are only taken through
+    the capacity checks of allocate_seats and recover_paid_tickets.
+    
+    Returns:
+        int: number of tickets moved
+    """
+    holds_after = to_status in SEAT_HOLDING_STATUSES
+    holds_before = all(status in SEAT_HOLDING_STATUSES for status in from_statuses)
+    if holds_after and not holds_before:
+        raise ValueError('Tickets regain seats through recover_paid_tickets')
+    
+    rows = db.session.execute(
+        update(Ticket)
+        .where(criteria, Ticket.payment_status.in_(from_statuses))
+        .values(payment_status=to_status, **values)
+        .returning(Ticket.event_id, Ticket.tier_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    
+    if holds_before and not holds_after:
+        release_seats(Counter((row.event_id, row.tier_id) for row in rows))
+    return len(rows)
+
+
+def recover_paid_tickets(criteria, from_statuses, **values):
+    """
+    Complete tickets matching `criteria` that were paid after their hold
+    lapsed or failed, if their seats are still free.
+    
+    Seats are taken with the same conditional UPDATEs as allocate_seats, all
+    tickets of a group order or none of them. Tickets whose seats were sold
+    again in the meantime are moved to NEEDS_REFUND instead, keeping `values`
+    (such as the M-Pesa receipt) for the refund.
+    
+    Returns:
+        tuple: rows (id, order_id) of the tickets completed, and of those
+        that need a refund
+    """
+    rows = db.session.execute(
+        select(Ticket.id, Ticket.event_id, Ticket.tier_id, Ticket.order_id)
+        .where(criteria, Ticket.payment_status.in_(from_statuses))
+        .order_by(Ticket.id)
+        .with_for_update()
+    ).all()
+    
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row.order_id or row.id, row.event_id, row.tier_id)].append(row)
+    
+    completed = []
+    needs_refund = []
+    for (_, event_id, tier_id), tickets in groups.items():
+        if _allocate(event_id, len(tickets), tier_id):
+            completed.extend(tickets)
+        else:
+            needs_refund.extend(tickets)
+    
+    for tickets, status in ((completed, PaymentStatus.COMPLETED), (needs_refund, PaymentStatus.NEEDS_REFUND)):
+        if tickets:
+            db.session.execute(
+                update(Ticket)
+                .where(Ticket.id.in_([ticket.id for ticket in tickets]))
+                .values(payment_status=status, **values)
+                .execution_options(synchronize_session=False)
+            )
+    return completed, needs_refund
+
+
+def _expire_holds(event_id=None, limit=None):
+    cutoff = hold_cutoff()
+    stale_ids = select(Ticket.id).where(
+        Ticket.payment_status == PaymentStatus.PENDING,
+        Ticket.purchased_at <= cutoff
+    )
+    stale_orders = update(Order).where(
+        Order.payment_status == PaymentStatus.PENDING,
+        Order.purchased_at <= cutoff
+    )
+    if event_id:
+        stale_ids = stale_ids.where(Ticket.event_id == event_id)
+        stale_orders = stale_orders.where(Order.event_id == event_id)
+    if limit:
+        stale_ids = stale_ids.limit(limit)
+    
+    expired = transition_tickets(
+        Ticket.id.in_(stale_ids.scalar_subquery()),
+        [PaymentStatus.PENDING],
+        PaymentStatus.EXPIRED
+    )
+    if expired:
+        # Orders lapse with their tickets, which all share the order's purchased_at
+        db.session.execute(
+            stale_orders.values(payment_status=PaymentStatus.EXPIRED)
+            .execution_options(synchronize_session=False)
+        )
+    return expired
+
+
+def expire_stale_holds(batch_size=500):
+    """
+    Mark PENDING tickets whose hold has lapsed as EXPIRED and release their
+    seats, batch_size rows per transaction so the sweep never holds long
+    locks during a sale.
+    
+    A callback that arrives after expiry still completes the ticket if its
+    seat is free, and flags it NEEDS_REFUND otherwise; see
+    recover_paid_tickets.
+    
+    Returns:
+        int: number of tickets expired
+    """
+    expired = 0
+    
+    while True:
+        try:
+            count = _expire_holds(limit=batch_size)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise e
+        
+        expired += count
+        if count < batch_size:
+            break
+    
+    return expired
+
+
+def resync_seats_taken():
+    """Recompute every event and tier seats_taken counter from its tickets."""
+    held_by_event = select(func.count(Ticket.id)).where(
+        Ticket.event_id == Event.id,
+        Ticket.payment_status.in_(SEAT_HOLDING_STATUSES)
+    ).scalar_subquery()
+    held_by_tier = select(func.count(Ticket.id)).where(
+        Ticket.tier_id == TicketTier.id,
+        Ticket.payment_status.in_(SEAT_HOLDING_STATUSES)
+    ).scalar_subquery()
+    try:
+        result = db.session.execute(
+            update(Event).values(seats_taken=held_by_event).execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            update(TicketTier).values(seats_taken=held_by_tier).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount
+    except Exception as e:
+        db.session.rollback()
+        raise e
@@ -0,0 +1,168 @@
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from functools import wraps
+from flask import current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from auth import internal_access_required
+
+_IN_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)')
+_PARAM = re.compile(r'%\(\w+\)s|:\w+|\?')
+_WHITESPACE = re.compile(r'\s+')
+# 404s and other requests that match no rule share one bucket so scanners
+# probing random paths cannot grow _routes without bound
+UNMATCHED_ROUTE = '<unmatched>'
+
+_reports = deque(maxlen=200)
+_routes = {}
+_lock = threading.Lock()
+
+
+def query_budget(max_queries):
+    """
+    Declare the most SQL statements a route may run per request. Place it
+    directly under the route decorator. Only checked while SQL_PROFILE is on;
+    with SQL_PROFILE_STRICT the request fails when the budget is exceeded.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            return f(*args, **kwargs)
+        decorated_function.query_budget = max_queries
+        return decorated_function
+    return decorator
+
+
+def statement_shape(statement):
+    """Collapse bound parameters and IN-lists so the same query issued with
+    different ids counts as one shape."""
+    shape = _IN_LIST.sub('(?...)', statement)
+    shape = _PARAM.sub('?', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def _threshold():
+    return int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_profile' in g:
+        conn.info.setdefault('sql_profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or 'sql_profile' not in g:
+        return
+    started = conn.info.get('sql_profile_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    profile = g.sql_profile
+    profile['queries'] += 1
+    profile['db_time'] += elapsed
+    profile['shapes'][statement_shape(statement)] += 1
+
+
+def _route_budget():
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if budget is None and os.environ.get('SQL_DEFAULT_QUERY_BUDGET'):
+        budget = int(os.environ['SQL_DEFAULT_QUERY_BUDGET'])
+    return budget
+
+
+def _report(profile, status_code):
+    threshold = _threshold()
+    route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+    suspects = [
+        {'count': count, 'statement': shape}
+        for shape, count in profile['shapes'].most_common()
+        if count >= threshold
+    ]
+    budget = _route_budget()
+    return {
+        'route': route,
+        'method': request.method,
+        'endpoint': request.endpoint,
+        'status': status_code,
+        'queries': profile['queries'],
+        'db_time_ms': round(profile['db_time'] * 1000, 3),
+        'distinct_statements': len(profile['shapes']),
+        'n_plus_one': suspects,
+        'query_budget': budget,
+        'over_budget': budget is not None and profile['queries'] > budget
+    }
+
+
+def _aggregate(report):
+    key = f"{report['method']} {report['route']}"
+    with _lock:
+        _reports.append(report)
+        stats = _routes.setdefault(key, {'requests': 0, 'max_queries': 0, 'total_queries': 0,
+                                         'n_plus_one_requests': 0, 'over_budget_requests': 0})
+        stats['requests'] += 1
+        stats['total_queries'] += report['queries']
+        stats['max_queries'] = max(stats['max_queries'], report['queries'])
+        stats['n_plus_one_requests'] += 1 if report['n_plus_one'] else 0
+        stats['over_budget_requests'] += 1 if report['over_budget'] else 0
+
+
+def profile_summary():
+    with _lock:
+        return {'routes': dict(_routes), 'recent': list(_reports)[-50:]}
+
+
+def init_sql_profiler(app):
+    """
+    Enable the profiler when SQL_PROFILE is set (development and staging
+    only: it times every statement). Each response gets X-SQL-Queries and
+    X-SQL-Time-Ms headers; statement shapes repeated SQL_N_PLUS_ONE_THRESHOLD
+    or more times in one request are logged as likely N+1 queries.
+    """
+    if os.environ.get('SQL_PROFILE', '').lower() not in ('1', 'true', 'yes'):
+        return
+    strict = os.environ.get('SQL_PROFILE_STRICT', '').lower() in ('1', 'true', 'yes')
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_sql_profile():
+        g.sql_profile = {'queries': 0, 'db_time': 0.0, 'shapes': Counter()}
+
+    @app.after_request
+    def finish_sql_profile(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None or request.endpoint == 'sql_profile_report':
+            return response
+
+        report = _report(profile, response.status_code)
+        _aggregate(report)
+
+        for suspect in report['n_plus_one']:
+            app.logger.warning(
+                'Possible N+1 on %s %s: statement ran %d times: %s',
+                report['method'], report['route'], suspect['count'], suspect['statement']
+            )
+        if report['over_budget']:
+            app.logger.warning(
+                'Query budget exceeded on %s %s: %d queries, budget %d',
+                report['method'], report['route'], report['queries'], report['query_budget']
+            )
+            if strict:
+                response = jsonify({'error': 'Query budget exceeded', 'sql_profile': report})
+                response.status_code = 500
+
+        response.headers['X-SQL-Queries'] = str(report['queries'])
+        response.headers['X-SQL-Time-Ms'] = str(report['db_time_ms'])
+        if report['n_plus_one']:
+            response.headers['X-SQL-N-Plus-One'] = str(len(report['n_plus_one']))
+        return response
+
+    @app.get('/api/debug/sql-profile', endpoint='sql_profile_report')
+    @internal_access_required
+    def sql_profile_report():
+        return jsonify(profile_summary()), 200
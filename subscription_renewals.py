@@ -0,0 +1,235 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, or_, select, update
+from extension import db
+from circuit_breaker import PaymentsUnavailable
+from club_models import ClubSubscription
+from models import User
+
+
+def subscription_reference(subscription_id):
+    return f"SUB{subscription_id[:8]}"
+
+
+def pending_timeout():
+    """How long a subscription payment may wait for its callback before the
+    user can start another and reconciliation queries its status."""
+    return timedelta(minutes=int(os.environ.get('SUBSCRIPTION_PENDING_TIMEOUT_MINUTES', 15)))
+
+
+def renewal_retry_interval():
+    """Minimum time between two renewal pushes for the same subscription."""
+    return timedelta(hours=int(os.environ.get('SUBSCRIPTION_RENEWAL_RETRY_HOURS', 6)))
+
+
+def renewal_max_attempts():
+    """Renewal pushes sent per subscription before the scheduler stops asking
+    and leaves it to lapse; a payment resets the count."""
+    return int(os.environ.get('SUBSCRIPTION_RENEWAL_MAX_ATTEMPTS', 3))
+
+
+def bump_subscriptions_version(user_ids):
+    """Invalidate cached subscription lists of the given users (a list or a
+    SELECT of user ids). The caller commits."""
+    db.session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(subscriptions_version=User.subscriptions_version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def extend_subscriptions(outcomes):
+    """
+    Activate subscriptions whose payment succeeded, extending each by its
+    renewal period from its current expiry, or from now if it has lapsed.
+    `outcomes` maps subscription id to M-Pesa receipt. The caller commits.
+    """
+    if not outcomes:
+        return 0
+    now = datetime.now(timezone.utc)
+    subscriptions = ClubSubscription.query.filter(ClubSubscription.id.in_(list(outcomes))).all()
+    for subscription in subscriptions:
+        expires_at = subscription.expires_at
+        if expires_at is not None and expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        start = expires_at if expires_at and expires_at > now else now
+        subscription.expires_at = start + ClubSubscription.period_length(subscription.renewal_period)
+        subscription.is_active = True
+        subscription.payment_status = 'completed'
+        subscription.renewal_attempts = 0
+        subscription.mpesa_receipt = outcomes[subscription.id] or subscription.mpesa_receipt
+    if subscriptions:
+        bump_subscriptions_version({subscription.user_id for subscription in subscriptions})
+    return len(subscriptions)
+
+
+def fail_subscription_payments(subscription_ids):
+    """Mark still-pending payments of the given subscriptions failed. The
+    caller commits.
+    
+    Returns:
+        int: number of subscriptions moved to failed
+    """
+    if not subscription_ids:
+        return 0
+    still_pending = (ClubSubscription.id.in_(subscription_ids), ClubSubscription.payment_status == 'pending')
+    bump_subscriptions_version(select(ClubSubscription.user_id).where(*still_pending))
+    result = db.session.execute(
+        update(ClubSubscription)
+        .where(*still_pending)
+        .values(payment_status='failed')
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def expire_lapsed_subscriptions(now=None):
+    """Deactivate every subscription past its expiry with one UPDATE over
+    ix_club_subscriptions_expires_at_is_active. The caller commits."""
+    now = now or datetime.now(timezone.utc)
+    lapsed = (ClubSubscription.expires_at < now, ClubSubscription.is_active.is_(True))
+    bump_subscriptions_version(select(ClubSubscription.user_id).where(*lapsed))
+    result = db.session.execute(
+        update(ClubSubscription)
+        .where(*lapsed)
+        .values(is_active=False)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def _due_batch(now, horizon, batch_size, after=None):
+    """
+    Next page of active subscriptions expiring before `horizon`,
+    keyset-paginated on (expires_at, id). Subscriptions pushed within the
+    retry interval, whether still pending or declined, are skipped, and so
+    are those that used up their renewal attempts.
+    """
+    query = db.session.query(
+        ClubSubscription.id,
+        ClubSubscription.user_id,
+        ClubSubscription.expires_at,
+        ClubSubscription.payment_phone,
+        ClubSubscription.renewal_period,
+        ClubSubscription.club_name,
+        ClubSubscription.renewal_attempts
+    ).filter(
+        ClubSubscription.expires_at >= now,
+        ClubSubscription.expires_at < horizon,
+        ClubSubscription.is_active.is_(True),
+        ClubSubscription.payment_phone.isnot(None),
+        ClubSubscription.renewal_attempts < renewal_max_attempts(),
+        or_(
+            ClubSubscription.payment_requested_at.is_(None),
+            ClubSubscription.payment_requested_at < now - renewal_retry_interval()
+        )
+    )
+    
+    if after:
+        last_expires_at, last_id = after
+        query = query.filter(or_(
+            ClubSubscription.expires_at > last_expires_at,
+            and_(ClubSubscription.expires_at == last_expires_at, ClubSubscription.id > last_id)
+        ))
+    
+    return query.order_by(ClubSubscription.expires_at, ClubSubscription.id).limit(batch_size).all()
+
+
+def _request_renewal(client, row):
+    """None when the breaker or bulkhead shed the push: nothing was sent, so
+    it is not an attempt."""
+    try:
+        return client.stk_push(
+            phone_number=row.payment_phone,
+            amount=ClubSubscription.period_amounts(row.renewal_period)[2],
+            account_reference=subscription_reference(row.id),
+            transaction_desc=f"{row.club_name} subscription renewal"
+        )
+    except PaymentsUnavailable:
+        return None
+    except Exception:
+        return {}
+
+
+def renew_subscriptions(client, lead_hours=24, batch_size=500, concurrency=8):
+    """
+    Expire lapsed subscriptions in bulk, then send renewal STK pushes for
+    those expiring within `lead_hours`.
+    
+    Due subscriptions are walked in indexed batches so memory stays flat no
+    matter how many are due, pushes run with at most `concurrency` requests
+    in flight, and each batch's checkout ids are written with one bulk
+    UPDATE and committed. Payment callbacks then extend the subscriptions.
+    
+    Every push, accepted or not, counts as an attempt, so a declined or
+    unanswered renewal is retried only after the retry interval and at
+    most `renewal_max_attempts()` times. Run reconcile_pending_subscriptions
+    first so a renewal paid without a callback is not pushed again.
+    
+    A push rejected by the open circuit breaker or a full bulkhead was never
+    sent: its subscription is left untouched, and the run stops after that
+    batch instead of burning every remaining subscription's attempts.
+    
+    Returns:
+        dict: counts of expired, requested, failed and skipped renewals
+    """
+    now = datetime.now(timezone.utc)
+    horizon = now + timedelta(hours=lead_hours)
+    summary = {'expired': 0, 'requested': 0, 'failed': 0, 'skipped': 0}
+    
+    try:
+        summary['expired'] = expire_lapsed_subscriptions(now)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+    
+    after = None
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            batch = _due_batch(now, horizon, batch_size, after)
+            if not batch:
+                break
+            after = (batch[-1].expires_at, batch[-1].id)
+            
+            responses = executor.map(lambda row: _request_renewal(client, row), batch)
+            
+            requested = []
+            attempted = []
+            skipped = 0
+            renewing_users = set()
+            for row, response in zip(batch, responses):
+                if response is None:
+                    skipped += 1
+                    continue
+                attempt = {'id': row.id, 'payment_requested_at': now, 'renewal_attempts': row.renewal_attempts + 1}
+                if response.get('ResponseCode') == '0':
+                    renewing_users.add(row.user_id)
+                    requested.append(dict(
+                        attempt,
+                        payment_status='pending',
+                        checkout_request_id=response.get('CheckoutRequestID')
+                    ))
+                else:
+                    attempted.append(attempt)
+            
+            try:
+                if requested:
+                    db.session.execute(update(ClubSubscription), requested)
+                    bump_subscriptions_version(renewing_users)
+                if attempted:
+                    db.session.execute(update(ClubSubscription), attempted)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                raise e
+            
+            summary['requested'] += len(requested)
+            summary['failed'] += len(attempted)
+            summary['skipped'] += skipped
+            if skipped:
+                break
+    
+    return summary
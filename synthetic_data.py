@@ -0,0 +1,311 @@
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import Enum
+from werkzeug.security import generate_password_hash
+from extension import db
+from models import User, UserRole, Event, EventStatus, TicketTier, Ticket, PaymentStatus
+from club_models import ClubSubscription
+from club_codes import generate_club_codes
+from reservations import SEAT_HOLDING_STATUSES
+
+DEFAULT_PAYMENT_MIX = 'completed=0.75,pending=0.08,failed=0.1,expired=0.05,refunded=0.02'
+DEFAULT_PASSWORD = 'Synthetic123'
+TIER_PRICES = (200.0, 500.0, 1000.0, 1500.0, 2500.0)
+SQLITE_CACHE_KIB = 512 * 1024
+SALES_WINDOW_SECONDS = 90 * 24 * 3600
+# Version 4 and RFC 4122 variant bits
+UUID4_CLEAR = ~((0xf << 76) | (0x3 << 62))
+UUID4_SET = (0x4 << 76) | (0x2 << 62)
+LOCATIONS = ('Nairobi', 'Mombasa', 'Kisumu', 'Nakuru', 'Eldoret', 'Thika', 'Naivasha')
+
+USER_COLUMNS = (
+    'id', 'username', 'email', 'password', 'role', 'created_at', 'is_active', 'club_name',
+    'subscription_active', 'subscription_expires_at', 'club_access_code', 'subscriptions_version', 'leader_id'
+)
+EVENT_COLUMNS = (
+    'id', 'title', 'description', 'event_date', 'location', 'ticket_price', 'vip_price', 'max_attendees',
+    'seats_taken', 'waitlist_tail', 'renewal_period', 'status', 'leader_id', 'created_at', 'updated_at'
+)
+TIER_COLUMNS = ('id', 'event_id', 'name', 'price', 'capacity', 'seats_taken')
+TICKET_COLUMNS = (
+    'id', 'event_id', 'user_id', 'tier_id', 'ticket_price', 'commission', 'total_amount', 'payment_status',
+    'mpesa_receipt', 'payment_phone', 'checkout_request_id', 'purchased_at'
+)
+SUBSCRIPTION_COLUMNS = (
+    'id', 'user_id', 'club_access_code', 'club_name', 'subscription_fee', 'platform_commission', 'total_amount',
+    'renewal_period', 'payment_status', 'mpesa_receipt', 'payment_phone', 'created_at', 'expires_at', 'is_active'
+)
+
+
+def parse_range(value):
+    """'5' or '2-10' as an inclusive (low, high) pair."""
+    low, _, high = str(value).partition('-')
+    low = int(low)
+    high = int(high) if high else low
+    if low < 0 or high < low:
+        raise ValueError(f'Invalid range: {value}')
+    return low, high
+
+
+def parse_payment_mix(value):
+    """'completed=0.8,pending=0.2' as (statuses, weights) for random.choices."""
+    statuses = []
+    weights = []
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        statuses.append(PaymentStatus(name.strip().lower()))
+        weights.append(float(weight))
+    if not statuses or sum(weights) <= 0:
+        raise ValueError(f'Invalid payment mix: {value}')
+    return statuses, weights
+
+
+def _copy_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+class _TableWriter:
+    """
+    Buffers row tuples for one table and writes them with COPY on PostgreSQL
+    (psycopg2), or a driver-level executemany elsewhere. Values go through
+    each column type's bind processor once, so they are stored exactly as the
+    ORM would store them, without the per-statement overhead of the ORM or
+    Core parameter handling.
+    """
+
+    def __init__(self, model, columns):
+        self.table = model.__table__
+        self.columns = columns
+        self.rows = []
+        self.written = 0
+        self._dialect = None
+        self._processors = None
+
+    def add(self, row):
+        self.rows.append(row)
+
+    def _process(self, dialect):
+        if self._dialect is not dialect:
+            self._dialect = dialect
+            self._processors = []
+            for index, name in enumerate(self.columns):
+                column_type = self.table.c[name].type
+                processor = column_type.dialect_impl(dialect).bind_processor(dialect)
+                if processor is not None and isinstance(column_type, Enum):
+                    # A handful of distinct values: look them up instead
+                    processor = {member: processor(member) for member in column_type.enum_class}.get
+                if processor is not None:
+                    self._processors.append((index, processor))
+        if not self._processors:
+            return self.rows
+        # Column-wise: one map() per converted column instead of a Python loop per value
+        columns = list(zip(*self.rows))
+        for index, processor in self._processors:
+            columns[index] = map(processor, columns[index])
+        return list(zip(*columns))
+
+    def flush(self, connection):
+        if not self.rows:
+            return
+        dialect = connection.dialect
+        rows = self._process(dialect)
+        if dialect.name == 'postgresql' and dialect.driver == 'psycopg2':
+            self._copy(connection, rows)
+        elif dialect.paramstyle in ('qmark', 'format'):
+            placeholder = '?' if dialect.paramstyle == 'qmark' else '%s'
+            connection.exec_driver_sql(
+                f"INSERT INTO {self.table.name} ({', '.join(self.columns)}) "
+                f"VALUES ({', '.join([placeholder] * len(self.columns))})",
+                rows
+            )
+        else:
+            connection.execute(self.table.insert(), [dict(zip(self.columns, row)) for row in self.rows])
+        self.written += len(self.rows)
+        self.rows = []
+
+    def _copy(self, connection, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_copy_value(value) for value in row])
+        buffer.seek(0)
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {self.table.name} ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        finally:
+            cursor.close()
+
+
+class _Loader:
+    """Writers in foreign-key order. Whenever one buffer fills, every buffer
+    is flushed in that order and the batch committed, so a row never reaches
+    the database before the rows it references."""
+
+    def __init__(self, batch_size, progress=None):
+        self.batch_size = batch_size
+        self.progress = progress
+        self.users = _TableWriter(User, USER_COLUMNS)
+        self.events = _TableWriter(Event, EVENT_COLUMNS)
+        self.tiers = _TableWriter(TicketTier, TIER_COLUMNS)
+        self.tickets = _TableWriter(Ticket, TICKET_COLUMNS)
+        self.subscriptions = _TableWriter(ClubSubscription, SUBSCRIPTION_COLUMNS)
+        self.writers = (self.users, self.events, self.tiers, self.tickets, self.subscriptions)
+        self.started = time.perf_counter()
+
+    def add(self, writer, row):
+        writer.add(row)
+        if len(writer.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        try:
+            connection = db.session.connection()
+            if connection.dialect.name == 'sqlite':
+                # Random uuid keys touch pages all over every index; the default
+                # 2 MB page cache turns each insert into disk reads
+                connection.exec_driver_sql(f'PRAGMA cache_size = -{SQLITE_CACHE_KIB}')
+                connection.exec_driver_sql('PRAGMA synchronous = OFF')
+            for writer in self.writers:
+                writer.flush(connection)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise e
+        if self.progress:
+            self.progress(self.counts(), time.perf_counter() - self.started)
+
+    def counts(self):
+        return {
+            'users': self.users.written, 'events': self.events.written, 'ticket_tiers': self.tiers.written,
+            'tickets': self.tickets.written, 'club_subscriptions': self.subscriptions.written
+        }
+
+
+def generate(leaders=100, users=100000, events_per_leader='1-10', tickets_per_event='10-500',
+             club_size_skew=1.0, payment_mix=DEFAULT_PAYMENT_MIX, subscription_rate=0.3, vip_rate=0.3,
+             batch_size=20000, seed=None, prefix=None, password=DEFAULT_PASSWORD, progress=None):
+    """
+    Bulk-load a synthetic dataset and return the row counts per table.
+
+    Members are spread over clubs with weights 1 / rank ** club_size_skew (0
+    gives equal clubs; 1 or more gives a few very large clubs and a long tail
+    of small ones). Each leader gets an events_per_leader number of approved
+    events and each event a tickets_per_event number of tickets, capped at
+    the club's size since a member holds at most one ticket per event.
+    Ticket payment states follow payment_mix, and seats_taken counters match
+    the tickets generated. All passwords share one precomputed hash.
+
+    Ids are derived from `seed`, and usernames and emails carry `prefix`, so
+    a repeated run into the same database needs a different seed and prefix.
+    """
+    rng = random.Random(seed)
+    prefix = prefix if prefix is not None else f'syn{rng.getrandbits(24):06x}_'
+    statuses, weights = parse_payment_mix(payment_mix)
+    events_range = parse_range(events_per_leader)
+    tickets_range = parse_range(tickets_per_event)
+    renewal_periods = list(ClubSubscription.RENEWAL_PERIOD_DAYS)
+
+    def phone_number(user_id):
+        # Stable per user, like a member paying from the same line every time
+        return f'2547{int(user_id[:8], 16) % 100000000:08d}'
+
+    def new_id():
+        # Same layout as str(uuid4()), drawn from the seeded generator
+        digits = '%032x' % (rng.getrandbits(128) & UUID4_CLEAR | UUID4_SET)
+        return f'{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}'
+
+    now = datetime.now(timezone.utc)
+    password_hash = generate_password_hash(password)
+    loader = _Loader(batch_size, progress)
+
+    try:
+        club_codes = generate_club_codes(leaders)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        raise e
+
+    leader_ids = []
+    for i, club_code in enumerate(club_codes):
+        leader_id = new_id()
+        leader_ids.append(leader_id)
+        loader.add(loader.users, (
+            leader_id, f'{prefix}leader{i}', f'{prefix}leader{i}@synthetic.test', password_hash, UserRole.LEADER,
+            now - timedelta(days=rng.randint(30, 720)), True, f'Club {prefix}{i}', True,
+            now + timedelta(days=rng.randint(1, 365)), club_code, 0, None
+        ))
+
+    club_weights = [1 / (rank + 1) ** club_size_skew for rank in range(leaders)]
+    members = [[] for _ in range(leaders)]
+    for i, club in enumerate(rng.choices(range(leaders), weights=club_weights, k=users)):
+        user_id = new_id()
+        members[club].append(user_id)
+        loader.add(loader.users, (
+            user_id, f'{prefix}user{i}', f'{prefix}user{i}@synthetic.test', password_hash, UserRole.USER,
+            now - timedelta(days=rng.randint(0, 720)), True, None, False, None, None, 0, leader_ids[club]
+        ))
+
+    sequence = 0
+    for club, leader_id in enumerate(leader_ids):
+        club_members = members[club]
+        for _ in range(rng.randint(*events_range)):
+            event_id = new_id()
+            price = rng.choice(TIER_PRICES)
+            tiers = [(new_id(), TicketTier.DEFAULT_NAME, price)]
+            if rng.random() < vip_rate:
+                tiers.append((new_id(), 'vip', price * 3))
+            amounts = [(Ticket.calculate_commission(p), Ticket.calculate_total(p)) for _, _, p in tiers]
+            sold = min(len(club_members), rng.randint(*tickets_range))
+            max_attendees = max(sold, int(sold * rng.uniform(1.0, 2.0)), 1)
+            held_by_tier = [0] * len(tiers)
+            tickets = []
+            for user_id, status in zip(rng.sample(club_members, sold), rng.choices(statuses, weights, k=sold)):
+                tier_index = 1 if len(tiers) > 1 and rng.random() < 0.2 else 0
+                if status in SEAT_HOLDING_STATUSES:
+                    held_by_tier[tier_index] += 1
+                tier_id, _, tier_price = tiers[tier_index]
+                commission, total = amounts[tier_index]
+                sequence += 1
+                tickets.append((
+                    new_id(), event_id, user_id, tier_id, tier_price, commission, total, status,
+                    f'R{prefix}{sequence}' if status == PaymentStatus.COMPLETED else None,
+                    phone_number(user_id), f'ws_CO_{prefix}{sequence}',
+                    now - timedelta(seconds=rng.random() * SALES_WINDOW_SECONDS)
+                ))
+
+            event_date = now + timedelta(days=rng.randint(-90, 180), hours=rng.randint(8, 22))
+            loader.add(loader.events, (
+                event_id, f'Event {sequence} by club {club}', 'Synthetic event', event_date,
+                rng.choice(LOCATIONS), price, tiers[1][2] if len(tiers) > 1 else None, max_attendees,
+                sum(held_by_tier), 0, 'monthly', EventStatus.APPROVED, leader_id,
+                event_date - timedelta(days=rng.randint(14, 60)), now
+            ))
+            for (tier_id, name, tier_price), held in zip(tiers, held_by_tier):
+                loader.add(loader.tiers, (tier_id, event_id, name, tier_price, None, held))
+            for ticket in tickets:
+                loader.add(loader.tickets, ticket)
+
+        club_code = club_codes[club]
+        for user_id in club_members:
+            if rng.random() >= subscription_rate:
+                continue
+            renewal_period = rng.choice(renewal_periods)
+            expires_at = now + timedelta(days=rng.randint(-30, ClubSubscription.RENEWAL_PERIOD_DAYS[renewal_period]))
+            loader.add(loader.subscriptions, (
+                new_id(), user_id, club_code, f'Club {prefix}{club}', *ClubSubscription.period_amounts(renewal_period),
+                renewal_period,
+                'completed', f'RS{prefix}{user_id[:8]}', phone_number(user_id),
+                expires_at - ClubSubscription.period_length(renewal_period), expires_at, expires_at > now
+            ))
+
+    loader.flush()
+    return loader.counts()
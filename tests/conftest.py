@@ -0,0 +1,58 @@
+import os
+import sys
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv('JWT_SECRET_KEY', 'test-secret-key-0123456789abcdef0123')
+    monkeypatch.setenv('CLUB_CODE_SECRET', 'test-club-code-secret')
+    monkeypatch.setenv('ADMISSION_SECRET', 'test-admission-secret')
+    monkeypatch.setenv('TICKET_CODE_SECRET', 'test-ticket-code-secret')
+    monkeypatch.delenv('MIGRATE_ON_STARTUP', raising=False)
+    monkeypatch.delenv('SQL_PROFILE', raising=False)
+
+    from app import create_app
+    from extension import db
+
+    app = create_app()
+    app.config['JWT_COOKIE_SECURE'] = False
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def daraja(monkeypatch):
+    """Factory for MpesaService clients talking to a local mpesa_simulator."""
+    from mpesa_simulator import create_simulator
+    from payments import MpesaService
+
+    servers = []
+
+    def start(**options):
+        options.setdefault('callback_delay_ms', 0)
+        server = make_server('127.0.0.1', 0, create_simulator(**options), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+        monkeypatch.setenv('MPESA_BASE_URL', f'http://127.0.0.1:{server.server_port}')
+        # Nothing listens here; the simulator's undeliverable callbacks are the lost ones being reconciled
+        monkeypatch.setenv('MPESA_CALLBACK_URL', 'http://127.0.0.1:9/api/payments/callback')
+        monkeypatch.setenv('MPESA_CONSUMER_KEY', 'key')
+        monkeypatch.setenv('MPESA_CONSUMER_SECRET', 'secret')
+        monkeypatch.setenv('MPESA_SHORTCODE', '174379')
+        monkeypatch.setenv('MPESA_PASSKEY', 'passkey')
+        return MpesaService()
+
+    yield start
+    for server in servers:
+        server.shutdown()
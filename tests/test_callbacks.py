@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from callback_ingestion import apply_callbacks, parse_stk_callback
+from extension import db
+from models import Event, EventStatus, PaymentStatus, Ticket, User, UserRole
+from reservations import expire_stale_holds
+
+
+def callback(**fields):
+    return {'Body': {'stkCallback': dict({'CheckoutRequestID': 'ws_CO_123', 'ResultCode': 0}, **fields)}}
+
+
+def test_parse_accepts_numeric_result_code_strings():
+    assert parse_stk_callback(callback(ResultCode='1032'))['result_code'] == 1032
+
+
+@pytest.mark.parametrize('payload', [
+    callback(ResultCode='not-a-number'),
+    callback(ResultCode={'code': 0}),
+    {'Body': {'stkCallback': {'CheckoutRequestID': 'ws_CO_123'}}},
+    {'Body': {'stkCallback': 'oops'}},
+    {'Body': []},
+    [],
+    None,
+])
+def test_parse_rejects_malformed_payloads(payload):
+    assert parse_stk_callback(payload) is None
+
+
+def test_callback_endpoint_rejects_non_numeric_result_code_without_error(app):
+    response = app.test_client().post('/api/payments/callback', json=callback(ResultCode='abc'))
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid callback payload'}
+
+
+def expired_ticket(max_attendees=1):
+    """A ticket whose hold lapsed before its callback arrived; returns (event_id, ticket_id)."""
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER)
+    leader.set_password('Leader123')
+    buyer = User(username='buyer', email='buyer@example.com')
+    buyer.set_password('Member123')
+    db.session.add_all([leader, buyer])
+    db.session.flush()
+    event = Event(title='Launch', event_date=datetime.now(timezone.utc) + timedelta(days=7), ticket_price=100,
+                  max_attendees=max_attendees, status=EventStatus.APPROVED, leader_id=leader.id, seats_taken=1)
+    db.session.add(event)
+    db.session.flush()
+    ticket = Ticket(event_id=event.id, user_id=buyer.id, ticket_price=100, commission=5, total_amount=105,
+                    payment_status=PaymentStatus.PENDING, checkout_request_id='ws_CO_late',
+                    purchased_at=datetime.now(timezone.utc) - timedelta(hours=1))
+    db.session.add(ticket)
+    db.session.commit()
+    assert expire_stale_holds() == 1
+    return event.id, ticket.id
+
+
+def late_success():
+    return {'checkout_request_id': 'ws_CO_late', 'account_reference': '', 'result_code': 0, 'mpesa_receipt': 'LATE1'}
+
+
+def test_late_success_callback_retakes_a_free_seat(app):
+    event_id, ticket_id = expired_ticket()
+
+    assert apply_callbacks([late_success()]) == 1
+    db.session.commit()
+
+    db.session.expire_all()
+    ticket = db.session.get(Ticket, ticket_id)
+    assert ticket.payment_status == PaymentStatus.COMPLETED
+    assert ticket.mpesa_receipt == 'LATE1'
+    assert db.session.get(Event, event_id).seats_taken == 1
+
+
+def test_late_success_callback_never_oversells_a_resold_seat(app):
+    event_id, ticket_id = expired_ticket()
+    # The freed seat was sold to someone else before the payment came through
+    db.session.get(Event, event_id).seats_taken = 1
+    db.session.commit()
+
+    apply_callbacks([late_success()])
+    db.session.commit()
+    # A duplicate delivery of the same callback changes nothing
+    apply_callbacks([late_success()])
+    db.session.commit()
+
+    db.session.expire_all()
+    ticket = db.session.get(Ticket, ticket_id)
+    assert ticket.payment_status == PaymentStatus.NEEDS_REFUND
+    assert ticket.mpesa_receipt == 'LATE1'
+    assert db.session.get(Event, event_id).seats_taken == 1
+
+
+def test_account_reference_fallback_needs_one_exact_id_prefix(app):
+    event_id, ticket_id = expired_ticket(max_attendees=5)
+    for number in (1, 2):
+        user = User(username=f'other{number}', email=f'other{number}@example.com')
+        user.set_password('Member123')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Ticket(id=f'abcdef12-0000-4000-8000-00000000000{number}', event_id=event_id, user_id=user.id,
+                              ticket_price=100, commission=5, total_amount=105, payment_status=PaymentStatus.PENDING))
+    db.session.commit()
+
+    def by_reference(reference):
+        return {'checkout_request_id': None, 'account_reference': reference, 'result_code': 0, 'mpesa_receipt': 'R1'}
+
+    # Wildcards, short prefixes and a prefix shared by two tickets match nothing
+    for reference in ('TICKET%', 'TICKET________', f'TICKET{ticket_id[:4]}', 'TICKETabcdef12'):
+        assert apply_callbacks([by_reference(reference)]) == 0, reference
+    assert apply_callbacks([by_reference(f'TICKET{ticket_id[:8]}')]) == 1
+    db.session.commit()
+
+    db.session.expire_all()
+    assert db.session.get(Ticket, ticket_id).payment_status == PaymentStatus.COMPLETED
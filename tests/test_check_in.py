@@ -0,0 +1,53 @@
+import hashlib
+import hmac
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import check_in
+from check_in import current_manifest
+from extension import db
+from models import CheckInManifest, Event, EventStatus, User, UserRole
+
+
+def test_concurrent_first_manifest_build_returns_the_stored_one(app, monkeypatch):
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER)
+    leader.set_password('Leader123')
+    db.session.add(leader)
+    db.session.flush()
+    event = Event(title='Launch', event_date=datetime.now(timezone.utc) + timedelta(days=7), ticket_price=100,
+                  status=EventStatus.APPROVED, leader_id=leader.id)
+    db.session.add(event)
+    db.session.commit()
+    event_id = event.id
+
+    build_manifest = check_in.build_manifest
+
+    def build_while_another_scanner_stores(event_id):
+        manifest = build_manifest(event_id)
+        # Another scanner stores its first manifest before this one commits
+        with db.engine.begin() as connection:
+            connection.execute(CheckInManifest.__table__.insert().values(
+                event_id=event_id, payload='{"tickets":[]}', ticket_count=0,
+                generated_at=datetime.now(timezone.utc)))
+        return manifest
+
+    monkeypatch.setattr(check_in, 'build_manifest', build_while_another_scanner_stores)
+    manifest = current_manifest(event_id)
+
+    assert manifest.event_id == event_id
+    assert manifest.payload == '{"tickets":[]}'
+
+
+def test_startup_requires_ticket_code_secret_outside_development(app, monkeypatch):
+    from app import create_app
+
+    monkeypatch.delenv('TICKET_CODE_SECRET')
+    monkeypatch.delenv('FLASK_ENV', raising=False)
+    with pytest.raises(ValueError, match='TICKET_CODE_SECRET'):
+        create_app()
+
+    monkeypatch.setenv('FLASK_ENV', 'development')
+    create_app()
+    jwt_key = hmac.new(app.config['JWT_SECRET_KEY'].encode(), b'ticket-code:1', hashlib.sha256).digest()
+    assert check_in.event_key(1) != jwt_key
@@ -0,0 +1,46 @@
+import pytest
+
+from circuit_breaker import CircuitBreaker, PaymentsUnavailable
+
+
+def half_open_service(daraja):
+    service = daraja()
+    service.breaker = CircuitBreaker('mpesa', failure_threshold=1, recovery_timeout=0)
+    service.breaker.before_call()
+    service.breaker.record_failure(0.01)
+    assert service.breaker.state == CircuitBreaker.HALF_OPEN
+    return service
+
+
+def test_bulkhead_rejection_does_not_strand_the_half_open_probe(daraja):
+    service = half_open_service(daraja)
+    service.bulkhead.max_concurrent = 1
+    service.bulkhead.acquire_timeout = 0
+    for _ in range(service.bulkhead._semaphore._value):
+        service.bulkhead._semaphore.acquire()
+
+    with pytest.raises(PaymentsUnavailable):
+        service.get_access_token()
+    assert service.breaker._half_open_in_flight == 0
+
+    service.bulkhead._semaphore.release()
+    assert service.get_access_token()
+    assert service.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_non_network_error_releases_the_half_open_probe(daraja):
+    service = half_open_service(daraja)
+
+    def broken_request(*args, **kwargs):
+        raise ValueError('bad request arguments')
+
+    request = service.session.request
+    service.session.request = broken_request
+    with pytest.raises(ValueError):
+        service.get_access_token()
+    assert service.breaker._half_open_in_flight == 0
+    assert service.breaker.state == CircuitBreaker.HALF_OPEN
+
+    service.session.request = request
+    assert service.get_access_token()
+    assert service.breaker.state == CircuitBreaker.CLOSED
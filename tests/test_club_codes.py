@@ -0,0 +1,71 @@
+import pytest
+
+from club_codes import generate_club_codes, permute
+
+
+def test_codes_are_distinct_and_keyed(app, monkeypatch):
+    codes = generate_club_codes(50)
+    assert len(set(codes)) == 50
+
+    first = permute(1)
+    monkeypatch.setenv('CLUB_CODE_SECRET', 'another-secret')
+    assert permute(1) != first
+
+
+def test_generating_codes_without_a_dedicated_secret_fails(app, monkeypatch):
+    monkeypatch.delenv('CLUB_CODE_SECRET')
+    with pytest.raises(ValueError, match='CLUB_CODE_SECRET'):
+        generate_club_codes(1)
+
+
+def test_counter_values_are_unique_when_first_used_concurrently(app):
+    import threading
+
+    from extension import db
+    from models import Counter
+
+    values = []
+    start = threading.Barrier(8)
+
+    def take():
+        start.wait(timeout=10)
+        with app.app_context():
+            try:
+                values.append(Counter.next_value('fresh_counter'))
+                db.session.commit()
+            finally:
+                db.session.remove()
+
+    db.session.remove()
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(values) == list(range(1, 9))
+    assert Counter.next_value('fresh_counter', 5) == 13
+
+
+def test_cached_codes_follow_leader_changes_made_by_other_workers(app):
+    from club_codes import invalidate_club_codes, resolve_club_code
+    from extension import db
+    from models import User, UserRole
+
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER,
+                  club_access_code='CLUB01', club_name='Runners')
+    leader.set_password('Leader123')
+    db.session.add(leader)
+    db.session.commit()
+    assert resolve_club_code('CLUB01').club_name == 'Runners'
+    assert resolve_club_code('NOSUCH') is None
+
+    # Another worker renames the club and issues NOSUCH; this process's cache was never touched
+    db.session.execute(db.update(User).where(User.id == leader.id).values(club_name='Joggers'))
+    db.session.execute(db.update(User).where(User.id == leader.id).values(club_access_code='NOSUCH'))
+    assert resolve_club_code('CLUB01').club_name == 'Runners'
+    invalidate_club_codes()
+    db.session.commit()
+
+    assert resolve_club_code('CLUB01') is None
+    assert resolve_club_code('NOSUCH').club_name == 'Joggers'
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from flask_jwt_extended import create_access_token
+
+from club_models import LuckyWinner
+from extension import db
+from models import (
+    CheckIn, CheckInManifest, Event, EventStatus, Order, PaymentStatus, QueuePlace, Ticket, TicketTier, User,
+    UserRole, WaitingRoom, WaitlistEntry
+)
+
+
+def enforce_foreign_keys():
+    """SQLite only checks foreign keys when asked to, per connection."""
+    sa.event.listen(db.engine, 'connect', lambda connection, _: connection.execute('PRAGMA foreign_keys=ON'))
+    db.session.remove()
+    db.engine.dispose()
+    assert db.session.execute(sa.text('PRAGMA foreign_keys')).scalar() == 1
+
+
+def test_deleting_an_event_removes_everything_that_refers_to_it(app):
+    enforce_foreign_keys()
+    now = datetime.now(timezone.utc)
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER,
+                  subscription_active=True, subscription_expires_at=now + timedelta(days=30))
+    buyer = User(username='buyer', email='buyer@example.com')
+    for user in (leader, buyer):
+        user.set_password('Member123')
+    db.session.add_all([leader, buyer])
+    db.session.flush()
+    event = Event(title='Launch', event_date=now + timedelta(days=7), ticket_price=100, max_attendees=10,
+                  status=EventStatus.APPROVED, leader_id=leader.id,
+                  tiers=[TicketTier(name='regular', price=100)])
+    db.session.add(event)
+    db.session.flush()
+    tier = event.tiers[0]
+    order = Order(event_id=event.id, user_id=buyer.id, tier_id=tier.id, quantity=1, ticket_price=100,
+                  commission=5, total_amount=105, payment_status=PaymentStatus.COMPLETED)
+    db.session.add(order)
+    db.session.flush()
+    ticket = Ticket(event_id=event.id, user_id=buyer.id, tier_id=tier.id, order_id=order.id, ticket_price=100,
+                    commission=5, total_amount=105, payment_status=PaymentStatus.COMPLETED)
+    db.session.add(ticket)
+    db.session.flush()
+    db.session.add_all([
+        CheckIn(ticket_id=ticket.id, event_id=event.id, scanned_at=now),
+        CheckInManifest(event_id=event.id, payload='[]', ticket_count=1),
+        WaitingRoom(event_id=event.id),
+        QueuePlace(event_id=event.id, user_id=buyer.id, sequence=1, admit_at=now, expires_at=now),
+        WaitlistEntry(event_id=event.id, user_id=buyer.id, tier_id=tier.id, position=1,
+                      payment_phone='254700000000', ticket_id=ticket.id),
+        LuckyWinner(event_id=event.id, user_id=buyer.id, ticket_id=ticket.id),
+    ])
+    db.session.commit()
+    event_id = event.id
+    client = app.test_client()
+    client.set_cookie('access_token', create_access_token(identity=leader.id))
+
+    response = client.delete(f'/api/events/{event_id}')
+
+    assert response.status_code == 200
+    for model in (Event, TicketTier, Order, Ticket, CheckIn, CheckInManifest, WaitingRoom, QueuePlace,
+                  WaitlistEntry, LuckyWinner):
+        assert db.session.query(model).count() == 0, model.__name__
+    assert db.session.get(User, buyer.id) is not None
@@ -0,0 +1,25 @@
+from extension import db
+from models import User
+
+ARGS = ['debug', 'generate-data', '--leaders', '1', '--users', '3', '--events-per-leader', '1',
+        '--tickets-per-event', '1']
+
+
+def test_generate_data_refuses_without_a_non_production_environment(app, monkeypatch):
+    monkeypatch.delenv('FLASK_ENV', raising=False)
+    result = app.test_cli_runner().invoke(args=ARGS + ['--seed', '1'])
+
+    assert result.exit_code != 0
+    assert '--yes-this-is-not-production' in result.output
+    assert db.session.query(User).count() == 0
+
+
+def test_generate_data_runs_when_confirmed_or_in_development(app, monkeypatch):
+    monkeypatch.delenv('FLASK_ENV', raising=False)
+    result = app.test_cli_runner().invoke(args=ARGS + ['--seed', '1', '--yes-this-is-not-production'])
+    assert result.exit_code == 0, result.output
+
+    monkeypatch.setenv('FLASK_ENV', 'development')
+    result = app.test_cli_runner().invoke(args=ARGS + ['--seed', '2'])
+    assert result.exit_code == 0, result.output
+    assert db.session.query(User).count() == 8
@@ -0,0 +1,88 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+import health
+from extension import db
+from models import User, UserRole
+
+
+def login(client, role):
+    user = User(username=role.value, email=f'{role.value}@example.com', role=role)
+    user.set_password('Secret123')
+    db.session.add(user)
+    db.session.commit()
+    client.set_cookie('access_token', create_access_token(identity=user.id))
+
+
+@pytest.fixture
+def failing_mpesa_check(monkeypatch):
+    def check_mpesa():
+        raise RuntimeError('connect to daraja.internal:443 refused')
+    monkeypatch.setattr(health, 'check_mpesa', check_mpesa)
+
+
+def test_details_needs_admin_or_internal_token(app, monkeypatch):
+    monkeypatch.setenv('HEALTH_DETAILS_TOKEN', 'internal-token')
+    client = app.test_client()
+
+    assert client.get('/api/health/details').status_code == 401
+    assert client.get('/api/health/details', headers={'X-Health-Token': 'wrong'}).status_code == 401
+    assert client.get('/api/health/details', headers={'X-Health-Token': 'internal-token'}).status_code == 200
+
+    login(client, UserRole.USER)
+    assert client.get('/api/health/details').status_code == 403
+
+
+def test_details_reports_only_the_exception_class(app, failing_mpesa_check):
+    client = app.test_client()
+    login(client, UserRole.ADMIN)
+
+    response = client.get('/api/health/details')
+
+    assert response.status_code == 200
+    assert response.get_json()['checks']['mpesa']['error'] == 'RuntimeError'
+    assert b'daraja.internal' not in response.data
+
+
+@pytest.fixture
+def sql_profiler(app, monkeypatch):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    import sql_profiler
+
+    monkeypatch.setenv('SQL_PROFILE', '1')
+    sql_profiler.init_sql_profiler(app)
+    yield
+    event.remove(Engine, 'before_cursor_execute', sql_profiler._before_cursor_execute)
+    event.remove(Engine, 'after_cursor_execute', sql_profiler._after_cursor_execute)
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/api/payments/upstream-status', '/api/debug/sql-profile'])
+def test_diagnostics_need_admin_or_internal_token(app, monkeypatch, sql_profiler, path):
+    monkeypatch.setenv('HEALTH_DETAILS_TOKEN', 'internal-token')
+    client = app.test_client()
+
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={'X-Health-Token': 'wrong'}).status_code == 401
+    assert client.get(path, headers={'X-Health-Token': 'internal-token'}).status_code == 200
+
+    login(client, UserRole.USER)
+    assert client.get(path).status_code == 403
+    login(client, UserRole.ADMIN)
+    assert client.get(path).status_code == 200
+
+
+def test_sql_profile_groups_unmatched_paths(app, monkeypatch, sql_profiler):
+    import sql_profiler as profiler
+
+    monkeypatch.setattr(profiler, '_routes', {})
+    monkeypatch.setenv('HEALTH_DETAILS_TOKEN', 'internal-token')
+    client = app.test_client()
+    for n in range(3):
+        assert client.get(f'/no-such-page-{n}').status_code == 404
+
+    routes = client.get('/api/debug/sql-profile', headers={'X-Health-Token': 'internal-token'}).get_json()['routes']
+
+    assert list(routes) == ['GET <unmatched>']
+    assert routes['GET <unmatched>']['requests'] == 3
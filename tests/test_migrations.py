@@ -0,0 +1,93 @@
+import importlib.util
+import os
+
+import pytest
+import sqlalchemy as sa
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+
+VERSIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations', 'versions')
+
+
+def load_migration(filename):
+    spec = importlib.util.spec_from_file_location(filename[:-3], os.path.join(VERSIONS, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def upgrade(connection, filename):
+    with Operations.context(MigrationContext.configure(connection)):
+        load_migration(filename).upgrade()
+
+
+@pytest.fixture
+def connection():
+    engine = sa.create_engine('sqlite://')
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            'CREATE TABLE events (id VARCHAR PRIMARY KEY, ticket_price FLOAT, vip_price FLOAT, vvip_price FLOAT)'
+        )
+        connection.exec_driver_sql(
+            'CREATE TABLE tickets (id VARCHAR PRIMARY KEY, event_id VARCHAR, user_id VARCHAR, '
+            'payment_status VARCHAR, mpesa_receipt VARCHAR, purchased_at DATETIME)'
+        )
+        connection.exec_driver_sql("INSERT INTO events (id, ticket_price) VALUES ('e1', 100)")
+        yield connection
+
+
+def insert_tickets(connection, *rows):
+    connection.execute(
+        sa.text('INSERT INTO tickets VALUES (:id, :event_id, :user_id, :status, :receipt, :purchased_at)'),
+        [dict(zip(('id', 'event_id', 'user_id', 'status', 'receipt', 'purchased_at'), row)) for row in rows]
+    )
+
+
+def test_seats_taken_migration_keeps_the_paid_ticket_and_deletes_unpaid_duplicates(connection):
+    insert_tickets(
+        connection,
+        ('t1', 'e1', 'u1', 'PENDING', None, '2025-01-01'),
+        ('t2', 'e1', 'u1', 'COMPLETED', 'RCPT2', '2025-01-02'),
+        ('t3', 'e1', 'u1', 'FAILED', None, '2025-01-03'),
+        ('t4', 'e1', 'u2', 'PENDING', None, '2025-01-01'),
+        ('t5', 'e1', 'u2', 'EXPIRED', None, '2025-01-02'),
+    )
+
+    upgrade(connection, 'd5a7b3e2c914_event_seats_taken.py')
+
+    remaining = connection.exec_driver_sql('SELECT id FROM tickets ORDER BY id').scalars().all()
+    assert remaining == ['t2', 't4']
+    assert connection.exec_driver_sql('SELECT seats_taken FROM events').scalar() == 2
+
+
+def test_seats_taken_migration_stops_on_paid_duplicates(connection):
+    insert_tickets(
+        connection,
+        ('t1', 'e1', 'u1', 'COMPLETED', 'RCPT1', '2025-01-01'),
+        ('t2', 'e1', 'u1', 'COMPLETED', 'RCPT2', '2025-01-02'),
+        ('t3', 'e1', 'u1', 'PENDING', None, '2025-01-03'),
+    )
+
+    with pytest.raises(RuntimeError, match='RCPT2'):
+        upgrade(connection, 'd5a7b3e2c914_event_seats_taken.py')
+
+    receipts = connection.exec_driver_sql('SELECT mpesa_receipt FROM tickets WHERE mpesa_receipt IS NOT NULL')
+    assert sorted(receipts.scalars()) == ['RCPT1', 'RCPT2']
+
+
+def test_tiers_migration_backfills_tiers_from_event_prices(connection):
+    connection.exec_driver_sql("INSERT INTO events VALUES ('e2', 50, 200, NULL), ('e3', NULL, 300, 900)")
+
+    upgrade(connection, 'e19b4c6d2f58_ticket_tiers.py')
+
+    tiers = connection.exec_driver_sql(
+        'SELECT event_id, name, price, capacity, seats_taken FROM ticket_tiers ORDER BY event_id, price'
+    ).all()
+    assert [tuple(tier) for tier in tiers] == [
+        ('e1', 'regular', 100.0, None, 0),
+        ('e2', 'regular', 50.0, None, 0),
+        ('e2', 'vip', 200.0, None, 0),
+        ('e3', 'regular', 0.0, None, 0),
+        ('e3', 'vip', 300.0, None, 0),
+        ('e3', 'vvip', 900.0, None, 0),
+    ]
@@ -0,0 +1,228 @@
+from datetime import datetime, timedelta, timezone
+
+from extension import db
+from models import Event, EventStatus, Order, PaymentStatus, Ticket, User, UserRole
+from reconciliation import reconcile_pending_orders, reconcile_pending_payments
+from reservations import allocate_seats, expire_stale_holds
+
+
+def make_event(max_attendees=10):
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER)
+    leader.set_password('Leader123')
+    db.session.add(leader)
+    db.session.flush()
+    event = Event(title='Launch', event_date=datetime.now(timezone.utc) + timedelta(days=7), ticket_price=100,
+                  max_attendees=max_attendees, status=EventStatus.APPROVED, leader_id=leader.id)
+    db.session.add(event)
+    db.session.flush()
+    return event
+
+
+def pending_ticket(event, client, username, minutes_ago=30):
+    """A PENDING ticket holding a seat whose STK push went out but whose callback never arrived."""
+    user = User(username=username, email=f'{username}@example.com')
+    user.set_password('Member123')
+    db.session.add(user)
+    db.session.flush()
+    response = client.stk_push(phone_number='254700000000', amount=105, account_reference='TEST',
+                               transaction_desc='Test')
+    ticket = Ticket(event_id=event.id, user_id=user.id, ticket_price=100, commission=5, total_amount=105,
+                    payment_status=PaymentStatus.PENDING, payment_phone='254700000000',
+                    checkout_request_id=response['CheckoutRequestID'],
+                    purchased_at=datetime.now(timezone.utc) - timedelta(minutes=minutes_ago))
+    db.session.add(ticket)
+    event.seats_taken += 1
+    db.session.commit()
+    return ticket.id
+
+
+def test_reconcile_settles_lost_callbacks_and_releases_seats(app, daraja):
+    paying = daraja(success_rate=1.0)
+    declining = daraja(success_rate=0.0)
+    event = make_event()
+    paid_id = pending_ticket(event, paying, 'payer')
+    declined_id = pending_ticket(event, declining, 'decliner')
+    recent_id = pending_ticket(event, paying, 'recent', minutes_ago=1)
+    event_id = event.id
+
+    # The paying simulator knows nothing of the declined push, so that ticket stays unresolved
+    summary = reconcile_pending_payments(paying, older_than_minutes=15)
+    assert summary == {'checked': 2, 'completed': 1, 'failed': 0, 'unresolved': 1, 'recovered': 0, 'needs_refund': 0}
+
+    summary = reconcile_pending_payments(declining, older_than_minutes=15)
+    assert summary == {'checked': 1, 'completed': 0, 'failed': 1, 'unresolved': 0, 'recovered': 0, 'needs_refund': 0}
+
+    db.session.expire_all()
+    assert db.session.get(Ticket, paid_id).payment_status == PaymentStatus.COMPLETED
+    assert db.session.get(Ticket, declined_id).payment_status == PaymentStatus.FAILED
+    assert db.session.get(Ticket, recent_id).payment_status == PaymentStatus.PENDING
+    # The declined ticket's seat went back to the event; paid and recent holds keep theirs
+    assert db.session.get(Event, event_id).seats_taken == 2
+
+
+def test_reconcile_leaves_tickets_pending_while_daraja_is_processing(app, daraja):
+    client = daraja(callback_delay_ms=60000)
+    event = make_event()
+    ticket_id = pending_ticket(event, client, 'waiting')
+
+    summary = reconcile_pending_payments(client, older_than_minutes=15)
+
+    assert summary == {'checked': 1, 'completed': 0, 'failed': 0, 'unresolved': 1, 'recovered': 0, 'needs_refund': 0}
+    db.session.expire_all()
+    assert db.session.get(Ticket, ticket_id).payment_status == PaymentStatus.PENDING
+
+
+def test_reconcile_recovers_paid_tickets_whose_hold_expired(app, daraja):
+    paying = daraja(success_rate=1.0)
+    declining = daraja(success_rate=0.0)
+    event = make_event()
+    paid_id = pending_ticket(event, paying, 'payer')
+    declined_id = pending_ticket(event, declining, 'decliner')
+    old_id = pending_ticket(event, paying, 'old', minutes_ago=3 * 24 * 60)
+    event_id = event.id
+    assert expire_stale_holds() == 3
+    assert db.session.get(Event, event_id).seats_taken == 0
+
+    summary = reconcile_pending_payments(paying, older_than_minutes=15, expired_within_hours=24)
+    assert summary == {'checked': 2, 'completed': 1, 'failed': 0, 'unresolved': 1, 'recovered': 1, 'needs_refund': 0}
+    summary = reconcile_pending_payments(declining, older_than_minutes=15, expired_within_hours=24)
+    assert summary == {'checked': 1, 'completed': 0, 'failed': 1, 'unresolved': 0, 'recovered': 0, 'needs_refund': 0}
+
+    db.session.expire_all()
+    assert db.session.get(Ticket, paid_id).payment_status == PaymentStatus.COMPLETED
+    assert db.session.get(Ticket, declined_id).payment_status == PaymentStatus.FAILED
+    # Outside the lookback window
+    assert db.session.get(Ticket, old_id).payment_status == PaymentStatus.EXPIRED
+    # Only the paid ticket takes its seat back
+    assert db.session.get(Event, event_id).seats_taken == 1
+
+
+def resell_seat(event_id, username):
+    """Another buyer takes the seat a lapsed hold gave back."""
+    user = User(username=username, email=f'{username}@example.com')
+    user.set_password('Member123')
+    db.session.add(user)
+    db.session.flush()
+    assert allocate_seats(db.session.get(Event, event_id))
+    db.session.add(Ticket(event_id=event_id, user_id=user.id, ticket_price=100, commission=5, total_amount=105,
+                          payment_status=PaymentStatus.COMPLETED, payment_phone='254700000000'))
+    db.session.commit()
+
+
+def test_reconcile_flags_paid_expired_tickets_whose_seat_was_resold(app, daraja):
+    paying = daraja(success_rate=1.0)
+    event = make_event(max_attendees=1)
+    late_id = pending_ticket(event, paying, 'late_payer')
+    event_id = event.id
+    assert expire_stale_holds() == 1
+    resell_seat(event_id, 'second_buyer')
+
+    summary = reconcile_pending_payments(paying, older_than_minutes=15, expired_within_hours=24)
+
+    assert summary == {'checked': 1, 'completed': 0, 'failed': 0, 'unresolved': 0, 'recovered': 0, 'needs_refund': 1}
+    db.session.expire_all()
+    assert db.session.get(Ticket, late_id).payment_status == PaymentStatus.NEEDS_REFUND
+    # The resold seat is not sold twice
+    assert db.session.get(Event, event_id).seats_taken == 1
+    # A later run leaves the flagged ticket alone
+    assert reconcile_pending_payments(paying, older_than_minutes=15)['checked'] == 0
+
+
+def pending_order(event, client, username, quantity=2, minutes_ago=30):
+    """A PENDING group order whose single STK push went out but whose callback never arrived."""
+    user = User(username=username, email=f'{username}@example.com')
+    user.set_password('Member123')
+    db.session.add(user)
+    db.session.flush()
+    response = client.stk_push(phone_number='254700000000', amount=105 * quantity, account_reference='ORDER',
+                               transaction_desc='Test')
+    purchased_at = datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)
+    order = Order(event_id=event.id, user_id=user.id, quantity=quantity, ticket_price=100, commission=5,
+                  total_amount=105 * quantity, payment_status=PaymentStatus.PENDING, payment_phone='254700000000',
+                  checkout_request_id=response['CheckoutRequestID'], purchased_at=purchased_at)
+    db.session.add(order)
+    db.session.flush()
+    for _ in range(quantity):
+        db.session.add(Ticket(event_id=event.id, user_id=user.id, order_id=order.id, ticket_price=100,
+                              commission=5, total_amount=105, payment_status=PaymentStatus.PENDING,
+                              payment_phone='254700000000', purchased_at=purchased_at))
+    event.seats_taken += quantity
+    db.session.commit()
+    return order.id
+
+
+def order_ticket_statuses(order_id):
+    return {ticket.payment_status for ticket in Ticket.query.filter_by(order_id=order_id)}
+
+
+def test_reconcile_orders_settles_the_order_and_its_tickets(app, daraja):
+    paying = daraja(success_rate=1.0)
+    declining = daraja(success_rate=0.0)
+    event = make_event()
+    paid_id = pending_order(event, paying, 'group_payer')
+    declined_id = pending_order(event, declining, 'group_decliner')
+    event_id = event.id
+
+    # Order tickets have no CheckoutRequestID of their own, so the ticket pass never sees them
+    assert reconcile_pending_payments(paying)['checked'] == 0
+
+    summary = reconcile_pending_orders(paying)
+    assert summary == {'checked': 2, 'completed': 1, 'failed': 0, 'unresolved': 1, 'recovered': 0, 'needs_refund': 0}
+    summary = reconcile_pending_orders(declining)
+    assert summary == {'checked': 1, 'completed': 0, 'failed': 1, 'unresolved': 0, 'recovered': 0, 'needs_refund': 0}
+
+    db.session.expire_all()
+    assert db.session.get(Order, paid_id).payment_status == PaymentStatus.COMPLETED
+    assert order_ticket_statuses(paid_id) == {PaymentStatus.COMPLETED}
+    assert db.session.get(Order, declined_id).payment_status == PaymentStatus.FAILED
+    assert order_ticket_statuses(declined_id) == {PaymentStatus.FAILED}
+    assert db.session.get(Event, event_id).seats_taken == 2
+
+
+def test_reconcile_orders_recovers_paid_orders_whose_hold_expired(app, daraja):
+    paying = daraja(success_rate=1.0)
+    event = make_event()
+    order_id = pending_order(event, paying, 'late_payer')
+    event_id = event.id
+    assert expire_stale_holds() == 2
+
+    summary = reconcile_pending_orders(paying)
+    assert summary == {'checked': 1, 'completed': 1, 'failed': 0, 'unresolved': 0, 'recovered': 1, 'needs_refund': 0}
+
+    db.session.expire_all()
+    assert db.session.get(Order, order_id).payment_status == PaymentStatus.COMPLETED
+    assert order_ticket_statuses(order_id) == {PaymentStatus.COMPLETED}
+    assert db.session.get(Event, event_id).seats_taken == 2
+
+
+def test_reconcile_orders_flags_paid_expired_orders_that_no_longer_fit(app, daraja):
+    paying = daraja(success_rate=1.0)
+    event = make_event(max_attendees=2)
+    order_id = pending_order(event, paying, 'late_group')
+    event_id = event.id
+    assert expire_stale_holds() == 2
+    # One of the two freed seats is sold again, so the order cannot be seated whole
+    resell_seat(event_id, 'second_buyer')
+
+    summary = reconcile_pending_orders(paying)
+
+    assert summary == {'checked': 1, 'completed': 0, 'failed': 0, 'unresolved': 0, 'recovered': 0, 'needs_refund': 1}
+    db.session.expire_all()
+    assert db.session.get(Order, order_id).payment_status == PaymentStatus.NEEDS_REFUND
+    assert order_ticket_statuses(order_id) == {PaymentStatus.NEEDS_REFUND}
+    assert db.session.get(Event, event_id).seats_taken == 1
+
+
+def test_order_tickets_cannot_be_paid_on_their_own(app, daraja):
+    from flask_jwt_extended import create_access_token
+
+    event = make_event()
+    order_id = pending_order(event, daraja(), 'grouped', minutes_ago=1)
+    ticket = Ticket.query.filter_by(order_id=order_id).first()
+    client = app.test_client()
+    client.set_cookie('access_token', create_access_token(identity=ticket.user_id))
+
+    response = client.post(f'/api/payments/initiate/{ticket.id}')
+
+    assert response.status_code == 400
+    assert response.get_json()['endpoint'] == f'/api/payments/initiate-order/{order_id}'
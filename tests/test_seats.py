@@ -0,0 +1,95 @@
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from extension import db
+from models import Event, EventStatus, TicketTier, User, UserRole
+from reservations import allocate_seats, release_seats
+
+
+def make_event(max_attendees, tier_capacity=None):
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER)
+    leader.set_password('Leader123')
+    db.session.add(leader)
+    db.session.flush()
+    event = Event(title='Launch', event_date=datetime.now(timezone.utc) + timedelta(days=7), ticket_price=100,
+                  max_attendees=max_attendees, status=EventStatus.APPROVED, leader_id=leader.id)
+    db.session.add(event)
+    db.session.flush()
+    tier = TicketTier(event_id=event.id, name='Regular', price=100, capacity=tier_capacity)
+    db.session.add(tier)
+    db.session.commit()
+    return event.id, tier.id
+
+
+def buy_concurrently(app, event_id, tier_id, buyers):
+    results = []
+    start = threading.Barrier(buyers)
+
+    def buy():
+        # Line everyone up before touching the database so no buyer holds a
+        # pooled connection while it waits for the rest.
+        start.wait(timeout=10)
+        with app.app_context():
+            try:
+                taken = allocate_seats(db.session.get(Event, event_id), tier=db.session.get(TicketTier, tier_id))
+                if taken:
+                    db.session.commit()
+                else:
+                    db.session.rollback()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+            results.append(taken)
+
+    db.session.remove()
+    threads = [threading.Thread(target=buy) for _ in range(buyers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return Counter(results)
+
+
+def test_concurrent_buyers_never_oversell_the_event(app):
+    event_id, tier_id = make_event(max_attendees=5)
+
+    results = buy_concurrently(app, event_id, tier_id, buyers=20)
+
+    assert results == {True: 5, False: 15}
+    db.session.expire_all()
+    assert db.session.get(Event, event_id).seats_taken == 5
+    assert db.session.get(TicketTier, tier_id).seats_taken == 5
+
+
+def test_concurrent_buyers_never_oversell_a_tier(app):
+    event_id, tier_id = make_event(max_attendees=50, tier_capacity=3)
+
+    results = buy_concurrently(app, event_id, tier_id, buyers=12)
+
+    assert results == {True: 3, False: 9}
+    db.session.expire_all()
+    # Event seats taken for a tier that turned out to be full are given back
+    assert db.session.get(Event, event_id).seats_taken == 3
+    assert db.session.get(TicketTier, tier_id).seats_taken == 3
+
+
+def test_released_seats_can_be_sold_again_and_never_go_negative(app):
+    event_id, tier_id = make_event(max_attendees=1)
+    event = db.session.get(Event, event_id)
+    tier = db.session.get(TicketTier, tier_id)
+    assert allocate_seats(event, tier=tier)
+    db.session.commit()
+    assert not allocate_seats(event, tier=tier)
+    db.session.rollback()
+
+    release_seats({(event_id, tier_id): 3})
+    db.session.commit()
+    db.session.expire_all()
+    assert db.session.get(Event, event_id).seats_taken == 0
+    assert db.session.get(TicketTier, tier_id).seats_taken == 0
+
+    assert allocate_seats(db.session.get(Event, event_id), tier=db.session.get(TicketTier, tier_id))
+    db.session.commit()
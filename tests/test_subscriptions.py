@@ -0,0 +1,193 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from circuit_breaker import PaymentsUnavailable
+from club_models import ClubSubscription
+from extension import db
+from models import User, UserRole
+from reconciliation import reconcile_pending_subscriptions
+from subscription_renewals import renew_subscriptions, subscription_reference
+
+
+def member(username='member'):
+    user = User(username=username, email=f'{username}@example.com')
+    user.set_password('Member123')
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def subscription(user, **values):
+    row = ClubSubscription(user_id=user.id, club_access_code='CLUB01', club_name='Runners',
+                           payment_phone='254700000000', **values)
+    db.session.add(row)
+    db.session.commit()
+    return row
+
+
+class DecliningClient:
+    def __init__(self):
+        self.pushes = 0
+
+    def stk_push(self, **kwargs):
+        self.pushes += 1
+        return {'ResponseCode': '1', 'ResponseDescription': 'Rejected'}
+
+
+class UnavailableClient:
+    def __init__(self):
+        self.pushes = 0
+
+    def stk_push(self, **kwargs):
+        self.pushes += 1
+        raise PaymentsUnavailable(retry_after=30)
+
+
+@pytest.mark.parametrize('renewal_period, days', [('Yearly ', 365), ('annual', 30), (None, 30), ('weekly', 7)])
+def test_period_length_tolerates_legacy_values(renewal_period, days):
+    assert ClubSubscription.period_length(renewal_period) == timedelta(days=days)
+
+
+def test_reconcile_settles_subscriptions_whose_callback_was_lost(app, daraja):
+    paying = daraja(success_rate=1.0)
+    user = member()
+    expires_at = datetime.now(timezone.utc) + timedelta(hours=2)
+    row = subscription(user, expires_at=expires_at, is_active=True, payment_status='pending')
+    response = paying.stk_push(phone_number='254700000000', amount=220,
+                               account_reference=subscription_reference(row.id), transaction_desc='Renewal')
+    row.checkout_request_id = response['CheckoutRequestID']
+    row.payment_requested_at = datetime.now(timezone.utc) - timedelta(minutes=30)
+    db.session.commit()
+    subscription_id = row.id
+
+    summary = reconcile_pending_subscriptions(paying)
+
+    assert summary == {'checked': 1, 'completed': 1, 'failed': 0, 'unresolved': 0}
+    db.session.expire_all()
+    renewed = db.session.get(ClubSubscription, subscription_id)
+    assert renewed.payment_status == 'completed'
+    assert renewed.expires_at.replace(tzinfo=timezone.utc) > expires_at + timedelta(days=29)
+
+
+def test_declined_renewals_are_retried_with_backoff_and_capped(app, monkeypatch):
+    monkeypatch.setenv('SUBSCRIPTION_RENEWAL_MAX_ATTEMPTS', '2')
+    client = DecliningClient()
+    row = subscription(member(), expires_at=datetime.now(timezone.utc) + timedelta(hours=2), is_active=True)
+    subscription_id = row.id
+
+    assert renew_subscriptions(client)['failed'] == 1
+    # Within the retry interval the scheduler does not push again
+    assert renew_subscriptions(client)['failed'] == 0
+    assert client.pushes == 1
+
+    db.session.get(ClubSubscription, subscription_id).payment_requested_at = (
+        datetime.now(timezone.utc) - timedelta(hours=7))
+    db.session.commit()
+    assert renew_subscriptions(client)['failed'] == 1
+
+    db.session.get(ClubSubscription, subscription_id).payment_requested_at = (
+        datetime.now(timezone.utc) - timedelta(hours=7))
+    db.session.commit()
+    assert renew_subscriptions(client)['failed'] == 0
+    assert client.pushes == 2
+    assert db.session.get(ClubSubscription, subscription_id).renewal_attempts == 2
+
+
+def test_renewals_shed_by_the_breaker_are_not_attempts_and_stop_the_run(app):
+    client = UnavailableClient()
+    due = datetime.now(timezone.utc) + timedelta(hours=2)
+    ids = [subscription(member(f'member{i}'), expires_at=due, is_active=True).id for i in range(3)]
+
+    summary = renew_subscriptions(client, batch_size=2, concurrency=1)
+
+    assert summary == {'expired': 0, 'requested': 0, 'failed': 0, 'skipped': 2}
+    # The second batch is never pushed
+    assert client.pushes == 2
+    db.session.expire_all()
+    for subscription_id in ids:
+        row = db.session.get(ClubSubscription, subscription_id)
+        assert row.renewal_attempts == 0
+        assert row.payment_requested_at is None
+
+
+@pytest.mark.parametrize('renewal_period, total', [('weekly', 52.0), ('monthly', 220.0), ('yearly', 2676.0)])
+def test_each_period_is_charged_its_own_amount(app, renewal_period, total):
+    class AcceptingClient:
+        amounts = []
+
+        def stk_push(self, amount, **kwargs):
+            self.amounts.append(amount)
+            return {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_renewal'}
+
+    client = AcceptingClient()
+    subscription(member(), expires_at=datetime.now(timezone.utc) + timedelta(hours=2), is_active=True,
+                 renewal_period=renewal_period)
+
+    assert ClubSubscription.period_amounts(renewal_period)[2] == total
+    assert renew_subscriptions(client)['requested'] == 1
+    assert client.amounts == [total]
+
+
+def test_subscription_payment_is_rolled_back_when_payments_are_unavailable(app, monkeypatch):
+    from flask_jwt_extended import create_access_token
+    from payments import mpesa
+
+    def unavailable(**kwargs):
+        raise PaymentsUnavailable(retry_after=30)
+
+    monkeypatch.setattr(mpesa, 'stk_push', unavailable)
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER,
+                  club_access_code='CLUB01', club_name='Runners')
+    leader.set_password('Leader123')
+    db.session.add(leader)
+    user = member()
+    expires_at = datetime.now(timezone.utc) + timedelta(days=3)
+    existing = subscription(user, expires_at=expires_at, is_active=True, payment_status='completed',
+                            renewal_attempts=2)
+    existing_id = existing.id
+    newcomer_id = member('newcomer').id
+    db.session.commit()
+    client = app.test_client()
+
+    client.set_cookie('access_token', create_access_token(identity=user.id))
+    response = client.post('/api/payments/club-subscription',
+                           json={'phone_number': '254711111111', 'club_access_code': 'CLUB01', 'renewal_period': 'yearly'})
+    assert response.status_code == 503
+
+    client.set_cookie('access_token', create_access_token(identity=newcomer_id))
+    response = client.post('/api/payments/club-subscription',
+                           json={'phone_number': '254722222222', 'club_access_code': 'CLUB01'})
+    assert response.status_code == 503
+
+    db.session.expire_all()
+    row = db.session.get(ClubSubscription, existing_id)
+    assert (row.payment_status, row.renewal_attempts, row.renewal_period, row.total_amount) == ('completed', 2, 'monthly', 220.0)
+    assert row.payment_phone == '254700000000'
+    assert ClubSubscription.query.filter_by(user_id=newcomer_id).count() == 0
+
+
+def test_subscriptions_etag_changes_when_the_club_leader_changes(app):
+    from flask_jwt_extended import create_access_token
+    from club_codes import invalidate_club_codes
+
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER,
+                  club_access_code='CLUB01', club_name='Runners')
+    leader.set_password('Leader123')
+    db.session.add(leader)
+    user = member()
+    subscription(user, expires_at=datetime.now(timezone.utc) + timedelta(days=3), is_active=True)
+    client = app.test_client()
+    client.set_cookie('access_token', create_access_token(identity=user.id))
+
+    first = client.get('/api/user/subscriptions')
+    etag = first.headers['ETag']
+    assert client.get('/api/user/subscriptions', headers={'If-None-Match': etag}).status_code == 304
+
+    leader.club_name = 'Joggers'
+    invalidate_club_codes()
+    db.session.commit()
+
+    response = client.get('/api/user/subscriptions', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['subscriptions'][0]['club']['club_name'] == 'Joggers'
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta, timezone
+
+from events import parse_tiers
+from extension import db
+from models import Event, EventStatus, TicketTier, User, UserRole
+from reservations import allocate_seats
+
+
+def make_event(max_attendees, tier_capacity):
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER)
+    leader.set_password('Leader123')
+    db.session.add(leader)
+    db.session.flush()
+    event = Event(title='Launch', event_date=datetime.now(timezone.utc) + timedelta(days=7), ticket_price=100,
+                  max_attendees=max_attendees, status=EventStatus.APPROVED, leader_id=leader.id)
+    event.tiers = [TicketTier(name='regular', price=100, capacity=tier_capacity)]
+    db.session.add(event)
+    db.session.commit()
+    return event, event.tiers[0]
+
+
+def test_parse_tiers_rejects_zero_capacity():
+    tiers, error = parse_tiers([{'name': 'vip', 'price': 500, 'capacity': 0}])
+    assert tiers is None
+    assert 'at least 1' in error
+
+    tiers, error = parse_tiers([{'name': 'vip', 'price': 500, 'capacity': 1}, {'name': 'regular', 'price': 100}])
+    assert error is None
+    assert [tier.capacity for tier in tiers] == [1, None]
+
+
+def test_zero_capacity_tier_is_sold_out(app):
+    event, tier = make_event(max_attendees=None, tier_capacity=0)
+    assert tier.seats_available() == 0
+    assert not allocate_seats(event, tier=tier)
+    db.session.rollback()
+
+
+def test_zero_event_capacity_is_still_unbounded(app):
+    event, tier = make_event(max_attendees=0, tier_capacity=2)
+    assert allocate_seats(event, quantity=2, tier=tier)
+    assert not allocate_seats(event, tier=tier)
+    db.session.rollback()
+
+
+def leader_client(app, event):
+    from flask_jwt_extended import create_access_token
+
+    leader = db.session.get(User, event.leader_id)
+    leader.subscription_active = True
+    leader.subscription_expires_at = datetime.now(timezone.utc) + timedelta(days=30)
+    db.session.commit()
+    client = app.test_client()
+    client.set_cookie('access_token', create_access_token(identity=leader.id))
+    return client
+
+
+def tier_prices(event_id):
+    return {tier.name: tier.price for tier in TicketTier.query.filter_by(event_id=event_id)}
+
+
+def test_update_event_keeps_vip_tiers_in_step_with_their_prices(app):
+    event, _ = make_event(max_attendees=10, tier_capacity=None)
+    event_id = event.id
+    client = leader_client(app, event)
+
+    response = client.patch(f'/api/events/{event_id}', json={'vip_price': 500, 'vvip_price': 900})
+    assert response.status_code == 200
+    assert tier_prices(event_id) == {'regular': 100, 'vip': 500, 'vvip': 900}
+
+    response = client.patch(f'/api/events/{event_id}', json={'vip_price': 600, 'vvip_price': None})
+    assert response.status_code == 200
+    db.session.expire_all()
+    assert tier_prices(event_id) == {'regular': 100, 'vip': 600}
+    assert db.session.get(Event, event_id).vvip_price is None
+
+
+def test_update_event_rejects_max_attendees_below_seats_taken(app):
+    event, tier = make_event(max_attendees=10, tier_capacity=None)
+    event_id = event.id
+    assert allocate_seats(event, quantity=3, tier=tier)
+    db.session.commit()
+    client = leader_client(app, event)
+
+    response = client.patch(f'/api/events/{event_id}', json={'max_attendees': 2, 'title': 'Renamed'})
+    assert response.status_code == 400
+    assert '3 seats' in response.get_json()['error']
+    db.session.expire_all()
+    assert db.session.get(Event, event_id).max_attendees == 10
+    assert db.session.get(Event, event_id).title == 'Launch'
+
+    assert client.patch(f'/api/events/{event_id}', json={'max_attendees': 3}).status_code == 200
+    assert client.patch(f'/api/events/{event_id}', json={'max_attendees': 0}).status_code == 200
+    db.session.expire_all()
+    assert db.session.get(Event, event_id).max_attendees == 0
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from admission import issue_token
+from auth import signing_secret
+from extension import db
+from models import Event, EventStatus, User, UserRole, WaitingRoom
+
+
+@pytest.fixture
+def room(app):
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER)
+    leader.set_password('Leader123')
+    db.session.add(leader)
+    db.session.flush()
+    event = Event(title='Launch', event_date=datetime.now(timezone.utc) + timedelta(days=7), ticket_price=100,
+                  max_attendees=100, status=EventStatus.APPROVED, leader_id=leader.id)
+    db.session.add(event)
+    db.session.flush()
+    room = WaitingRoom(event_id=event.id, admit_rate=10, opens_at=datetime.now(timezone.utc))
+    db.session.add(room)
+    db.session.commit()
+    return room
+
+
+def member(username):
+    user = User(username=username, email=f'{username}@example.com')
+    user.set_password('Member123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def test_repeat_joins_return_the_same_place(room):
+    alice = member('alice')
+    token, place, admit_at, is_new = issue_token(room, alice.id)
+    db.session.commit()
+
+    for _ in range(3):
+        assert issue_token(room, alice.id) == (token, place, admit_at, False)
+        db.session.commit()
+
+    bob = member('bob')
+    _, bob_place, _, is_new = issue_token(room, bob.id)
+    db.session.commit()
+    assert is_new and bob_place == place + 1
+    assert db.session.get(WaitingRoom, room.event_id).issued == 2
+
+
+def test_expired_place_goes_to_the_back_of_the_queue(room, monkeypatch):
+    alice = member('alice')
+    issue_token(room, alice.id)
+    db.session.commit()
+
+    # With no admission window a place expires as soon as it is handed out
+    monkeypatch.setenv('ADMISSION_WINDOW_SECONDS', '0')
+    carol = member('carol')
+    token, place, _, _ = issue_token(room, carol.id)
+    db.session.commit()
+
+    again_token, again, _, is_new = issue_token(room, carol.id)
+    db.session.commit()
+    assert is_new and again == place + 1
+    assert again_token != token
+
+
+def test_startup_requires_admission_secret_outside_development(app, monkeypatch):
+    from app import create_app
+
+    monkeypatch.delenv('ADMISSION_SECRET')
+    monkeypatch.delenv('FLASK_ENV', raising=False)
+    with pytest.raises(ValueError, match='ADMISSION_SECRET'):
+        create_app()
+
+    monkeypatch.setenv('FLASK_ENV', 'development')
+    create_app()
+    # Local runs sign with a key derived from JWT_SECRET_KEY, never the key itself
+    assert signing_secret('ADMISSION_SECRET') != app.config['JWT_SECRET_KEY']
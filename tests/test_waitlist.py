@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from extension import db
+from models import Event, EventStatus, User, UserRole, WaitlistStatus
+from reservations import join_waitlist
+
+
+@pytest.fixture
+def event(app):
+    leader = User(username='leader', email='leader@example.com', role=UserRole.LEADER)
+    leader.set_password('Leader123')
+    db.session.add(leader)
+    db.session.flush()
+    event = Event(title='Launch', event_date=datetime.now(timezone.utc) + timedelta(days=7), ticket_price=100,
+                  max_attendees=1, seats_taken=1, status=EventStatus.APPROVED, leader_id=leader.id)
+    db.session.add(event)
+    db.session.commit()
+    return event
+
+
+@pytest.fixture
+def member(app):
+    user = User(username='member', email='member@example.com')
+    user.set_password('Member123')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def test_only_one_waiting_entry_per_user(event, member):
+    join_waitlist(event, member.id, '254700000000')
+    db.session.commit()
+
+    with pytest.raises(IntegrityError):
+        join_waitlist(event, member.id, '254700000000')
+    db.session.rollback()
+
+
+@pytest.mark.parametrize('status', [WaitlistStatus.PROMOTED, WaitlistStatus.SKIPPED])
+def test_user_can_rejoin_after_being_promoted_or_skipped(event, member, status):
+    first = join_waitlist(event, member.id, '254700000000')
+    first.status = status
+    db.session.commit()
+
+    again = join_waitlist(event, member.id, '254700000000')
+    db.session.commit()
+
+    assert again.status == WaitlistStatus.WAITING
+    assert again.position == first.position + 1
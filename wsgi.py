@@ -1,6 +1,17 @@
+"""
+WSGI entry point for gunicorn. Worker settings live in gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    GUNICORN_WORKER_CLASS=gthread GUNICORN_THREADS=16 gunicorn -c gunicorn.conf.py wsgi:app
+    GUNICORN_WORKER_CLASS=gevent GUNICORN_WORKER_CONNECTIONS=200 gunicorn -c gunicorn.conf.py wsgi:app
+
+Under gevent, gunicorn patches the standard library before it imports this
+module, so nothing may import the app earlier (no --preload).
+"""
+
 from app import create_app
 
 app = create_app()
 
 if __name__ == "__main__":
-    app.run()
\ No newline at end of file
+    app.run()